@@ -1,6 +1,52 @@
+import os
+import sys
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def serving():
+    """
+    Whether this process serves requests and should run the background
+    services: the runserver child (not its autoreloader parent) or a
+    server that loaded farmbot_api/wsgi.py or asgi.py, so migrate, test,
+    shell etc. never connect. The FARMBOT_START_SERVICES setting overrides
+    the guess.
+    """
+    runserver = len(sys.argv) > 1 and sys.argv[1] == 'runserver'
+    if runserver and os.environ.get('RUN_MAIN') != 'true' and '--noreload' not in sys.argv:
+        return False
+    configured = getattr(settings, 'FARMBOT_START_SERVICES', None)
+    if configured:
+        return configured.lower() not in ('0', 'false', 'no')
+    return runserver
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        if serving():
+            self.start_services()
+
+    def start_services(self, connect=True):
+        """Device connection, log sink, photo listener, telemetry rollups and image mirror"""
+        from farmlib.wrapper import add_log_listener, add_photo_listener, connect_bot, telemetry
+        from .logstore import log_sink
+        from .mirror import image_mirror
+        from .telemetry import telemetry_store
+        from .views import _save_sequence_photo
+
+        # Persist every device log (batched, off the MQTT thread)
+        add_log_listener(log_sink.submit)
+        # Photos taken by sequence steps land in the gallery like take-photo ones
+        add_photo_listener(_save_sequence_photo)
+        # Roll status telemetry up into 1s/1m/1h buckets in the background
+        telemetry_store.start(telemetry)
+        # Backfill Web App images uploaded while the server was down, then
+        # optionally keep mirroring every FARMBOT_IMAGE_SYNC_INTERVAL seconds
+        image_mirror.start_periodic(float(os.getenv('FARMBOT_IMAGE_SYNC_INTERVAL') or 0))
+        if connect:
+            threading.Thread(target=connect_bot, daemon=True).start()
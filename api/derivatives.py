@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import posixpath
+import threading
+
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from farmlib.photostore import photo_store
+from .models import Photo
+
+# Longest edge in pixels of each derivative, smallest first
+SIZES = {
+    'thumb': 160,
+    'medium': 640,
+}
+JPEG_QUALITY = 80
+
+
+def photo_file(photo):
+    """Absolute path of a photo's original"""
+    if os.path.isabs(photo.image_path):
+        return photo.image_path
+    return photo_store.path(photo.media_path)
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def derivative_name(original, digest, size):
+    """
+    <sha256>.jpg -> <sha256>.thumb.jpg (image_12.jpg -> image_12.<hash>.thumb.jpg
+    for photos stored before content addressing), next to the original
+    """
+    stem = os.path.splitext(os.path.basename(original))[0]
+    if stem == digest:
+        return f'{stem}.{size}.jpg'
+    return f'{stem}.{digest[:16]}.{size}.jpg'
+
+
+def make_derivatives(path, digest, sizes=SIZES):
+    """
+    Write every missing size of the image at `path` next to it. Files are
+    named by content hash, so an existing file is already up to date.
+    Returns ({size: {"file", "width", "height"}}, (width, height) of the original).
+    """
+    folder = os.path.dirname(path)
+    made = {}
+    with Image.open(path) as image:
+        original_size = image.size
+        # Let the JPEG decoder scale down by 1/2..1/8 while decoding
+        image.draft('RGB', (max(sizes.values()), max(sizes.values())))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        # Largest first, so each smaller size is resampled from the last one
+        for size, edge in sorted(sizes.items(), key=lambda item: -item[1]):
+            name = derivative_name(path, digest, size)
+            target = os.path.join(folder, name)
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            if not os.path.exists(target):
+                partial = target + '.part'
+                image.save(partial, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                os.replace(partial, target)
+            made[size] = {'file': name, 'width': image.width, 'height': image.height}
+    return made, original_size
+
+
+class DerivativePool:
+    """
+    Makes photo derivatives on a small thread pool (Pillow releases the
+    GIL while decoding, resizing and encoding). The content hash, original
+    size and derivative files are recorded in Photo.meta_data, so a photo
+    is only processed once per distinct original.
+    """
+
+    def __init__(self, workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='derivatives')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, photo_id):
+        """Queue a photo; returns the future already running for it, if any"""
+        with self._lock:
+            future = self._pending.get(photo_id)
+            if future is None:
+                future = self.executor.submit(self._process, photo_id)
+                self._pending[photo_id] = future
+                future.add_done_callback(lambda _f: self._done(photo_id))
+            return future
+
+    def ensure(self, photo, timeout=30):
+        """Derivatives of `photo`, made now (on the pool) if missing"""
+        if ready(photo):
+            return photo.meta_data['derivatives']
+        return self.submit(photo.id).result(timeout)
+
+    def _done(self, photo_id):
+        with self._lock:
+            self._pending.pop(photo_id, None)
+
+    def _process(self, photo_id):
+        close_old_connections()
+        try:
+            photo = Photo.objects.get(pk=photo_id)
+            # A duplicate capture shares its original, so reuse what was made for it
+            twin = next((
+                other for other in Photo.objects.filter(image_path=photo.image_path).exclude(pk=photo_id)
+                if ready(other)
+            ), None)
+            if twin is not None:
+                meta = dict(photo.meta_data, **{
+                    key: twin.meta_data[key] for key in ('sha256', 'width', 'height', 'derivatives')
+                })
+                Photo.objects.filter(pk=photo_id).update(meta_data=meta)
+                return meta['derivatives']
+            path = photo_file(photo)
+            digest = photo.meta_data.get('sha256') or content_hash(path)
+            made, (width, height) = make_derivatives(path, digest)
+            # Files are recorded relative to farm_images/, like Photo.media_path
+            folder = posixpath.dirname(photo.media_path)
+            derivatives = {
+                size: dict(info, file=posixpath.join(folder, info['file']))
+                for size, info in made.items()
+            }
+            meta = dict(photo.meta_data, sha256=digest, width=width, height=height,
+                        derivatives=derivatives)
+            Photo.objects.filter(pk=photo_id).update(meta_data=meta)
+            return derivatives
+        except Exception as e:
+            print(f"Failed to make derivatives of photo {photo_id}: {e}")
+            raise
+        finally:
+            close_old_connections()
+
+
+def ready(photo):
+    derivatives = photo.meta_data.get('derivatives') or {}
+    return all(size in derivatives for size in SIZES)
+
+
+derivative_pool = DerivativePool()
@@ -0,0 +1,104 @@
+import queue
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .models import DeviceLog
+
+
+def log_to_row(log):
+    """Turn a device log payload into an unsaved DeviceLog"""
+    if not isinstance(log, dict):
+        return DeviceLog(message=str(log))
+    created_at = log.get('created_at')
+    if isinstance(created_at, (int, float)):
+        created_at = datetime.fromtimestamp(created_at, tz=dt_timezone.utc)
+    else:
+        created_at = datetime.now(tz=dt_timezone.utc)
+    known = ('message', 'type', 'verbosity', 'created_at', 'x', 'y', 'z')
+    return DeviceLog(
+        message=log.get('message') or '',
+        type=log.get('type') or '',
+        verbosity=log.get('verbosity'),
+        created_at=created_at,
+        x=log.get('x'),
+        y=log.get('y'),
+        z=log.get('z'),
+        meta_data={k: v for k, v in log.items() if k not in known},
+    )
+
+
+class LogSink:
+    """
+    Persists device logs without touching the database on the MQTT thread.
+    submit() only enqueues; a background thread drains the queue and writes
+    everything it has in one bulk_create per transaction, at most every
+    `flush_interval` seconds or as soon as `batch_size` logs are waiting.
+    """
+
+    def __init__(self, batch_size=200, flush_interval=1.0, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, log):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(log)
+        except queue.Full:
+            # Never block the MQTT thread on a slow disk
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-sink', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.flush(batch)
+            except Exception as e:
+                print(f"Failed to store {len(batch)} device logs: {e}")
+
+    def flush(self, logs):
+        close_old_connections()
+        rows = [log_to_row(log) for log in logs]
+        with transaction.atomic():
+            DeviceLog.objects.bulk_create(rows, batch_size=self.batch_size)
+
+
+def search_logs(queryset, text):
+    """Filter a DeviceLog queryset by full-text match on the message"""
+    if connection.vendor == 'sqlite':
+        # Quote every word so user input can't break FTS5 query syntax
+        terms = ' '.join('"%s"' % word.replace('"', '""') for word in text.split())
+        if not terms:
+            return queryset
+        return queryset.filter(id__in=RawSQL(
+            'SELECT rowid FROM api_devicelog_fts WHERE api_devicelog_fts MATCH %s',
+            [terms]
+        ))
+    return queryset.filter(message__icontains=text)
+
+
+log_sink = LogSink()
@@ -0,0 +1,138 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from farmlib.photostore import photo_store
+
+# Names that embed a content hash (originals and derivatives) never change
+HASHED_NAME = re.compile(r'(^|[./])[0-9a-f]{16,64}([./]|$)')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _etag(path, stat):
+    name = os.path.basename(path)
+    match = re.match(r'^([0-9a-f]{64})\.', name)
+    if match:
+        return quote_etag(match.group(1))
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return since is not None and int(mtime) <= since
+
+
+def _byte_range(request, etag, mtime, size):
+    """
+    (start, stop) for a satisfiable single `Range: bytes=` request, None to
+    send the whole file, or False when the range cannot be satisfied.
+    """
+    header = request.headers.get('Range')
+    if not header or size == 0:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        return None
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # Multiple or malformed ranges: ignore, as allowed
+    first, last = match.groups()
+    if first == '':
+        start, stop = max(0, size - int(last)), size
+    else:
+        start = int(first)
+        stop = min(size, int(last) + 1) if last else size
+    if start >= size or start >= stop:
+        return False
+    return start, stop
+
+
+def _read_range(f, start, length, block=1 << 16):
+    f.seek(start)
+    while length > 0:
+        chunk = f.read(min(block, length))
+        if not chunk:
+            break
+        length -= len(chunk)
+        yield chunk
+    f.close()
+
+
+def serve_file(request, root, path, accel_redirect=None):
+    """
+    Serve a file under `root` for GET/HEAD with ETag / Last-Modified
+    validation (304), single byte ranges (206) and Cache-Control: names
+    carrying a content hash are cached for a year as immutable, anything
+    else must be revalidated.
+
+    The body goes out through FileResponse, i.e. the server's
+    wsgi.file_wrapper (sendfile where available). With `accel_redirect`
+    (an internal nginx location for `root`, e.g. "/protected/farm_images/"),
+    only headers are produced and nginx sends the file via X-Accel-Redirect.
+    """
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404("Not found")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("Not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Not found")
+
+    etag = _etag(full_path, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE if HASHED_NAME.search(path) else REVALIDATE,
+        'Accept-Ranges': 'bytes',
+    }
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    if accel_redirect:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_redirect.rstrip('/') + '/' + path.lstrip('/')
+    else:
+        byte_range = _byte_range(request, etag, stat.st_mtime, stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        f = open(full_path, 'rb')
+        if byte_range is None:
+            response = FileResponse(f, content_type=content_type)
+        else:
+            start, stop = byte_range
+            response = FileResponse(_read_range(f, start, stop - start), status=206,
+                                    content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{stop - 1}/{stat.st_size}'
+            response['Content-Length'] = str(stop - start)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def farm_images_root():
+    return photo_store.root
+
+
+def serve_farm_image(request, path):
+    return serve_file(request, farm_images_root(), path,
+                      getattr(settings, 'FARM_IMAGES_ACCEL_REDIRECT', None))
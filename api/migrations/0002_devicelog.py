@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+FTS_SQL = [
+    "CREATE VIRTUAL TABLE api_devicelog_fts USING fts5("
+    "message, content='api_devicelog', content_rowid='id')",
+    "CREATE TRIGGER api_devicelog_fts_ai AFTER INSERT ON api_devicelog BEGIN "
+    "INSERT INTO api_devicelog_fts(rowid, message) VALUES (new.id, new.message); END",
+    "CREATE TRIGGER api_devicelog_fts_ad AFTER DELETE ON api_devicelog BEGIN "
+    "INSERT INTO api_devicelog_fts(api_devicelog_fts, rowid, message) "
+    "VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER api_devicelog_fts_au AFTER UPDATE ON api_devicelog BEGIN "
+    "INSERT INTO api_devicelog_fts(api_devicelog_fts, rowid, message) "
+    "VALUES ('delete', old.id, old.message); "
+    "INSERT INTO api_devicelog_fts(rowid, message) VALUES (new.id, new.message); END",
+]
+
+DROP_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS api_devicelog_fts_au",
+    "DROP TRIGGER IF EXISTS api_devicelog_fts_ad",
+    "DROP TRIGGER IF EXISTS api_devicelog_fts_ai",
+    "DROP TABLE IF EXISTS api_devicelog_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    # Full-text search on log messages is SQLite FTS5 only; other
+    # databases fall back to icontains in the view.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField()),
+                ('type', models.CharField(blank=True, default='', max_length=20)),
+                ('verbosity', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('x', models.FloatField(blank=True, null=True)),
+                ('y', models.FloatField(blank=True, null=True)),
+                ('z', models.FloatField(blank=True, null=True)),
+                ('meta_data', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['created_at', 'id'], name='devicelog_time_idx'), models.Index(fields=['type', 'created_at'], name='devicelog_type_time_idx'), models.Index(fields=['verbosity', 'created_at'], name='devicelog_verbosity_time_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
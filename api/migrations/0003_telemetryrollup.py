@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_devicelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('data', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['resolution', 'bucket'],
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'bucket'), name='telemetry_resolution_bucket_uniq')],
+            },
+        ),
+    ]
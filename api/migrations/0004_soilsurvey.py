@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_telemetryrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SoilSurvey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(default='running', max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('z', models.FloatField(blank=True, null=True)),
+                ('bounds', models.JSONField(default=list)),
+                ('points', models.JSONField(default=list)),
+                ('readings', models.JSONField(default=list)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,180 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+
+from django.db import close_old_connections
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from farmlib import wrapper
+from farmlib.httpclient import web_client
+from farmlib.photostore import photo_store
+from .models import Photo
+from .mosaic import mosaic, footprint
+
+BATCH_SIZE = 200
+
+
+def _coordinates(record):
+    meta = record.get('meta') or {}
+    return {axis: meta[axis] for axis in ('x', 'y', 'z') if meta.get(axis) is not None}
+
+
+class ImageMirror:
+    """
+    Copies FarmBot Web App images into Photo rows and farm_images/, e.g.
+    to backfill pictures uploaded while this server was down.
+
+    The high-water mark is the highest farmbot_id already stored: an
+    incremental sync only downloads newer records (plus any that failed
+    last time), a full sync every record not stored yet. Attachments are
+    downloaded `workers` at a time over the shared keep-alive client and rows
+    are written with bulk_create.
+    """
+
+    def __init__(self, workers=8):
+        self.workers = workers
+        self.running = False
+        self.last_result = None
+        self._failed = set()
+        self._lock = threading.Lock()
+
+    def start(self, full=False):
+        """Run sync() on a background thread; False if one is already running"""
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+        threading.Thread(target=self._run, args=(full,), name='image-mirror', daemon=True).start()
+        return True
+
+    def _run(self, full):
+        try:
+            self._sync(full)
+        except Exception as e:
+            print(f"Image sync failed: {e}")
+        finally:
+            close_old_connections()
+
+    def start_periodic(self, interval):
+        """Sync once the bot is connected, then every `interval` seconds (0: only once)"""
+        def loop():
+            wrapper.connection_event.wait()
+            while True:
+                self.start()
+                if not interval:
+                    return
+                time.sleep(interval)
+        threading.Thread(target=loop, name='image-mirror-schedule', daemon=True).start()
+
+    def sync(self, full=False):
+        """Sync on this thread and return the result; RuntimeError if one is running"""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("Image sync already running")
+            self.running = True
+        return self._sync(full)
+
+    def _sync(self, full):
+        started = time.monotonic()
+        result = {'full': full, 'started_at': timezone.now().isoformat(), 'listed': 0,
+                  'new': 0, 'created': 0, 'duplicates': 0, 'failed': 0}
+        self.last_result = dict(result, status='running')
+        try:
+            records = self._list()
+            result['listed'] = len(records)
+            wanted = self._wanted(records, full)
+            result['new'] = len(wanted)
+            rows = []
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-mirror') as pool:
+                futures = {pool.submit(self._download, record): record for record in wanted}
+                for future in as_completed(futures):
+                    record = futures[future]
+                    try:
+                        stored = future.result()
+                    except Exception as e:
+                        print(f"Failed to mirror image {record.get('id')}: {e}")
+                        self._failed.add(record['id'])
+                        result['failed'] += 1
+                        continue
+                    self._failed.discard(record['id'])
+                    result['duplicates'] += stored['duplicate']
+                    rows.append(self._row(record, stored))
+                    if len(rows) >= BATCH_SIZE:
+                        result['created'] += self._save(rows)
+                        rows = []
+            result['created'] += self._save(rows)
+            result['status'] = 'ok'
+        except Exception as e:
+            result.update(status='error', error=str(e))
+            raise
+        finally:
+            result['seconds'] = round(time.monotonic() - started, 2)
+            result['high_water_mark'] = Photo.objects.aggregate(mark=Max('farmbot_id'))['mark']
+            self.last_result = result
+            self.running = False
+        return result
+
+    def _list(self):
+        if not (wrapper.api_server and wrapper.bot_token):
+            raise RuntimeError("Bot not connected")
+        resp = web_client.get(
+            f"{wrapper.api_server}/api/images",
+            headers={"Authorization": f"Bearer {wrapper.bot_token}"},
+            timeout=30
+        )
+        resp.raise_for_status()
+        return [r for r in resp.json() if r.get('id') is not None and (r.get('attachment_url') or r.get('url'))]
+
+    def _wanted(self, records, full):
+        """Records to download, oldest first"""
+        if full:
+            candidates = records
+        else:
+            mark = Photo.objects.aggregate(mark=Max('farmbot_id'))['mark'] or 0
+            candidates = [r for r in records if r['id'] > mark or r['id'] in self._failed]
+        ids = [r['id'] for r in candidates]
+        stored = set()
+        for i in range(0, len(ids), 500):
+            stored.update(Photo.objects.filter(farmbot_id__in=ids[i:i + 500]).values_list('farmbot_id', flat=True))
+        return sorted((r for r in candidates if r['id'] not in stored), key=lambda r: r['id'])
+
+    def _download(self, record):
+        url = record.get('attachment_url') or record.get('url')
+        with web_client.get(url, timeout=60, stream=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+            if not content_type.startswith('image/'):
+                raise ValueError(f"Not an image: {content_type}")
+            return photo_store.save(response.iter_content(chunk_size=1 << 16), content_type)
+
+    def _row(self, record, stored):
+        created_at = parse_datetime(record.get('created_at') or '') or timezone.now()
+        return Photo(
+            image_path=stored['path'],
+            farmbot_id=record['id'],
+            created_at=created_at,
+            coordinates=_coordinates(record),
+            meta_data={
+                'content_type': stored['content_type'],
+                'source': 'farmbot_web_app',
+                'sha256': stored['sha256'],
+                'size': stored['size'],
+                'mirrored': True
+            }
+        )
+
+    def _save(self, rows):
+        """Insert a batch (skipping ids take_photo stored meanwhile); returns rows written"""
+        if not rows:
+            return 0
+        ids = [row.farmbot_id for row in rows]
+        before = Photo.objects.filter(farmbot_id__in=ids).count()
+        Photo.objects.bulk_create(rows, ignore_conflicts=True)
+        # Derivatives are made on demand by the photo-derivative endpoint
+        mosaic.update(*(footprint(row.coordinates) for row in rows))
+        return Photo.objects.filter(farmbot_id__in=ids).count() - before
+
+
+image_mirror = ImageMirror()
@@ -4,14 +4,17 @@ from django.utils import timezone
 import os
 
 class Photo(models.Model):
-    image_path = models.CharField(max_length=255)  # Path to the image file
+    image_path = models.CharField(max_length=255)  # Path to the image file, relative to farm_images/
     farmbot_id = models.IntegerField(unique=True)  # FarmBot's image ID
     created_at = models.DateTimeField(default=timezone.now)
     coordinates = models.JSONField(default=dict, blank=True)  # X,Y,Z coordinates where photo was taken
     meta_data = models.JSONField(default=dict, blank=True)  # Additional metadata
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='photo_time_idx'),
+        ]
 
     def __str__(self):
         return f'Photo {self.farmbot_id} - {self.created_at}'
@@ -20,6 +23,15 @@ class Photo(models.Model):
     def filename(self):
         return os.path.basename(self.image_path)
 
+    @property
+    def media_path(self):
+        """
+        Path under farm_images/, as served at /farm_images/<media_path>
+        (rows from before the store kept the farm_images/ prefix)
+        """
+        path = self.image_path.replace(os.sep, '/')
+        return path.split('farm_images/', 1)[-1]
+
 class Sequence(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
@@ -38,3 +50,58 @@ class Step(models.Model):
 
     def __str__(self):
         return f'{self.sequence.name} - Step {self.order} - {self.command}'
+
+class DeviceLog(models.Model):
+    """A log message published by the device on bot/<device>/logs"""
+    message = models.TextField()
+    type = models.CharField(max_length=20, blank=True, default='')  # info, success, warn, error, busy, debug, fun...
+    verbosity = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)  # When the device logged it
+    x = models.FloatField(null=True, blank=True)
+    y = models.FloatField(null=True, blank=True)
+    z = models.FloatField(null=True, blank=True)
+    meta_data = models.JSONField(default=dict, blank=True)  # channels, meta and any other fields
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='devicelog_time_idx'),
+            models.Index(fields=['type', 'created_at'], name='devicelog_type_time_idx'),
+            models.Index(fields=['verbosity', 'created_at'], name='devicelog_verbosity_time_idx'),
+        ]
+
+    def __str__(self):
+        return f'[{self.type}] {self.message[:50]}'
+
+class TelemetryRollup(models.Model):
+    """Status telemetry (position, load, encoders, pins) aggregated over one time bucket"""
+    resolution = models.PositiveIntegerField()  # Bucket width in seconds: 1, 60 or 3600
+    bucket = models.DateTimeField()  # Start of the bucket
+    samples = models.PositiveIntegerField(default=0)  # Status messages that fell in the bucket
+    data = models.JSONField(default=dict)  # {column: [count, sum, min, max]}
+
+    class Meta:
+        ordering = ['resolution', 'bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['resolution', 'bucket'], name='telemetry_resolution_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f'Telemetry {self.resolution}s @ {self.bucket}'
+
+class SoilSurvey(models.Model):
+    """Soil sensor readings taken over a set of points, and the moisture map built from them"""
+    status = models.CharField(max_length=20, default='running')  # running, ok, stopped, error
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    z = models.FloatField(null=True, blank=True)  # Sensor depth (None = current height)
+    bounds = models.JSONField(default=list)  # [x_min, x_max, y_min, y_max] of the map
+    points = models.JSONField(default=list)  # [[x, y], ...] to visit
+    readings = models.JSONField(default=list)  # [{"x", "y", "z", "raw_value", "moisture"}, ...]
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f'Soil survey {self.id} ({self.status}) - {self.created_at}'
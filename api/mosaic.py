@@ -0,0 +1,293 @@
+from collections import OrderedDict
+import io
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from .derivatives import photo_file
+from .models import Photo
+
+TILE = 256
+# Garden and photo footprint in mm, as drawn by the frontend map
+# (GRID_WIDTH/GRID_HEIGHT and IMAGE_WIDTH_UNITS/IMAGE_HEIGHT_UNITS)
+GARDEN = (2900, 1200)
+FOOTPRINT = (500, 300)
+# Deepest zoom is 1 px per mm; every level above halves that, down to
+# zoom 0 where the whole garden fits in one tile
+MAX_ZOOM = math.ceil(math.log2(max(GARDEN) / TILE))
+FORMATS = {'png': 'PNG', 'webp': 'WEBP'}
+MAX_CACHED_PHOTOS = 32
+
+
+def tiles_root():
+    return os.path.join(settings.BASE_DIR, 'farm_tiles')
+
+
+def tile_path(z, x, y, ext='png'):
+    return os.path.join(tiles_root(), str(z), str(x), f'{y}.{ext}')
+
+
+def grid_size(z):
+    """Number of (columns, rows) of tiles at zoom `z`"""
+    scale = 2.0 ** (z - MAX_ZOOM)
+    return (math.ceil(GARDEN[0] * scale / TILE), math.ceil(GARDEN[1] * scale / TILE))
+
+
+def footprint(coordinates):
+    """(left, top, right, bottom) in mm of a photo centred at its x, y; None without them"""
+    x, y = (coordinates or {}).get('x'), (coordinates or {}).get('y')
+    if x is None or y is None:
+        return None
+    w, h = FOOTPRINT
+    return (x - w / 2.0, y - h / 2.0, x + w / 2.0, y + h / 2.0)
+
+
+def tiles_covering(rect):
+    """Deepest-zoom tiles (x, y) a footprint touches"""
+    columns, rows = grid_size(MAX_ZOOM)
+    left, top, right, bottom = rect
+    xs = range(max(0, int(left // TILE)), min(columns, int(math.ceil(right / TILE))))
+    ys = range(max(0, int(top // TILE)), min(rows, int(math.ceil(bottom / TILE))))
+    return {(x, y) for x in xs for y in ys}
+
+
+def feather(height, width):
+    """Blend weights that fall off towards the edges of a photo (never 0)"""
+    ys = np.minimum(np.arange(height), np.arange(height)[::-1]) + 1.0
+    xs = np.minimum(np.arange(width), np.arange(width)[::-1]) + 1.0
+    return np.minimum.outer(ys / ys.max(), xs / xs.max()).astype(np.float32)
+
+
+def encode(rgba, fmt='png'):
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(buffer, FORMATS[fmt], optimize=True)
+    return buffer.getvalue()
+
+
+_blank = {}
+
+
+def blank_tile(fmt='png'):
+    """A fully transparent tile, for parts of the garden no photo covers"""
+    if fmt not in _blank:
+        _blank[fmt] = encode(np.zeros((TILE, TILE, 4), dtype=np.uint8), fmt)
+    return _blank[fmt]
+
+
+class MosaicBuilder:
+    """
+    Places photos by the XY they were taken at into a garden-sized canvas
+    and keeps it as a z/x/y tile pyramid on disk (farm_tiles/). Overlapping
+    photos are feather-blended with NumPy.
+
+    Updates are incremental: update() queues the footprints of new, moved
+    or deleted photos, and a background thread re-renders only the deepest
+    zoom tiles they touch, then each ancestor from its four children.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.version = 0
+        self.updated_at = None
+        self._photos = OrderedDict()  # photo id -> (rgb, weight) at 1 px/mm
+        self._thread = None
+        self._lock = threading.Lock()
+        self._load_state()
+
+    def update(self, *rects):
+        """Queue footprints (see footprint()) whose tiles must be redrawn"""
+        self._ensure_started()
+        for rect in rects:
+            if rect is not None:
+                self.queue.put(rect)
+
+    def update_photo(self, photo):
+        self.update(footprint(photo.coordinates))
+
+    def rebuild(self):
+        """Redraw every tile from scratch"""
+        self.update((0, 0) + GARDEN)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='mosaic', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            dirty = tiles_covering(self.queue.get())
+            # Coalesce everything else already waiting into one pass
+            while True:
+                try:
+                    dirty |= tiles_covering(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                close_old_connections()
+                self.render(dirty)
+            except Exception as e:
+                print(f"Failed to update mosaic: {e}")
+            finally:
+                close_old_connections()
+
+    def render(self, dirty):
+        """Redraw the given deepest-zoom tiles and all their ancestors"""
+        started = time.monotonic()
+        photos = [
+            (photo, footprint(photo.coordinates))
+            for photo in Photo.objects.order_by('created_at', 'id')
+        ]
+        photos = [(photo, rect) for photo, rect in photos if rect is not None]
+        for x, y in dirty:
+            self._render_leaf(x, y, photos)
+        for z in range(MAX_ZOOM - 1, -1, -1):
+            dirty = {(x // 2, y // 2) for x, y in dirty}
+            for x, y in dirty:
+                self._render_parent(z, x, y)
+        self.version += 1
+        self.updated_at = time.time()
+        self._save_state(len(photos))
+        print(f"Mosaic updated in {time.monotonic() - started:.2f}s")
+
+    def _photo_pixels(self, photo):
+        """Photo scaled to its footprint at 1 px/mm, plus its blend weights"""
+        cached = self._photos.get(photo.id)
+        if cached is not None:
+            self._photos.move_to_end(photo.id)
+            return cached
+        size = FOOTPRINT
+        with Image.open(photo_file(photo)) as image:
+            image.draft('RGB', size)
+            image = ImageOps.exif_transpose(image).convert('RGB').resize(size, Image.BILINEAR)
+        rgb = np.asarray(image, dtype=np.float32)
+        pixels = (rgb, feather(size[1], size[0]))
+        self._photos[photo.id] = pixels
+        while len(self._photos) > MAX_CACHED_PHOTOS:
+            self._photos.popitem(last=False)
+        return pixels
+
+    def _render_leaf(self, x, y, photos):
+        left, top = x * TILE, y * TILE
+        acc = np.zeros((TILE, TILE, 3), dtype=np.float32)
+        total = np.zeros((TILE, TILE), dtype=np.float32)
+        for photo, rect in photos:
+            # Overlap of tile and footprint, in garden mm (= px at this zoom)
+            p_left, p_top = int(round(rect[0])), int(round(rect[1]))
+            x0, x1 = max(left, p_left), min(left + TILE, p_left + FOOTPRINT[0])
+            y0, y1 = max(top, p_top), min(top + TILE, p_top + FOOTPRINT[1])
+            if x0 >= x1 or y0 >= y1:
+                continue
+            try:
+                rgb, weight = self._photo_pixels(photo)
+            except OSError as e:
+                print(f"Mosaic skipped photo {photo.id}: {e}")
+                continue
+            sx, sy = x0 - p_left, y0 - p_top
+            src = (slice(sy, sy + y1 - y0), slice(sx, sx + x1 - x0))
+            dst = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+            w = weight[src]
+            acc[dst] += rgb[src] * w[..., None]
+            total[dst] += w
+        covered = total > 0
+        rgba = np.zeros((TILE, TILE, 4), dtype=np.uint8)
+        rgba[covered, :3] = np.clip(acc[covered] / total[covered, None], 0, 255).astype(np.uint8)
+        rgba[covered, 3] = 255
+        self._write(MAX_ZOOM, x, y, rgba if covered.any() else None)
+
+    def _render_parent(self, z, x, y):
+        """Downsample the four children 2x, averaging colour over covered pixels only"""
+        canvas = np.zeros((TILE * 2, TILE * 2, 4), dtype=np.float32)
+        for dy in (0, 1):
+            for dx in (0, 1):
+                path = tile_path(z + 1, 2 * x + dx, 2 * y + dy)
+                if os.path.exists(path):
+                    with Image.open(path) as child:
+                        canvas[dy * TILE:(dy + 1) * TILE, dx * TILE:(dx + 1) * TILE] = np.asarray(child.convert('RGBA'))
+        if not canvas[..., 3].any():
+            self._write(z, x, y, None)
+            return
+        alpha = canvas[..., 3:] / 255.0
+        blocks = (canvas[..., :3] * alpha).reshape(TILE, 2, TILE, 2, 3).sum(axis=(1, 3))
+        coverage = alpha.reshape(TILE, 2, TILE, 2, 1).sum(axis=(1, 3))
+        rgba = np.zeros((TILE, TILE, 4), dtype=np.uint8)
+        rgb = np.divide(blocks, coverage, out=np.zeros_like(blocks), where=coverage > 0)
+        rgba[..., :3] = np.clip(rgb, 0, 255).astype(np.uint8)
+        rgba[..., 3] = np.clip(coverage[..., 0] / 4.0 * 255, 0, 255).astype(np.uint8)
+        self._write(z, x, y, rgba)
+
+    def _write(self, z, x, y, rgba):
+        """Replace a tile (None removes it); other formats are re-encoded on demand"""
+        for ext in FORMATS:
+            path = tile_path(z, x, y, ext)
+            if os.path.exists(path):
+                os.remove(path)
+        if rgba is None:
+            return
+        path = tile_path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = path + '.part'
+        with open(partial, 'wb') as f:
+            f.write(encode(rgba))
+        os.replace(partial, path)
+
+    def tile(self, z, x, y, fmt='png'):
+        """Path of a tile in `fmt`, encoding it from the PNG if needed; None if empty"""
+        path = tile_path(z, x, y, fmt)
+        if fmt != 'png' and not os.path.exists(path):
+            source = tile_path(z, x, y)
+            if not os.path.exists(source):
+                return None
+            with Image.open(source) as image:
+                data = encode(np.asarray(image.convert('RGBA')), fmt)
+            partial = f'{path}.{threading.get_ident()}.part'
+            with open(partial, 'wb') as f:
+                f.write(data)
+            os.replace(partial, path)
+        return path if os.path.exists(path) else None
+
+    def _state_file(self):
+        return os.path.join(tiles_root(), 'mosaic.json')
+
+    def _load_state(self):
+        try:
+            with open(self._state_file()) as f:
+                state = json.load(f)
+            self.version = state.get('version', 0)
+            self.updated_at = state.get('updated_at')
+        except (OSError, ValueError):
+            pass
+
+    def _save_state(self, photos):
+        os.makedirs(tiles_root(), exist_ok=True)
+        with open(self._state_file(), 'w') as f:
+            json.dump({'version': self.version, 'updated_at': self.updated_at, 'photos': photos}, f)
+
+    def describe(self):
+        """What a map client needs to lay the tiles out"""
+        return {
+            'tile_size': TILE,
+            'min_zoom': 0,
+            'max_zoom': MAX_ZOOM,
+            # Garden mm per tile pixel at each zoom is 2 ** (max_zoom - z)
+            'garden': {'width': GARDEN[0], 'height': GARDEN[1]},
+            'photo_footprint': {'width': FOOTPRINT[0], 'height': FOOTPRINT[1]},
+            'grid': {z: grid_size(z) for z in range(MAX_ZOOM + 1)},
+            'formats': list(FORMATS),
+            'version': self.version,
+            'updated_at': self.updated_at,
+            'pending': not self.queue.empty(),
+        }
+
+
+mosaic = MosaicBuilder()
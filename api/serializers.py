@@ -1,20 +1,54 @@
 from rest_framework import serializers
 from django.urls import reverse
-from .models import Sequence, Step, Photo
+from .models import Sequence, Step, Photo, DeviceLog, SoilSurvey
+from .derivatives import SIZES as DERIVATIVE_SIZES
 
 class PhotoModelSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Photo
-        fields = ['id', 'farmbot_id', 'created_at', 'coordinates', 'meta_data', 'url']
+        fields = ['id', 'farmbot_id', 'created_at', 'coordinates', 'meta_data', 'url', 'thumbnail_url', 'srcset']
         read_only_fields = ['created_at']
     
+    def _absolute(self, path):
+        # Resolve scheme and host once per request rather than per URL
+        base = getattr(self, '_url_base', None)
+        if base is None:
+            request = self.context.get('request')
+            base = self._url_base = request.build_absolute_uri('/')[:-1] if request else ''
+        return base + path
+
     def get_url(self, obj):
-        request = self.context.get('request')
-        if request:
-            return request.build_absolute_uri(f'/farm_images/{obj.filename}')
-        return f'/farm_images/{obj.filename}'
+        return self._absolute(f'/farm_images/{obj.media_path}')
+
+    def _derivative_url(self, obj, size):
+        """Static file once made; until then the endpoint that makes it on demand"""
+        derivative = (obj.meta_data.get('derivatives') or {}).get(size)
+        if derivative:
+            return self._absolute(f'/farm_images/{derivative["file"]}')
+        return self._absolute(reverse('photo-derivative', args=[obj.id, size]))
+
+    def get_thumbnail_url(self, obj):
+        return self._derivative_url(obj, 'thumb')
+
+    def get_srcset(self, obj):
+        """`srcset` attribute value: every derivative plus the original, by width"""
+        derivatives = obj.meta_data.get('derivatives') or {}
+        candidates = []
+        for size, edge in DERIVATIVE_SIZES.items():
+            width = derivatives.get(size, {}).get('width', edge)
+            candidates.append(f'{self._derivative_url(obj, size)} {width}w')
+        if obj.meta_data.get('width'):
+            candidates.append(f'{self.get_url(obj)} {obj.meta_data["width"]}w')
+        return ', '.join(candidates)
+
+class DeviceLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeviceLog
+        fields = ['id', 'message', 'type', 'verbosity', 'created_at', 'x', 'y', 'z', 'meta_data']
 
 class PositionSerializer(serializers.Serializer):
     x = serializers.FloatField(required=True)
@@ -22,6 +56,9 @@ class PositionSerializer(serializers.Serializer):
     z = serializers.FloatField(required=True)
     speed = serializers.IntegerField(required=False)
 
+class MoveAbsoluteSerializer(PositionSerializer):
+    wait = serializers.BooleanField(required=False, default=False)
+
 class ServoAngleSerializer(serializers.Serializer):
     pin = serializers.IntegerField(required=True)
     angle = serializers.IntegerField(required=True)
@@ -40,6 +77,18 @@ class WateringSerializer(serializers.Serializer):
     y = serializers.IntegerField(required=False, default=600)
     z = serializers.IntegerField(required=False, default=-340)
 
+class PlantPointSerializer(serializers.Serializer):
+    x = serializers.FloatField(required=True)
+    y = serializers.FloatField(required=True)
+    z = serializers.FloatField(required=False, allow_null=True, default=None)
+
+class WaterPlantsSerializer(serializers.Serializer):
+    plants = PlantPointSerializer(many=True, allow_empty=False, max_length=1000)
+    z = serializers.FloatField(required=False, default=-340)
+    water_ms = serializers.IntegerField(required=False, default=5000, min_value=0)
+    optimize = serializers.BooleanField(required=False, default=True)
+    wait = serializers.BooleanField(required=False, default=False)
+
 class DispensingSerializer(serializers.Serializer):
     milliliters = serializers.FloatField(required=True, min_value=0.1)
     tool_name = serializers.CharField(required=False)
@@ -65,6 +114,44 @@ class SoilSensorSerializer(serializers.Serializer):
     moisture = serializers.FloatField(read_only=True)
     raw_value = serializers.IntegerField(read_only=True)
 
+class SurveyGridSerializer(serializers.Serializer):
+    x_min = serializers.FloatField(required=True)
+    x_max = serializers.FloatField(required=True)
+    y_min = serializers.FloatField(required=True)
+    y_max = serializers.FloatField(required=True)
+    step = serializers.FloatField(required=False, default=100, min_value=10)
+
+    def validate(self, data):
+        if data['x_max'] < data['x_min'] or data['y_max'] < data['y_min']:
+            raise serializers.ValidationError("Grid max must not be below min")
+        return data
+
+class SoilSurveyRequestSerializer(serializers.Serializer):
+    MAX_POINTS = 2000
+
+    points = PlantPointSerializer(many=True, required=False, allow_empty=False)
+    grid = SurveyGridSerializer(required=False)
+    z = serializers.FloatField(required=False, allow_null=True, default=None)
+    optimize = serializers.BooleanField(required=False, default=True)
+
+    def validate(self, data):
+        if ('points' in data) == ('grid' in data):
+            raise serializers.ValidationError("Give either points or grid")
+        if 'grid' in data:
+            grid = data['grid']
+            count = ((grid['x_max'] - grid['x_min']) // grid['step'] + 1) * \
+                ((grid['y_max'] - grid['y_min']) // grid['step'] + 1)
+        else:
+            count = len(data['points'])
+        if count > self.MAX_POINTS:
+            raise serializers.ValidationError(f"At most {self.MAX_POINTS} survey points")
+        return data
+
+class SoilSurveySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SoilSurvey
+        fields = ['id', 'status', 'created_at', 'finished_at', 'z', 'bounds', 'points', 'readings', 'error']
+
 class WeederSerializer(serializers.Serializer):
     x = serializers.FloatField(required=True)
     y = serializers.FloatField(required=True)
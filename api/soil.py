@@ -0,0 +1,131 @@
+from collections import OrderedDict
+import threading
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from farmlib import wrapper
+from farmlib.soil import moisture_raster, raster_png
+from .models import SoilSurvey
+
+# Moisture maps kept in memory, keyed by survey, readings and map options
+MAX_CACHED_MAPS = 16
+
+
+class SurveyRunning(Exception):
+    pass
+
+
+class SurveyRunner:
+    """
+    Runs one soil survey at a time on a background thread. Readings are
+    saved to the SoilSurvey row as they come in, so a survey can be
+    followed (and mapped) while the bot is still moving.
+    """
+
+    def __init__(self):
+        self.current = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, points, bounds, z=None, optimize=True):
+        with self._lock:
+            if self.current is not None:
+                raise SurveyRunning(f"Survey {self.current} is still running")
+            survey = SoilSurvey.objects.create(
+                points=[[x, y] for x, y in points], bounds=list(bounds), z=z
+            )
+            self.current = survey.id
+            self._stop.clear()
+        thread = threading.Thread(
+            target=self._run, args=(survey, optimize), name='soil-survey', daemon=True
+        )
+        thread.start()
+        return survey
+
+    def stop(self, survey_id):
+        """Ask the running survey to finish after the current point"""
+        with self._lock:
+            if self.current != survey_id:
+                return False
+            self._stop.set()
+            return True
+
+    def _run(self, survey, optimize):
+        close_old_connections()
+
+        def on_reading(reading):
+            survey.readings.append(reading)
+            SoilSurvey.objects.filter(pk=survey.pk).update(readings=survey.readings)
+
+        try:
+            readings = wrapper.survey_soil(
+                survey.points, z=survey.z, optimize=optimize,
+                on_reading=on_reading, should_stop=self._stop.is_set
+            )
+            if readings is None:
+                survey.status, survey.error = 'error', 'Bot not connected'
+            elif self._stop.is_set():
+                survey.status = 'stopped'
+            else:
+                survey.status = 'ok'
+        except Exception as e:
+            print(f"Soil survey {survey.id} failed: {e}")
+            survey.status, survey.error = 'error', str(e)
+        survey.finished_at = timezone.now()
+        survey.save()
+        with self._lock:
+            self.current = None
+        close_old_connections()
+        if survey_readings(survey):
+            survey_map(survey)  # Warm the cache for the default map
+
+
+def latest_survey():
+    """Most recent finished survey with at least one reading"""
+    for survey in SoilSurvey.objects.exclude(status='running')[:20]:
+        if survey_readings(survey):
+            return survey
+    return None
+
+
+def survey_readings(survey):
+    return [r for r in survey.readings if 'moisture' in r]
+
+
+_maps = OrderedDict()
+_maps_lock = threading.Lock()
+
+
+def _cached(key, build):
+    with _maps_lock:
+        if key in _maps:
+            _maps.move_to_end(key)
+            return _maps[key]
+    value = build()
+    with _maps_lock:
+        _maps[key] = value
+        while len(_maps) > MAX_CACHED_MAPS:
+            _maps.popitem(last=False)
+    return value
+
+
+def survey_map(survey, cell=20.0, power=2.0):
+    """
+    Interpolated moisture raster (see farmlib.soil.moisture_raster) of a
+    survey. Cached until the survey gets new readings.
+    """
+    readings = survey_readings(survey)
+    key = ('json', survey.id, len(readings), cell, power)
+    return _cached(key, lambda: moisture_raster(
+        readings, survey.bounds or None, cell=cell, power=power
+    ))
+
+
+def survey_png(survey, cell=20.0, power=2.0):
+    readings = survey_readings(survey)
+    key = ('png', survey.id, len(readings), cell, power)
+    return _cached(key, lambda: raster_png(survey_map(survey, cell, power)))
+
+
+survey_runner = SurveyRunner()
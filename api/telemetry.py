@@ -0,0 +1,175 @@
+from bisect import bisect_left
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import close_old_connections, transaction
+
+from farmlib.telemetry import RESOLUTIONS, rollup, merge_aggregates
+from .models import TelemetryRollup
+
+# How long each rollup resolution is kept (None = forever)
+RETENTION = {
+    1: timedelta(days=1),
+    60: timedelta(days=30),
+    3600: None,
+}
+
+# Query names for the resolutions; "raw" reads the in-memory ring buffer
+RESOLUTION_NAMES = {'1s': 1, '1m': 60, '1h': 3600}
+
+# Window returned when the caller gives no `since`
+DEFAULT_SPAN = {
+    'raw': timedelta(minutes=10),
+    1: timedelta(minutes=10),
+    60: timedelta(days=1),
+    3600: timedelta(days=30),
+}
+
+MAX_POINTS = 5000
+
+
+def _epoch(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def _clean(value):
+    # NaN is not valid JSON
+    return None if value != value else value
+
+
+class TelemetryStore:
+    """
+    Persists a TelemetryRecorder's samples as 1 s / 1 min / 1 h rollups.
+    Every `flush_interval` seconds a background thread drains the ring
+    buffer, aggregates the new samples per bucket and merges them into the
+    matching TelemetryRollup rows in one transaction. Expired rows are
+    pruned about once an hour according to RETENTION.
+    """
+
+    def __init__(self, flush_interval=5.0, prune_interval=3600.0):
+        self.flush_interval = flush_interval
+        self.prune_interval = prune_interval
+        self.recorder = None
+        self._thread = None
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, recorder):
+        with self._lock:
+            self.recorder = recorder
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='telemetry-store', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to store telemetry: {e}")
+
+    def flush(self):
+        times, columns = self.recorder.drain()
+        if not len(times):
+            return 0
+        close_old_connections()
+        with transaction.atomic():
+            for resolution in RESOLUTIONS:
+                self._merge(resolution, rollup(times, columns, resolution))
+        if time.monotonic() >= self._next_prune:
+            self._next_prune = time.monotonic() + self.prune_interval
+            self.prune()
+        return len(times)
+
+    def _merge(self, resolution, buckets):
+        buckets = {_epoch(start): bucket for start, bucket in buckets.items()}
+        existing = {
+            row.bucket: row
+            for row in TelemetryRollup.objects.filter(resolution=resolution, bucket__in=list(buckets))
+        }
+        created, updated = [], []
+        for when, (samples, aggregates) in buckets.items():
+            row = existing.get(when)
+            if row is None:
+                created.append(TelemetryRollup(
+                    resolution=resolution, bucket=when, samples=samples, data=aggregates
+                ))
+            else:
+                row.samples += samples
+                merge_aggregates(row.data, aggregates)
+                updated.append(row)
+        TelemetryRollup.objects.bulk_create(created)
+        TelemetryRollup.objects.bulk_update(updated, ['samples', 'data'])
+
+    def prune(self):
+        now = datetime.now(tz=dt_timezone.utc)
+        for resolution, keep in RETENTION.items():
+            if keep is not None:
+                TelemetryRollup.objects.filter(resolution=resolution, bucket__lt=now - keep).delete()
+
+
+def parse_resolution(value):
+    """'raw', '1s', '1m', '1h' or a number of seconds; None if unknown"""
+    value = (value or '1m').strip().lower()
+    if value == 'raw':
+        return value
+    if value in RESOLUTION_NAMES:
+        return RESOLUTION_NAMES[value]
+    if value.isdigit() and int(value) in RESOLUTIONS:
+        return int(value)
+    return None
+
+
+def rollup_series(resolution, since, until, fields=None):
+    """
+    Columnar time series from the stored rollups:
+    {"t": [epoch seconds], "samples": [...], "series": {column: {"mean", "min", "max"}}}
+    """
+    rows = list(
+        TelemetryRollup.objects
+        .filter(resolution=resolution, bucket__gte=since, bucket__lt=until)
+        .order_by('-bucket')
+        .values_list('bucket', 'samples', 'data')[:MAX_POINTS]
+    )
+    rows.reverse()
+    if fields is None:
+        fields = sorted({name for _, _, data in rows for name in data})
+    series = {name: {'mean': [], 'min': [], 'max': []} for name in fields}
+    for _, _, data in rows:
+        for name in fields:
+            agg = data.get(name)
+            column = series[name]
+            if agg and agg[0]:
+                column['mean'].append(agg[1] / agg[0])
+                column['min'].append(agg[2])
+                column['max'].append(agg[3])
+            else:
+                column['mean'].append(None)
+                column['min'].append(None)
+                column['max'].append(None)
+    return {
+        't': [bucket.timestamp() for bucket, _, _ in rows],
+        'samples': [samples for _, samples, _ in rows],
+        'series': series,
+    }
+
+
+def raw_series(recorder, since, until, fields=None):
+    """Columnar samples still held in the recorder's ring buffer"""
+    times, columns = recorder.snapshot(since.timestamp())
+    stop = bisect_left(times, until.timestamp())
+    start = max(0, stop - MAX_POINTS)
+    if fields is None:
+        fields = sorted(columns)
+    series = {}
+    for name in fields:
+        if name in columns:
+            series[name] = {'value': [_clean(v) for v in columns[name][start:stop]]}
+        else:
+            series[name] = {'value': [None] * (stop - start)}
+    return {'t': list(times[start:stop]), 'series': series}
+
+
+telemetry_store = TelemetryStore()
@@ -1,3 +1,476 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase
+from django.urls import reverse
+
+from farmlib.async_farmbot import AsyncFarmbot
+from farmlib.farmbot import Farmbot, RpcError, RpcWindowFull, StubHandler
+from farmlib.pool import FarmbotPool
+from farmlib.route import nearest_neighbour, path_cost, plan_route, travel_matrix, two_opt
+from farmlib.soil import idw, moisture_raster
+from farmlib.state import StateTree, diff_state
+from farmlib.telemetry import TelemetryRecorder
+from simulator import Simulation
+
+from .derivatives import derivative_pool
+from .media import IMMUTABLE, REVALIDATE, serve_file
+from .models import Photo
+from .serializers import PhotoModelSerializer
+
+
+class FakeMqtt():
+    """Stands in for paho: records publishes, never answers"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload):
+        self.published.append(json.loads(payload))
+
+    def sent(self, kind):
+        return [m["args"]["label"] for m in self.published
+                if m["body"][0]["kind"] == kind]
+
+
+def make_bot(cls=Farmbot):
+    """A bot built from a fake token whose connection never touches the network"""
+    token = {"token": {"encoded": "jwt", "unencoded": {
+        "bot": "device_1", "exp": 0, "iat": 0, "iss": "//localhost",
+        "jti": "jti", "mqtt": "localhost", "mqtt_ws": "ws://localhost",
+        "sub": 1, "vhost": "/"}}}
+    bot = cls(json.dumps(token))
+    bot._connection.mqtt = FakeMqtt()
+    return bot
+
+
+def answer(bot, label, kind="rpc_ok", errors=()):
+    """Deliver a reply as if it came from the device"""
+    body = [{"kind": "explanation", "args": {"message": e}} for e in errors]
+    bot._connection.unpack_response(json.dumps(
+        {"kind": kind, "args": {"label": label}, "body": body}))
+
+
+class PendingRpcTests(SimpleTestCase):
+    def setUp(self):
+        self.bot = make_bot()
+
+    def test_answers_arriving_before_wait_for_are_kept(self):
+        label = self.bot.send_message("hello")
+        answer(self.bot, label)
+        self.assertEqual(self.bot.wait_for(label, 1).id, label)
+
+    def test_rpc_error_raises(self):
+        label = self.bot.send_message("hello")
+        answer(self.bot, label, "rpc_error", ["nope"])
+        with self.assertRaises(RpcError):
+            self.bot.wait_for(label, 1)
+
+    def test_unanswered_rpc_times_out(self):
+        label = self.bot.send_message("hello")
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            self.bot.wait_for(label, 0.1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_label_is_forgotten_once_waited_on(self):
+        label = self.bot.send_message("hello")
+        answer(self.bot, label)
+        self.bot.wait_for(label, 1)
+        with self.assertRaises(KeyError):
+            self.bot.wait_for(label)
+
+
+
+class StateTreeTests(SimpleTestCase):
+    def test_diff_reports_changed_added_and_removed_leaves(self):
+        old = {"location_data": {"position": {"x": 1, "y": 2}}, "pins": {"59": {"value": 3}}}
+        new = {"location_data": {"position": {"x": 5, "y": 2}}, "jobs": {"a": 1}}
+        self.assertEqual(diff_state(old, new), {
+            "location_data.position.x": 5,
+            "jobs.a": 1,
+            "pins.59.value": None,
+        })
+
+    def test_subscribers_only_hear_changes_under_their_path(self):
+        tree = StateTree({"location_data": {"position": {"x": 0}}, "pins": {}})
+        moves, pins = [], []
+        tree.subscribe("location_data.position", moves.append)
+        tree.subscribe("pins.59", pins.append)
+        tree.update({"location_data": {"position": {"x": 10}}, "pins": {}})
+        tree.update({"location_data": {"position": {"x": 10}}, "pins": {"59": {"value": 7}}})
+        self.assertEqual(moves, [{"location_data.position.x": 10}])
+        self.assertEqual(pins, [{"pins.59.value": 7}])
+
+    def test_unchanged_update_notifies_nobody(self):
+        tree = StateTree({"a": {"b": 1}})
+        calls = []
+        tree.subscribe("", calls.append)
+        self.assertEqual(tree.update({"a": {"b": 1}}), {})
+        tree.unsubscribe("", calls.append)
+        tree.update({"a": {"b": 2}})
+        self.assertEqual(calls, [])
+        self.assertEqual(tree.get("a.b"), 2)
+
+
+
+class RpcWindowTests(SimpleTestCase):
+    def setUp(self):
+        self.bot = make_bot()
+
+    def test_reject_window_refuses_extra_rpcs(self):
+        self.bot.set_rpc_window(2, "reject")
+        self.bot.send_message("one")
+        self.bot.send_message("two")
+        with self.assertRaises(RpcWindowFull):
+            self.bot.send_message("three")
+        self.assertEqual(self.bot.rpc_stats()["rejected"], 1)
+
+    def test_block_window_gives_up_after_timeout(self):
+        self.bot.set_rpc_window(1, "block", timeout=0.3)
+        self.bot.send_message("one")
+        started = time.monotonic()
+        with self.assertRaises(RpcWindowFull):
+            self.bot.send_message("two")
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    def test_answer_frees_a_slot(self):
+        self.bot.set_rpc_window(1, "reject")
+        label = self.bot.send_message("one")
+        answer(self.bot, label)
+        self.bot.send_message("two")
+        self.assertEqual(self.bot.rpc_stats()["in_flight"], 1)
+
+
+
+class TelemetryRecorderTests(SimpleTestCase):
+    def state(self, x, pin=None):
+        state = {"location_data": {"position": {"x": x, "y": 0, "z": 0}}}
+        if pin is not None:
+            state["pins"] = {"59": {"value": pin}}
+        return state
+
+    def test_ring_buffer_keeps_the_newest_samples(self):
+        recorder = TelemetryRecorder(capacity=4)
+        for i in range(6):
+            recorder.record(self.state(i), now=100 + i)
+        times, columns = recorder.snapshot()
+        self.assertEqual(list(times), [102, 103, 104, 105])
+        self.assertEqual(list(columns["x"]), [2, 3, 4, 5])
+        self.assertEqual(recorder.stats()["overwritten"], 2)
+
+    def test_drain_hands_out_each_sample_once(self):
+        recorder = TelemetryRecorder(capacity=8)
+        recorder.record(self.state(1), now=1)
+        recorder.record(self.state(2), now=2)
+        self.assertEqual(list(recorder.drain()[0]), [1, 2])
+        recorder.record(self.state(3, pin=512), now=3)
+        times, columns = recorder.drain()
+        self.assertEqual(list(times), [3])
+        self.assertEqual(list(columns["pin_59"]), [512])
+        self.assertEqual(len(recorder.drain()[0]), 0)
+
+    def test_snapshot_since(self):
+        recorder = TelemetryRecorder(capacity=8)
+        for i in range(5):
+            recorder.record(self.state(i), now=10 + i)
+        self.assertEqual(list(recorder.snapshot(since=12)[0]), [12, 13, 14])
+
+
+
+class RouteTests(SimpleTestCase):
+    def test_two_opt_untangles_a_back_and_forth_path(self):
+        points = [(0, 0), (100, 0), (200, 0), (300, 0)]
+        matrix = travel_matrix(points, {"x": 1.0, "y": 1.0})
+        self.assertEqual(path_cost([0, 2, 1, 3], matrix), 500)
+        order = two_opt([0, 2, 1, 3], matrix)
+        self.assertEqual(list(order), [0, 1, 2, 3])
+        self.assertEqual(path_cost(order, matrix), 300)
+
+    def test_plan_route_visits_points_on_a_line_in_order(self):
+        points = [(400, 0), (100, 0), (300, 0), (200, 0)]
+        order, seconds, given = plan_route(points)
+        self.assertEqual(order, [1, 3, 2, 0])
+        self.assertLess(seconds, given)
+
+    def test_plan_route_never_worse_than_nearest_neighbour(self):
+        rng = np.random.default_rng(1)
+        points = [tuple(p) for p in rng.uniform(0, 1000, size=(40, 2))]
+        matrix = travel_matrix([(0, 0)] + points, {"x": 160.0, "y": 160.0})
+        greedy = path_cost(nearest_neighbour(matrix), matrix)
+        order, seconds, _ = plan_route(points)
+        self.assertEqual(sorted(order), list(range(40)))
+        self.assertLessEqual(seconds, greedy + 1e-9)
+
+
+
+class IdwTests(SimpleTestCase):
+    def test_samples_are_reproduced_exactly(self):
+        xy = [(0, 0), (100, 0), (0, 100)]
+        values = [10.0, 50.0, 90.0]
+        grid_x, grid_y = np.array([0, 100, 0]), np.array([0, 0, 100])
+        np.testing.assert_allclose(idw(xy, values, grid_x, grid_y), values)
+
+    def test_midpoint_of_two_samples_is_their_mean(self):
+        result = idw([(0, 0), (100, 0)], [20.0, 60.0], np.array([50.0]), np.array([0.0]))
+        self.assertAlmostEqual(float(result[0]), 40.0)
+
+    def test_chunking_does_not_change_the_result(self):
+        rng = np.random.default_rng(2)
+        xy = rng.uniform(0, 500, size=(12, 2))
+        values = rng.uniform(0, 100, size=12)
+        grid_x, grid_y = np.meshgrid(np.arange(0, 500, 25.0), np.arange(0, 300, 25.0))
+        whole = idw(xy, values, grid_x, grid_y)
+        np.testing.assert_allclose(idw(xy, values, grid_x, grid_y, chunk=7), whole)
+        self.assertTrue((whole >= values.min() - 1e-9).all() and (whole <= values.max() + 1e-9).all())
+
+    def test_moisture_raster_covers_the_bounds(self):
+        readings = [{'x': 0, 'y': 0, 'moisture': 10}, {'x': 100, 'y': 40, 'moisture': 30}]
+        raster = moisture_raster(readings, cell=20)
+        self.assertEqual((raster['width'], raster['height']), (6, 3))
+        self.assertEqual(raster['values'][0][0], 10)
+
+
+
+class ServeFileTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.body = bytes(range(256)) * 4
+        self.digest = hashlib.sha256(self.body).hexdigest()
+        self.name = f'{self.digest[:2]}/{self.digest}.jpg'
+        os.makedirs(os.path.join(self.root, self.digest[:2]))
+        with open(os.path.join(self.root, self.name), 'wb') as f:
+            f.write(self.body)
+        with open(os.path.join(self.root, 'plain.png'), 'wb') as f:
+            f.write(b'png')
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def get(self, path, **headers):
+        return serve_file(self.factory.get('/', headers=headers), self.root, path)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_response_headers(self):
+        response = self.get(self.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.content(response), self.body)
+        self.assertEqual(self.get('plain.png')['Cache-Control'], REVALIDATE)
+
+    def test_if_none_match_gives_304(self):
+        response = self.get(self.name, If_None_Match=f'"other", "{self.digest}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+
+    def test_if_modified_since_gives_304(self):
+        last_modified = self.get('plain.png')['Last-Modified']
+        self.assertEqual(self.get('plain.png', If_Modified_Since=last_modified).status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.get(self.name, Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.body)}')
+        self.assertEqual(self.content(response), self.body[10:20])
+        suffix = self.get(self.name, Range='bytes=-5')
+        self.assertEqual(self.content(suffix), self.body[-5:])
+        open_ended = self.get(self.name, Range=f'bytes={len(self.body) - 3}-')
+        self.assertEqual(self.content(open_ended), self.body[-3:])
+
+    def test_unsatisfiable_range_gives_416(self):
+        response = self.get(self.name, Range=f'bytes={len(self.body)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.body)}')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.get(self.name, Range='bytes=0-9', If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.body)
+
+    def test_multiple_ranges_are_ignored(self):
+        self.assertEqual(self.get(self.name, Range='bytes=0-1,4-5').status_code, 200)
+
+    def test_paths_outside_root_are_404(self):
+        with self.assertRaises(Http404):
+            self.get('../etc/passwd')
+        with self.assertRaises(Http404):
+            self.get('missing.jpg')
+
+
+
+class EmergencyStopTests(SimpleTestCase):
+    def setUp(self):
+        self.bot = make_bot()
+        self.mqtt = self.bot._connection.mqtt
+
+    def test_emergency_lock_bypasses_full_reject_window(self):
+        self.bot.set_rpc_window(2, "reject")
+        self.bot.send_message("one")
+        self.bot.send_message("two")
+        label = self.bot.emergency_lock()
+        self.assertEqual(self.mqtt.sent("emergency_lock"), [label])
+        answer(self.bot, label)
+        self.bot.wait_for(label, 1)
+
+    def test_emergency_lock_does_not_wait_for_a_slot(self):
+        self.bot.set_rpc_window(1, "block", timeout=30)
+        self.bot.send_message("one")
+        started = time.monotonic()
+        self.bot.emergency_lock()
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_emergency_lock_is_not_batched(self):
+        with self.bot.batch():
+            self.bot.move_absolute(10, 10, 0)
+            label = self.bot.emergency_lock()
+            self.assertEqual(self.mqtt.sent("emergency_lock"), [label])
+        self.assertEqual(len(self.mqtt.published), 2)
+
+    def test_queued_emergency_lock_stays_in_batch(self):
+        with self.bot.batch():
+            self.assertIsNone(self.bot.emergency_lock(now=False))
+        self.assertEqual(len(self.mqtt.published), 1)
+
+
+
+class Ready(StubHandler):
+    """Sets `ready` once the device answers the read_status sent on connect"""
+
+    def __init__(self):
+        self.connects = 0
+        self.ready = threading.Event()
+
+    def on_connect(self, bot, client):
+        self.connects += 1
+        self.ready.clear()
+
+    def on_response(self, bot, response):
+        self.ready.set()
+
+
+class PoolTests(SimpleTestCase):
+    """FarmbotPool against the bundled simulator"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Two devices, so the pool holds bots for different accounts
+        cls.sims = [Simulation(device_id=device_id, time_scale=1).start()
+                    for device_id in ("device_15", "device_16")]
+        cls.pool = FarmbotPool()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.stop()
+        for sim in cls.sims:
+            sim.stop()
+        super().tearDownClass()
+
+    def connect(self, sim, handler):
+        """Add a bot and wait until its subscriptions are live"""
+        bot = Farmbot.login(sim.email, sim.password, sim.server_url)
+        bot.mqtt_port = sim.broker.port
+        self.pool.add(bot, handler)
+        if not handler.ready.wait(10):
+            raise AssertionError("Bot did not connect to the simulator")
+        return bot
+
+    def test_pool_survives_a_failing_handler(self):
+        class Failing(Ready):
+            def __init__(self):
+                super().__init__()
+                self.failed = threading.Event()
+
+            def on_log(self, bot, log):
+                if not self.failed.is_set():
+                    self.failed.set()
+                    raise RuntimeError("handler bug")
+
+        handler = Failing()
+        other = self.connect(self.sims[0], Ready())
+        bot = self.connect(self.sims[1], handler)
+        try:
+            bot.send_message("boom")
+            self.assertTrue(handler.failed.wait(5))
+            # The failure drops the connection; wait for the reconnect
+            deadline = time.monotonic() + 10
+            while handler.connects < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertTrue(handler.ready.wait(10))
+            self.assertTrue(self.pool._thread.is_alive())
+            bot.wait_for(bot.send_message("again"), 5)
+            # The other bot kept being serviced throughout
+            other.wait_for(other.send_message("still here"), 5)
+        finally:
+            self.pool.remove(bot)
+            self.pool.remove(other)
+
+    def test_second_bot_for_a_device_is_rejected(self):
+        bot = self.connect(self.sims[0], Ready())
+        try:
+            duplicate = Farmbot.login(self.sims[0].email, self.sims[0].password,
+                                      self.sims[0].server_url)
+            with self.assertRaises(ValueError):
+                self.pool.add(duplicate, StubHandler())
+            self.assertIs(self.pool.get(bot.username), bot)
+        finally:
+            self.pool.remove(bot)
+
+
+
+class ReapedRpcTests(SimpleTestCase):
+    def test_wait_for_reaped_label_raises_timeout(self):
+        bot = make_bot()
+        connection = bot._connection
+        label = bot.send_message("hello")
+        connection.reap_stale(now=time.monotonic() + connection.rpc_timeout + 1)
+        self.assertNotIn(label, connection.pending)
+        with self.assertRaises(TimeoutError):
+            bot.wait_for(label)
+        with self.assertRaises(KeyError):
+            bot.wait_for(label)
+
+
+class PhotoSerializerTests(SimpleTestCase):
+    def test_thumbnail_url_is_a_pure_read(self):
+        photo = Photo(id=7, farmbot_id=70, image_path='ab/ab.jpg', meta_data={})
+        with mock.patch.object(derivative_pool, 'submit') as submit:
+            self.assertEqual(PhotoModelSerializer(photo).data['thumbnail_url'],
+                             reverse('photo-derivative', args=[7, 'thumb']))
+        submit.assert_not_called()
+        photo.meta_data['derivatives'] = {'thumb': {'file': 'cd/cd.webp', 'width': 320}}
+        self.assertEqual(PhotoModelSerializer(photo).data['thumbnail_url'], '/farm_images/cd/cd.webp')
+
+
+class BatchTests(SimpleTestCase):
+    def test_move_absolute_and_wait_refuses_to_run_in_a_batch(self):
+        bot = make_bot()
+        started = time.monotonic()
+        with self.assertRaises(RuntimeError):
+            with bot.batch():
+                bot.move_absolute_and_wait(10, 10, 0, timeout=1)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(bot._connection.mqtt.published, [])
+
+
+class AsyncFarmbotTests(SimpleTestCase):
+    def test_move_absolute_and_wait_refuses_to_run_in_a_batch(self):
+        bot = make_bot(AsyncFarmbot)
+        with self.assertRaises(RuntimeError):
+            with bot.batch():
+                asyncio.run(bot.move_absolute_and_wait(10, 10, 0, timeout=1))
+        self.assertEqual(bot._connection.mqtt.published, [])
@@ -1,19 +1,22 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    SequenceViewSet, PhotoViewSet,
+    SequenceViewSet, PhotoViewSet, DeviceLogViewSet,
     connect_view, move_absolute_view, move_relative_view,
     emergency_lock_view, emergency_unlock_view, find_home_view,
     go_to_home_view, power_off_view, reboot_view, servo_angle_view,
     lua_script_view, get_position_view, send_message_view, take_photo_view,
-    register_view, login_view, logout_view, me_view, water_plant_view,
+    register_view, login_view, logout_view, me_view, water_plant_view, water_plants_view,
     mount_tool_view, dismount_tool_view, dispense_view, clear_photos_view,
-    seed_injector_view, rotary_tool_view, soil_sensor_view, weeder_view
+    seed_injector_view, rotary_tool_view, soil_sensor_view, weeder_view,
+    rpc_stats_view, latency_view, http_stats_view, telemetry_view, soil_survey_view, soil_survey_detail_view,
+    soil_survey_stop_view, soil_map_view, soil_map_png_view, mosaic_view, mosaic_tile_view
 )
 
 router = DefaultRouter()
 router.register(r'sequences', SequenceViewSet, basename='sequence')
 router.register(r'photos', PhotoViewSet, basename='photo')
+router.register(r'logs', DeviceLogViewSet, basename='log')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -35,17 +38,29 @@ urlpatterns = [
     path('servo-angle/', servo_angle_view, name='servo-angle'),
     path('lua-script/', lua_script_view, name='lua-script'),
     path('position/', get_position_view, name='position'),
+    path('rpc-stats/', rpc_stats_view, name='rpc-stats'),
+    path('latency/', latency_view, name='latency'),
+    path('http-stats/', http_stats_view, name='http-stats'),
+    path('telemetry/', telemetry_view, name='telemetry'),
     path('send-message/', send_message_view, name='send-message'),
     path('take-photo/', take_photo_view, name='take-photo'),
     # Backwards-compatible alias used by the frontend
     path('get-latest-photo/', take_photo_view, name='get_latest_photo'),
     path('clear-photos/', clear_photos_view, name='clear-photos'),
+    path('mosaic/', mosaic_view, name='mosaic'),
+    path('mosaic/<int:z>/<int:x>/<int:y>.<str:fmt>', mosaic_tile_view, name='mosaic-tile'),
     path('water-plant/', water_plant_view, name='water-plant'),
+    path('water-plants/', water_plants_view, name='water-plants'),
     path('mount-tool/', mount_tool_view, name='mount-tool'),
     path('dismount-tool/', dismount_tool_view, name='dismount-tool'),
     path('dispense/', dispense_view, name='dispense'),
     path('seed-injector/', seed_injector_view, name='seed-injector'),
     path('rotary-tool/', rotary_tool_view, name='rotary-tool'),
     path('soil-sensor/', soil_sensor_view, name='soil-sensor'),
+    path('soil-survey/', soil_survey_view, name='soil-survey'),
+    path('soil-survey/<int:pk>/', soil_survey_detail_view, name='soil-survey-detail'),
+    path('soil-survey/<int:pk>/stop/', soil_survey_stop_view, name='soil-survey-stop'),
+    path('soil-map/', soil_map_view, name='soil-map'),
+    path('soil-map.png', soil_map_png_view, name='soil-map-png'),
     path('weeder/', weeder_view, name='weeder'),
 ]
\ No newline at end of file
@@ -6,82 +6,198 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.shortcuts import render
+from django.http import HttpResponse, HttpResponseRedirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 import json
-import threading
-import time
-from .models import Sequence, Step, Photo
+import os
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import ValidationError
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Sequence, Step, Photo, DeviceLog, SoilSurvey
+from .logstore import search_logs
+from .telemetry import parse_resolution, rollup_series, raw_series, DEFAULT_SPAN
+from .derivatives import derivative_pool, photo_file, SIZES as DERIVATIVE_SIZES
+from .media import serve_file, serve_farm_image, farm_images_root
+from .mirror import image_mirror
+from .mosaic import mosaic, grid_size, tile_path, tiles_root, blank_tile, MAX_ZOOM, FORMATS as TILE_FORMATS
+from .soil import survey_runner, SurveyRunning, latest_survey, survey_readings, survey_map, survey_png
 from .serializers import (
-    PositionSerializer, ServoAngleSerializer, MessageSerializer, 
-    LuaScriptSerializer, WateringSerializer, DispensingSerializer,
+    PositionSerializer, MoveAbsoluteSerializer, ServoAngleSerializer, MessageSerializer, 
+    LuaScriptSerializer, WateringSerializer, WaterPlantsSerializer, DispensingSerializer,
     ToolSerializer, SequenceSerializer, SeedInjectorSerializer,
     RotaryToolSerializer, SoilSensorSerializer, PhotoModelSerializer,
-    WeederSerializer
+    WeederSerializer, DeviceLogSerializer, SoilSurveyRequestSerializer, SoilSurveySerializer
 )
+from farmlib.soil import grid_points
 from farmlib.wrapper import (
     connect_bot, move_absolute, move_relative, emergency_lock, emergency_unlock,
     find_home, go_to_home, power_off, reboot, servo_angle, lua_script, 
-    get_position, send_message, take_photo, water_plant, mount_tool, 
+    get_position, get_rpc_stats, get_latency, get_http_stats, send_message, take_photo, water_plant, water_plants, mount_tool, 
     dismount_tool, dispense, use_seed_injector, use_rotary_tool, read_soil_sensor,
-    use_weeder
+    use_weeder, telemetry, run_sequence, get_sequence_run
 )
 
-# Initialize bot connection when server starts
-connection_thread = threading.Thread(target=connect_bot)
-connection_thread.daemon = True
-connection_thread.start()
+def _save_photo(result, coordinates):
+    """Photo row for a picture take_photo() stored, plus its derivatives and mosaic tiles"""
+    # The image mirror may have inserted this Web App image already
+    photo, _ = Photo.objects.get_or_create(
+        farmbot_id=result['id'],
+        defaults={
+            'image_path': result['path'],
+            'coordinates': coordinates,
+            'meta_data': {
+                'content_type': result['content_type'],
+                'source': 'farmbot_web_app',
+                'sha256': result['sha256'],
+                'size': result['size']
+            }
+        }
+    )
+    # Thumbnail and medium sizes for the gallery, off the request thread
+    derivative_pool.submit(photo.id)
+    # Redraw the garden mosaic tiles under the new photo
+    mosaic.update_photo(photo)
+    return photo
+
+
+def _save_sequence_photo(result):
+    try:
+        _save_photo(result, result['coordinates'])
+    finally:
+        close_old_connections()
+
+
+class PhotoCursorPagination(CursorPagination):
+    """Keyset pagination over the (created_at, id) index, newest first"""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
 
 class PhotoViewSet(viewsets.ModelViewSet):
     """
     ViewSet for viewing and managing photos taken by the FarmBot.
+    List query params: since, until (ISO 8601), x_min, x_max, y_min, y_max
+    (where the photo was taken, mm), limit, cursor
     """
     queryset = Photo.objects.all()
     serializer_class = PhotoModelSerializer
     permission_classes = [AllowAny]
+    pagination_class = PhotoCursorPagination
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset().order_by('-created_at')
-        serializer = self.get_serializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+    def get_queryset(self):
+        queryset = Photo.objects.all()
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        since = params.get('since') and parse_datetime(params['since'])
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        until = params.get('until') and parse_datetime(params['until'])
+        if until:
+            queryset = queryset.filter(created_at__lt=until)
+        for param, lookup in (('x_min', 'coordinates__x__gte'), ('x_max', 'coordinates__x__lte'),
+                              ('y_min', 'coordinates__y__gte'), ('y_max', 'coordinates__y__lte')):
+            if params.get(param):
+                try:
+                    queryset = queryset.filter(**{lookup: float(params[param])})
+                except ValueError:
+                    raise ValidationError({param: "Must be a number"})
+        return queryset
+
+    @action(detail=False, methods=['get', 'post'])
+    def sync(self, request):
+        """
+        GET: state of the Web App image mirror and its last result.
+        POST: mirror images newer than the newest stored one in the
+        background ({"full": true} fetches every missing image).
+        """
+        if request.method == 'POST':
+            full = str(request.data.get('full', request.query_params.get('full', ''))).lower() in ('1', 'true')
+            if not image_mirror.start(full=full):
+                return Response({"error": "Image sync already running"}, status=status.HTTP_409_CONFLICT)
+            return Response({"status": "started", "full": full}, status=status.HTTP_202_ACCEPTED)
+        return Response({"running": image_mirror.running, "last": image_mirror.last_result}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path=r'derivatives/(?P<size>[a-z]+)')
+    def derivative(self, request, pk=None, size=None):
+        """Make the photo's derivatives if needed and redirect to one size (thumb, medium)"""
+        if size not in DERIVATIVE_SIZES:
+            return Response({"error": f"size must be one of {', '.join(DERIVATIVE_SIZES)}"}, status=status.HTTP_404_NOT_FOUND)
+        photo = self.get_object()
+        try:
+            derivatives = derivative_pool.ensure(photo)
+            return HttpResponseRedirect(f'/farm_images/{derivatives[size]["file"]}')
+        except FileNotFoundError:
+            return Response({"error": "Photo file is missing"}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def destroy(self, request, *args, **kwargs):
         photo = self.get_object()
         try:
             # Delete the actual file
             import os
-            if os.path.exists(photo.image_path):
-                os.remove(photo.image_path)
+            # Identical captures share one content-addressed file
+            shared = Photo.objects.filter(image_path=photo.image_path).exclude(pk=photo.pk).exists()
+            if not shared:
+                original = photo_file(photo)
+                if os.path.exists(original):
+                    os.remove(original)
+                for derivative in (photo.meta_data.get('derivatives') or {}).values():
+                    path = os.path.join(farm_images_root(), derivative['file'])
+                    if os.path.exists(path):
+                        os.remove(path)
             # Delete the database entry
-            return super().destroy(request, *args, **kwargs)
+            response = super().destroy(request, *args, **kwargs)
+            mosaic.update_photo(photo)
+            return response
         except Exception as e:
             return Response(
                 {"error": f"Failed to delete photo: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class LogCursorPagination(CursorPagination):
+    """Keyset pagination: each page is an indexed range scan on created_at"""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
+
+class DeviceLogViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Stored device logs, newest first.
+    Query params: q (full-text), type, verbosity (max), since, until (ISO 8601), limit, cursor
+    """
+    serializer_class = DeviceLogSerializer
+    permission_classes = [AllowAny]
+    pagination_class = LogCursorPagination
+
+    def get_queryset(self):
+        queryset = DeviceLog.objects.all()
+        params = self.request.query_params
+        if params.get('type'):
+            queryset = queryset.filter(type__in=params['type'].split(','))
+        if params.get('verbosity', '').isdigit():
+            queryset = queryset.filter(verbosity__lte=int(params['verbosity']))
+        since = params.get('since') and parse_datetime(params['since'])
+        if since:
+            queryset = queryset.filter(created_at__gte=since)
+        until = params.get('until') and parse_datetime(params['until'])
+        if until:
+            queryset = queryset.filter(created_at__lt=until)
+        if params.get('q'):
+            queryset = search_logs(queryset, params['q'])
+        return queryset
+
 class SequenceViewSet(viewsets.ModelViewSet):
     serializer_class = SequenceSerializer
     permission_classes = [IsAuthenticated]
 
-    COMMAND_MAP = {
-        'move_absolute': move_absolute,
-        'move_relative': move_relative,
-        'water_plant': water_plant,
-        'dispense': dispense,
-        'take_photo': take_photo,
-        'mount_tool': mount_tool,
-        'dismount_tool': dismount_tool,
-        'emergency_lock': emergency_lock,
-        'emergency_unlock': emergency_unlock,
-        'find_home': find_home,
-        'go_to_home': go_to_home,
-        'power_off': power_off,
-        'reboot': reboot,
-        'servo_angle': servo_angle,
-        'lua_script': lua_script,
-        'send_message': send_message,
-    }
-
     def get_queryset(self):
         return Sequence.objects.filter(user=self.request.user)
 
@@ -90,22 +206,39 @@ class SequenceViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def execute(self, request, pk=None):
+        """
+        Compile the steps into one CeleryScript sequence and send it to the
+        device as a single RPC. Returns 202 with the RPC label right away;
+        poll runs/<label>/ for completion, or pass "wait": true to block
+        until the device has finished.
+        """
         sequence = self.get_object()
-        for step in sequence.steps.all():
-            command_func = self.COMMAND_MAP.get(step.command)
-            if not command_func:
-                return Response({'error': f'Unknown command: {step.command}'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            try:
-                print(f"Executing command: {step.command} with params: {step.parameters}")
-                command_func(**step.parameters)
-                # Default wait time, can be overridden by step parameter
-                wait_time = step.parameters.get('wait', 2)
-                time.sleep(wait_time)
-            except Exception as e:
-                return Response({'error': f'Failed to execute step {step.order} ({step.command}): {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        return Response({'status': 'sequence executed'}, status=status.HTTP_200_OK)
+        steps = [(step.command, step.parameters) for step in sequence.steps.all()]
+        wait = str(request.data.get('wait', request.query_params.get('wait', ''))).lower() in ('1', 'true')
+        try:
+            label = run_sequence(steps, wait=wait)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': f'Failed to start sequence: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if label is None:
+            if not steps:
+                return Response({'status': 'sequence executed', 'steps': 0}, status=status.HTTP_200_OK)
+            return Response({'error': 'Bot not connected'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        run = get_sequence_run(label)
+        if wait and run['status'] != 'running':
+            code = status.HTTP_200_OK if run['status'] == 'ok' else status.HTTP_500_INTERNAL_SERVER_ERROR
+            return Response(run, status=code)
+        return Response(run, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'runs/(?P<label>[^/]+)')
+    def runs(self, request, label=None):
+        """Progress of a sequence started by execute: running, ok, error or timeout"""
+        run = get_sequence_run(label)
+        if run is None:
+            return Response({'error': 'Unknown sequence run'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(run, status=status.HTTP_200_OK)
 
 
 @login_required
@@ -186,13 +319,17 @@ def connect_view(request):
 @permission_classes([AllowAny])
 @authentication_classes([])
 def move_absolute_view(request):
-    """Move FarmBot to absolute position"""
-    serializer = PositionSerializer(data=request.data)
+    """Move FarmBot to absolute position (pass "wait": true to return on arrival)"""
+    serializer = MoveAbsoluteSerializer(data=request.data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     try:
         data = serializer.validated_data
+        if data['wait']:
+            if not move_absolute(data['x'], data['y'], data['z'], data.get('speed', 100), wait=True):
+                return Response({"error": "Move did not complete"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({"status": "arrived"}, status=status.HTTP_200_OK)
         move_absolute(data['x'], data['y'], data['z'], data.get('speed', 100))
         return Response({"status": "moving"}, status=status.HTTP_200_OK)
     except Exception as e:
@@ -325,6 +462,73 @@ def get_position_view(request):
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def rpc_stats_view(request):
+    """Get RPC in-flight window depth and ack latency counters"""
+    try:
+        stats = get_rpc_stats()
+        if stats is None:
+            return Response({"error": "Bot not connected"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(stats, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def latency_view(request):
+    """Get broker <-> device round-trip latency percentiles"""
+    try:
+        latency = get_latency()
+        if latency is None:
+            return Response({"error": "Bot not connected"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(latency, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def http_stats_view(request):
+    """Get per-endpoint latency percentiles of FarmBot Web App HTTP calls"""
+    try:
+        return Response(get_http_stats(), status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def telemetry_view(request):
+    """
+    Position, load, encoder and pin history as columnar series.
+    Query params: resolution (raw, 1s, 1m, 1h), since, until (ISO 8601), fields (comma list)
+    """
+    try:
+        params = request.query_params
+        resolution = parse_resolution(params.get('resolution'))
+        if resolution is None:
+            return Response({"error": "resolution must be raw, 1s, 1m or 1h"}, status=status.HTTP_400_BAD_REQUEST)
+        until = params.get('until') and parse_datetime(params['until'])
+        until = until or timezone.now()
+        since = params.get('since') and parse_datetime(params['since'])
+        since = since or until - DEFAULT_SPAN[resolution]
+        fields = params['fields'].split(',') if params.get('fields') else None
+        if resolution == 'raw':
+            data = raw_series(telemetry, since, until, fields)
+        else:
+            data = rollup_series(resolution, since, until, fields)
+        data.update({
+            "resolution": params.get('resolution') or '1m',
+            "since": since.isoformat(),
+            "until": until.isoformat(),
+        })
+        return Response(data, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @authentication_classes([])
@@ -341,6 +545,35 @@ def send_message_view(request):
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def water_plants_view(request):
+    """Water a list of plants in one run, visiting them in the fastest order"""
+    serializer = WaterPlantsSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        data = serializer.validated_data
+        result = water_plants(
+            [(p['x'], p['y'], p['z']) for p in data['plants']],
+            z=data['z'],
+            water_ms=data['water_ms'],
+            optimize=data['optimize'],
+            wait=data['wait']
+        )
+        if result is None:
+            return Response({"error": "Bot not connected"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        run = result['run']
+        if data['wait']:
+            if run['status'] != 'ok':
+                return Response(result, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response(result, status=status.HTTP_200_OK)
+        return Response(result, status=status.HTTP_202_ACCEPTED)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @authentication_classes([])
@@ -441,15 +674,7 @@ def take_photo_view(request):
             }
 
         # Create photo record with the most recent photo ID
-        photo = Photo.objects.create(
-            image_path=f"farm_images/image_{result['id']}.jpg",
-            farmbot_id=result['id'],
-            coordinates=coordinates,
-            meta_data={
-                'content_type': result['content_type'],
-                'source': 'farmbot_web_app'
-            }
-        )
+        photo = _save_photo(result, coordinates)
         
         # Check response format
         response_format = request.query_params.get('format', 'json')
@@ -459,14 +684,46 @@ def take_photo_view(request):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             # Return the image directly
-            from django.http import HttpResponse
-            return HttpResponse(
-                result['image'],
-                content_type=result['content_type']
-            )
+            return serve_farm_image(request, photo.media_path)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def farm_image_view(request, path):
+    """Photos and derivatives under farm_images/ (see api.media.serve_file)"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'GET, HEAD'})
+    return serve_farm_image(request, path)
+
+@api_view(['GET', 'POST'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def mosaic_view(request):
+    """
+    GET: layout of the garden photo mosaic tiles (zoom levels, grid per
+    zoom, version) and their URL template. POST: redraw every tile.
+    """
+    try:
+        if request.method == 'POST':
+            mosaic.rebuild()
+            return Response({"status": "rebuilding"}, status=status.HTTP_202_ACCEPTED)
+        data = mosaic.describe()
+        data['tiles'] = request.build_absolute_uri(reverse('mosaic')) + '{z}/{x}/{y}.png'
+        return Response(data, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def mosaic_tile_view(request, z, x, y, fmt):
+    """One mosaic tile as PNG or WebP; parts of the garden without photos are transparent"""
+    columns, rows = grid_size(z) if 0 <= z <= MAX_ZOOM else (0, 0)
+    if fmt not in TILE_FORMATS or not (0 <= x < columns and 0 <= y < rows):
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    if mosaic.tile(z, x, y, fmt) is None:
+        response = HttpResponse(blank_tile(fmt), content_type=f'image/{fmt}')
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+        return response
+    relative = os.path.relpath(tile_path(z, x, y, fmt), tiles_root())
+    return serve_file(request, tiles_root(), relative)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @authentication_classes([])
@@ -477,14 +734,14 @@ def clear_photos_view(request):
     
     try:
         # Get the farm_images directory path
-        farm_images_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'farm_images')
+        farm_images_dir = farm_images_root()
         
-        # Find all image files
-        image_patterns = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']
+        # Find all image files, including the content-addressed subfolders
+        image_patterns = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.webp']
         deleted_count = 0
         
         for pattern in image_patterns:
-            files = glob.glob(os.path.join(farm_images_dir, pattern))
+            files = glob.glob(os.path.join(farm_images_dir, '**', pattern), recursive=True)
             for file_path in files:
                 try:
                     os.remove(file_path)
@@ -559,6 +816,125 @@ def soil_sensor_view(request):
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET', 'POST'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def soil_survey_view(request):
+    """
+    GET: recent soil surveys. POST: read the soil sensor over a list of
+    points or a grid ({"x_min", "x_max", "y_min", "y_max", "step"}) in the
+    background; follow it at /api/soil-survey/<id>/.
+    """
+    if request.method == 'GET':
+        surveys = SoilSurvey.objects.all()[:20]
+        return Response(SoilSurveySerializer(surveys, many=True).data, status=status.HTTP_200_OK)
+
+    serializer = SoilSurveyRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        data = serializer.validated_data
+        if get_position() is None:
+            return Response({"error": "Bot not connected"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if 'grid' in data:
+            grid = data['grid']
+            points = grid_points(grid['x_min'], grid['x_max'], grid['y_min'], grid['y_max'], grid['step'])
+            bounds = (grid['x_min'], grid['x_max'], grid['y_min'], grid['y_max'])
+        else:
+            points = [(p['x'], p['y']) for p in data['points']]
+            xs, ys = [x for x, _ in points], [y for _, y in points]
+            bounds = (min(xs), max(xs), min(ys), max(ys))
+        survey = survey_runner.start(points, bounds, z=data['z'], optimize=data['optimize'])
+        return Response(SoilSurveySerializer(survey).data, status=status.HTTP_202_ACCEPTED)
+    except SurveyRunning as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def soil_survey_detail_view(request, pk):
+    """Status and readings of one soil survey"""
+    survey = SoilSurvey.objects.filter(pk=pk).first()
+    if survey is None:
+        return Response({"error": "Unknown survey"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(SoilSurveySerializer(survey).data, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def soil_survey_stop_view(request, pk):
+    """Stop a running soil survey after the point it is reading"""
+    if not survey_runner.stop(pk):
+        return Response({"error": "Survey is not running"}, status=status.HTTP_409_CONFLICT)
+    return Response({"status": "stopping"}, status=status.HTTP_200_OK)
+
+def _soil_map_request(request):
+    """(survey, cell, power) from query params; survey defaults to the latest finished one"""
+    params = request.query_params
+    cell = float(params.get('cell') or 20)
+    power = float(params.get('power') or 2)
+    if not 5 <= cell <= 500 or not 0.5 <= power <= 6:
+        raise ValueError("cell must be 5-500 mm and power 0.5-6")
+    if params.get('survey'):
+        survey = SoilSurvey.objects.filter(pk=params['survey']).first()
+        if survey is not None and not survey_readings(survey):
+            survey = None
+    else:
+        survey = latest_survey()
+    return survey, cell, power
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def soil_map_view(request):
+    """
+    Interpolated (inverse distance weighted) soil moisture map in percent.
+    Query params: survey (id, default latest), cell (mm, default 20), power (default 2)
+    """
+    try:
+        survey, cell, power = _soil_map_request(request)
+        if survey is None:
+            return Response({"error": "No soil survey readings yet"}, status=status.HTTP_404_NOT_FOUND)
+        data = dict(survey_map(survey, cell, power))
+        data.update({
+            "survey": survey.id,
+            "status": survey.status,
+            "readings": len(survey_readings(survey)),
+            "png": request.build_absolute_uri(
+                f"{reverse('soil-map-png')}?survey={survey.id}&cell={cell:g}&power={power:g}"
+            ),
+        })
+        return Response(data, status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@authentication_classes([])
+def soil_map_png_view(request):
+    """The soil moisture map as a PNG overlay, one pixel per cell (same params as soil-map)"""
+    try:
+        survey, cell, power = _soil_map_request(request)
+        if survey is None:
+            return Response({"error": "No soil survey readings yet"}, status=status.HTTP_404_NOT_FOUND)
+        etag = f'"soil-{survey.id}-{len(survey_readings(survey))}-{cell:g}-{power:g}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(survey_png(survey, cell, power), content_type='image/png')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @authentication_classes([])
@@ -0,0 +1,405 @@
+"""
+End-to-end latency and throughput of the control path: HTTP request ->
+Django view -> MQTT publish -> device ack -> HTTP response.
+
+    python benchmarks/bench_api.py [--clients 4] [--requests 200] [--output report.json]
+    python benchmarks/bench_api.py --compare before.json after.json
+
+By default everything runs in this process: the simulator (broker, fake
+web app, virtual device) on background threads and the Django app behind
+`django.test.Client` on a throwaway SQLite database. The simulator's
+broker timestamps every request and ack, so each request is split into
+request -> publish and request -> ack phases.
+
+With `--url` the suite drives an already running server instead (start
+it against `python -m simulator`); only client-side latency is reported
+then.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from farmlib.latency import LatencyHistogram  # noqa: E402
+
+SCENARIOS = ("position", "move_absolute", "move_absolute_wait",
+             "sequence_execute", "take_photo")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Tracer():
+    """
+    Records when the broker saw each RPC request (publish) and its
+    answer (ack), and which labels each benchmark request produced.
+    """
+
+    def __init__(self):
+        self.published = {}
+        self.acked = {}
+        self._local = threading.local()
+
+    def attach(self, broker):
+        broker.listen("bot/+/from_clients", self._on_publish)
+        broker.listen("bot/+/from_device", self._on_ack)
+
+    def _label(self, payload):
+        try:
+            return json.loads(payload)["args"]["label"]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _on_publish(self, topic, payload):
+        self.published[self._label(payload)] = time.perf_counter()
+
+    def _on_ack(self, topic, payload):
+        self.acked[self._label(payload)] = time.perf_counter()
+
+    def wrap(self, connection):
+        send_rpc = connection.send_rpc
+        local = self._local
+
+        def traced(rpc, timeout=None):
+            label = send_rpc(rpc, timeout)
+            labels = getattr(local, "labels", None)
+            if labels is not None:
+                labels.append(label)
+            return label
+
+        connection.send_rpc = traced
+
+    def begin(self):
+        self._local.labels = []
+
+    def end(self):
+        labels, self._local.labels = self._local.labels, None
+        return labels
+
+    def phases(self, start, labels):
+        """(request -> first publish, request -> last ack) in seconds"""
+        published = [self.published[l] for l in labels if l in self.published]
+        acked = [self.acked[l] for l in labels if l in self.acked]
+        return ((min(published) - start) if published else None,
+                (max(acked) - start) if len(acked) == len(labels) else None)
+
+
+class InProcessClient():
+    def __init__(self, token=None):
+        from django.test import Client
+        self.client = Client(HTTP_HOST="localhost")
+        self.token = token
+
+    def request(self, method, path, data=None):
+        headers = {}
+        if self.token:
+            headers["HTTP_AUTHORIZATION"] = "Token " + self.token
+        call = getattr(self.client, method.lower())
+        if method == "GET":
+            response = call(path, data or {}, **headers)
+        else:
+            response = call(path, json.dumps(data or {}),
+                            content_type="application/json", **headers)
+        try:
+            body = json.loads(response.content or b"null")
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+class HttpClient():
+    def __init__(self, base_url, token=None):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = "Token " + token
+
+    def request(self, method, path, data=None):
+        url = self.base_url + path
+        if method == "GET":
+            response = self.session.get(url, params=data, timeout=600)
+        else:
+            response = self.session.request(method, url, json=data or {},
+                                            timeout=600)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+def start_in_process(time_scale):
+    """Simulator + Django on a temporary database; returns (tracer, sim)."""
+    from simulator import Simulation
+
+    workdir = tempfile.mkdtemp(prefix="farmbot-bench-")
+    sim = Simulation(time_scale=time_scale).start()
+    os.environ.update(sim.env())
+    os.environ["FARMBOT_TOKEN_CACHE"] = os.path.join(workdir, "token.json")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "farmbot_api.settings")
+    # Photos are written relative to the working directory.
+    os.chdir(workdir)
+
+    import django
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = os.path.join(workdir, "db.sqlite3")
+    settings.DEBUG = False
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", verbosity=0)
+    # What a served process starts in ApiConfig.ready(); the bot is
+    # connected below so a failure stops the run.
+    from django.apps import apps
+    apps.get_app_config("api").start_services(connect=False)
+
+    tracer = Tracer()
+    tracer.attach(sim.broker)
+    from farmlib import wrapper
+    if not wrapper.connect_bot():
+        raise SystemExit("could not connect to the simulator")
+    tracer.wrap(wrapper.bot._connection)
+    return tracer, sim
+
+
+def make_token(client):
+    name = "bench-%d" % random.randrange(10 ** 9)
+    status, body = client.request("POST", "/api/auth/register/",
+                                  {"username": name, "password": name})
+    if status != 201:
+        raise SystemExit("could not register a benchmark user: %s" % body)
+    return body["token"]
+
+
+def make_sequence(client):
+    steps = [
+        {"order": i, "command": "move_absolute",
+         "parameters": {"x": 100 * i, "y": 50 * i, "z": 0, "wait": 0}}
+        for i in range(1, 4)
+    ]
+    status, body = client.request("POST", "/api/sequences/",
+                                  {"name": "bench", "steps": steps})
+    if status != 201:
+        raise SystemExit("could not create the benchmark sequence: %s" % body)
+    return body["id"]
+
+
+def scenario_request(name, sequence_id):
+    x, y = random.uniform(0, 300), random.uniform(0, 300)
+    if name == "position":
+        return "GET", "/api/position/", None
+    if name == "move_absolute":
+        return "POST", "/api/move-absolute/", {"x": x, "y": y, "z": 0}
+    if name == "move_absolute_wait":
+        return "POST", "/api/move-absolute/", {"x": x, "y": y, "z": 0,
+                                                "wait": True}
+    if name == "sequence_execute":
+        return "POST", "/api/sequences/%d/execute/" % sequence_id, None
+    if name == "take_photo":
+        return "GET", "/api/take-photo/", None
+    raise ValueError(name)
+
+
+def run_scenario(name, clients, count, tracer, sequence_id, warmup):
+    remaining = [count + warmup]
+    lock = threading.Lock()
+    samples = []
+
+    def worker(client):
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                measured = remaining[0] < count
+            method, path, data = scenario_request(name, sequence_id)
+            if tracer:
+                tracer.begin()
+            start = time.perf_counter()
+            status, _ = client.request(method, path, data)
+            end = time.perf_counter()
+            labels = tracer.end() if tracer else []
+            if measured:
+                samples.append((start, end, status, labels))
+
+    threads = [threading.Thread(target=worker, args=(client,))
+               for client in clients]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    # Give acks for fire-and-forget commands a moment to arrive.
+    if tracer:
+        deadline = time.monotonic() + 10
+        pending = [l for s in samples for l in s[3]]
+        while (time.monotonic() < deadline and
+               any(l not in tracer.acked for l in pending)):
+            time.sleep(0.05)
+    return summarize(samples, elapsed, tracer)
+
+
+def summarize(samples, elapsed, tracer):
+    total = LatencyHistogram(None)
+    publish = LatencyHistogram(None)
+    ack = LatencyHistogram(None)
+    errors = 0
+    first = min((s[0] for s in samples), default=0)
+    last = max((s[1] for s in samples), default=0)
+    for start, end, status, labels in samples:
+        if status >= 400:
+            errors += 1
+            continue
+        total.add(end - start)
+        if tracer and labels:
+            to_publish, to_ack = tracer.phases(start, labels)
+            if to_publish is not None:
+                publish.add(to_publish)
+            if to_ack is not None:
+                ack.add(to_ack)
+    result = {
+        "requests": len(samples),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(samples) / (last - first), 2)
+        if last > first else None,
+        "latency_ms": total.summary(),
+    }
+    if tracer:
+        result["request_to_publish_ms"] = publish.summary()
+        result["request_to_ack_ms"] = ack.summary()
+    return result
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print("%-20s %-14s %12s %12s %9s" % ("scenario", "metric", "before",
+                                         "after", "change"))
+    for name, new in after["scenarios"].items():
+        old = before["scenarios"].get(name)
+        if old is None:
+            continue
+        rows = [("req/s", old["requests_per_s"], new["requests_per_s"])]
+        for pct in ("p50_ms", "p95_ms", "p99_ms"):
+            rows.append((pct, old["latency_ms"][pct], new["latency_ms"][pct]))
+        for metric, a, b in rows:
+            change = ("%+.1f%%" % ((b - a) * 100.0 / a)) if a and b else "-"
+            print("%-20s %-14s %12s %12s %9s" % (name, metric, a, b, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--clients", type=int, default=4,
+                        help="concurrent HTTP clients")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="measured requests per scenario")
+    parser.add_argument("--photo-requests", type=int, default=2,
+                        help="measured requests for take_photo (slow)")
+    parser.add_argument("--warmup", type=int, default=5,
+                        help="unmeasured requests before each scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated subset of: " +
+                        ", ".join(SCENARIOS))
+    parser.add_argument("--time-scale", type=float, default=20.0,
+                        help="simulated device speed-up (in-process only)")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="print the difference between two reports")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    tracer = sim = None
+    if args.url:
+        def new_client(token=None):
+            return HttpClient(args.url, token)
+    else:
+        tracer, sim = start_in_process(args.time_scale)
+
+        def new_client(token=None):
+            return InProcessClient(token)
+
+    setup = new_client()
+    token = make_token(setup)
+    sequence_id = make_sequence(new_client(token))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": "http" if args.url else "in-process",
+            "clients": args.clients,
+            "time_scale": None if args.url else args.time_scale,
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenarios.split(","):
+            name = name.strip()
+            if name not in SCENARIOS:
+                raise SystemExit("unknown scenario: " + name)
+            # One camera: photos are taken one at a time.
+            photo = name == "take_photo"
+            clients = [new_client(token)
+                       for _ in range(1 if photo else args.clients)]
+            count = args.photo_requests if photo else args.requests
+            report["scenarios"][name] = run_scenario(
+                name, clients, count, tracer, sequence_id,
+                0 if photo else args.warmup)
+        if not args.url:
+            from farmlib import wrapper
+            report["rpc_stats"] = wrapper.get_rpc_stats()
+    finally:
+        if sim is not None:
+            sim.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return
+    print("%s, %d clients, commit %s" % (report["meta"]["mode"], args.clients,
+                                        report["meta"]["commit"]))
+    print("%-20s %7s %6s %9s %9s %9s %9s %11s" % (
+        "scenario", "reqs", "errs", "req/s", "p50 ms", "p95 ms", "p99 ms",
+        "ack p50 ms"))
+    for name, row in report["scenarios"].items():
+        latency = row["latency_ms"]
+        ack = (row.get("request_to_ack_ms") or {}).get("p50_ms")
+        print("%-20s %7d %6d %9s %9s %9s %9s %11s" % (
+            name, row["requests"], row["errors"], row["requests_per_s"],
+            latency["p50_ms"], latency["p95_ms"], latency["p99_ms"], ack))
+
+
+if __name__ == "__main__":
+    main()
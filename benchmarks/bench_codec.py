@@ -0,0 +1,116 @@
+"""
+Decode/encode throughput of the MQTT JSON codecs on realistic status
+payloads built from `empty_state()`.
+
+    python benchmarks/bench_codec.py [--seconds 2] [--json]
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from farmlib.codec import available_codecs, get_codec  # noqa: E402
+from farmlib.farmbot import empty_state  # noqa: E402
+
+
+def sample_status():
+    """
+    A status tree shaped and sized like a FarmBot OS 15 publish: a few
+    hundred firmware params, every pin the device reports, populated
+    settings and a couple of running jobs.
+    """
+    state = copy.deepcopy(empty_state())
+    xyz = lambda x, y, z: {"x": x, "y": y, "z": z}  # noqa: E731
+    state["location_data"] = {
+        "axis_states": xyz("idle", "idle", "idle"),
+        "load": xyz(12, 40, 3),
+        "position": xyz(1203.4, 611.0, -121.2),
+        "raw_encoders": xyz(24068, 12220, -2424),
+        "scaled_encoders": xyz(1203.38, 610.95, -121.19),
+    }
+    state["configuration"] = {
+        "arduino_debug_messages": False, "auto_sync": True,
+        "beta_opt_in": False, "disable_factory_reset": False,
+        "firmware_hardware": "farmduino_k16", "firmware_path": None,
+        "network_not_found_timer": None, "os_auto_update": False,
+        "sequence_body_log": True, "sequence_complete_log": True,
+        "sequence_init_log": True,
+    }
+    state["informational_settings"] = {
+        "busy": False, "cache_bust": None, "commit": "4c4b8b2",
+        "controller_commit": "4c4b8b2", "controller_uuid": "0b5f2a",
+        "controller_version": "15.4.7", "firmware_commit": "e5a1b7",
+        "firmware_version": "6.6.22.G", "idle": True, "locked": False,
+        "memory_usage": 84, "node_name": "farmbot@farmbot-000.local",
+        "soc_temp": 47, "sync_status": "synced", "target": "rpi3",
+        "throttled": "0x0", "update_available": False, "uptime": 982341,
+        "wifi_level": -52, "wifi_level_percent": 96,
+    }
+    state["mcu_params"] = {
+        "param_%03d" % i: float(i % 7) for i in range(220)
+    }
+    state["pins"] = {
+        str(pin): {"mode": pin % 2, "value": (pin * 37) % 1024}
+        for pin in range(0, 70)
+    }
+    state["jobs"] = {
+        "FBOS_OTA": {"status": "complete", "percent": 100,
+                     "type": "ota", "time": "2025-11-02T09:59:00Z"},
+        "image upload": {"status": "working", "percent": 42,
+                         "type": "image", "time": "2025-11-02T10:00:12Z"},
+    }
+    state["user_env"] = {"LAST_CLIENT_CONNECTED": "2025-11-02T09:58:00Z"}
+    return state
+
+
+def measure(fn, arg, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(100):
+            fn(arg)
+        count += 100
+        now = time.perf_counter()
+        if now >= deadline:
+            return count / (now - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=2.0,
+                        help="time spent on each measurement")
+    parser.add_argument("--json", action="store_true",
+                        help="print results as JSON")
+    args = parser.parse_args()
+
+    state = sample_status()
+    payload = json.dumps(state).encode()
+    results = {"payload_bytes": len(payload), "codecs": {}}
+    for name in available_codecs():
+        codec = get_codec(name)
+        decode = measure(codec.loads, payload, args.seconds)
+        encode = measure(codec.dumps, state, args.seconds)
+        results["codecs"][name] = {
+            "decode_per_s": round(decode),
+            "encode_per_s": round(encode),
+            "decode_mb_per_s": round(decode * len(payload) / 1e6, 1),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print("status payload: %d bytes" % results["payload_bytes"])
+    print("%-8s %14s %14s %10s" % ("codec", "decode/s", "encode/s", "MB/s"))
+    for name, row in results["codecs"].items():
+        print("%-8s %14d %14d %10.1f" % (name, row["decode_per_s"],
+                                         row["encode_per_s"],
+                                         row["decode_mb_per_s"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,8 @@ from django.core.asgi import get_asgi_application
 import farmbot_api.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmbot_api.settings')
+# This process serves requests: start the background services (api/apps.py)
+os.environ.setdefault('FARMBOT_START_SERVICES', '1')
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
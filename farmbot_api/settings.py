@@ -151,6 +151,15 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Internal nginx location for farm_images/ (e.g. /protected/farm_images/).
+# When set, photos are sent by nginx via X-Accel-Redirect instead of Python.
+FARM_IMAGES_ACCEL_REDIRECT = os.getenv('FARM_IMAGES_ACCEL_REDIRECT') or None
+
+# Start the device connection, log sink, telemetry rollups and image mirror
+# (api.apps.ApiConfig.ready): "1" forces them on, "0" off. Unset, they run
+# only under runserver or a server loading farmbot_api/wsgi.py or asgi.py.
+FARMBOT_START_SERVICES = os.getenv('FARMBOT_START_SERVICES') or None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -15,10 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from api.views import social_auth_callback_view
+from api.views import social_auth_callback_view, farm_image_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -28,14 +28,8 @@ urlpatterns = [
     path('api/', include('api.urls')),
 ]
 
-# Serve farm_images in development
-if settings.DEBUG:
-    from django.views.static import serve
-    from django.urls import re_path
-    import os
-    
-    urlpatterns += [
-        re_path(r'^farm_images/(?P<path>.*)$', serve, {
-            'document_root': os.path.join(settings.BASE_DIR, 'farm_images'),
-        }),
-    ]
+# Photos are served by the app itself (ETag, Range, long-lived caching),
+# optionally handing the bytes to nginx via X-Accel-Redirect
+urlpatterns += [
+    re_path(r'^farm_images/(?P<path>.+)$', farm_image_view, name='farm-image'),
+]
@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmbot_api.settings')
+# This process serves requests: start the background services (api/apps.py)
+os.environ.setdefault('FARMBOT_START_SERVICES', '1')
 
 application = get_wsgi_application()
@@ -0,0 +1,285 @@
+from paho.mqtt.client import MQTT_ERR_SUCCESS
+import asyncio
+
+from farmlib.farmbot import Farmbot, FarmbotConnection
+
+
+class PendingCommand():
+    """
+    Returned by every `AsyncFarmbot` command. The RPC has already been
+    published when you get one of these; awaiting it waits for the
+    device's `rpc_ok` (or raises `RpcError`/`TimeoutError`).
+    """
+
+    def __init__(self, bot, label):
+        self.bot = bot
+        self.label = label
+
+    def __await__(self):
+        return self.bot.wait_for_async(self.label).__await__()
+
+    def __repr__(self):
+        return "<PendingCommand " + self.label + ">"
+
+
+class AsyncHandler():
+    """
+    Adapts a regular handler for use on the event loop: if a callback
+    returns a coroutine it is scheduled as a task instead of dropped.
+    """
+
+    def __init__(self, handler, loop):
+        self.handler = handler
+        self.loop = loop
+
+    def _call(self, name, *args):
+        callback = getattr(self.handler, name, None)
+        if callback is None:
+            return
+        result = callback(*args)
+        if asyncio.iscoroutine(result):
+            self.loop.create_task(result)
+
+    def on_connect(self, bot, client): self._call("on_connect", bot, client)
+    def on_disconnect(self, bot, rc): self._call("on_disconnect", bot, rc)
+    def on_change(self, bot, state): self._call("on_change", bot, state)
+    def on_log(self, bot, log): self._call("on_log", bot, log)
+    def on_error(self, bot, response): self._call("on_error", bot, response)
+    def on_response(self, bot, response): self._call("on_response", bot, response)
+
+
+class AsyncFarmbotConnection(FarmbotConnection):
+    """
+    Drives the paho client from a running asyncio loop (e.g. Daphne's)
+    instead of a `loop_forever()` thread. paho tells us when its socket
+    opens/closes and when it has data to write; we register the socket
+    with the loop's reader/writer callbacks and run `loop_misc()` (keep
+    alives, retries) from a periodic task.
+
+    The blocking parts of a connect (DNS, TCP, sending CONNECT) run in
+    the default executor. Like the threaded client, a dropped session
+    (or a failed attempt) is retried with jittered exponential backoff
+    until `stop_connection()`.
+    """
+
+    def __init__(self, bot, mqtt=None):
+        super().__init__(bot, mqtt)
+        self.loop = None
+        self.misc_task = None
+        self.reconnect_task = None
+        self.disconnected = None
+        self.fd = None
+
+    async def start_connection(self):
+        self.loop = asyncio.get_running_loop()
+        self.disconnected = self.loop.create_future()
+        self._stopping = False
+        self.mqtt.on_connect = self.handle_connect
+        self.mqtt.on_message = self.handle_message
+        self.mqtt.on_disconnect = self.handle_disconnect
+        self.mqtt.on_socket_open = self.on_socket_open
+        self.mqtt.on_socket_close = self.on_socket_close
+        self.mqtt.on_socket_register_write = self.on_socket_register_write
+        self.mqtt.on_socket_unregister_write = self.on_socket_unregister_write
+        try:
+            await self.loop.run_in_executor(None, self.mqtt.connect,
+                                            self.bot.hostname,
+                                            self.bot.mqtt_port, 60)
+        except OSError as e:
+            print("MQTT connect failed: " + str(e))
+            self._schedule_reconnect()
+
+    def stop_connection(self):
+        self._stopping = True
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+            self.reconnect_task = None
+        self.mqtt.disconnect()
+
+    def handle_disconnect(self, mqtt, userdata, *args):
+        super().handle_disconnect(mqtt, userdata, *args)
+        if self._stopping:
+            if self.disconnected is not None and not self.disconnected.done():
+                self.disconnected.set_result(True)
+            return
+        self._threadsafe(self._schedule_reconnect)
+
+    def _schedule_reconnect(self):
+        if self._stopping or self.reconnect_task is not None:
+            return
+        self.reconnect_task = self.loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        try:
+            while not self._stopping:
+                await asyncio.sleep(self.backoff.next())
+                try:
+                    await self.loop.run_in_executor(None, self.mqtt.reconnect)
+                    return
+                except OSError as e:
+                    print("MQTT reconnect failed: " + str(e))
+        finally:
+            self.reconnect_task = None
+
+    # paho calls these from whichever thread touched the socket (the
+    # executor during a connect, any thread that publishes); the
+    # loop's reader/writer registry may only be changed on the loop.
+
+    def _threadsafe(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self._threadsafe(self._watch, client, sock.fileno())
+
+    def on_socket_close(self, client, userdata, sock):
+        self._threadsafe(self._unwatch)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self._threadsafe(self._set_writer, client, True)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self._threadsafe(self._set_writer, client, False)
+
+    # The fd is remembered because paho has already closed the socket
+    # by the time _unwatch() runs on the loop.
+
+    def _watch(self, client, fd):
+        self.fd = fd
+        self.loop.add_reader(fd, client.loop_read)
+        if client.want_write():
+            self.loop.add_writer(fd, client.loop_write)
+        if self.misc_task is None:
+            self.misc_task = self.loop.create_task(self.misc_loop())
+
+    def _unwatch(self):
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.loop.remove_writer(self.fd)
+            self.fd = None
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+            self.misc_task = None
+
+    def _set_writer(self, client, wanted):
+        if self.fd is None:
+            return
+        try:
+            if wanted:
+                self.loop.add_writer(self.fd, client.loop_write)
+            else:
+                self.loop.remove_writer(self.fd)
+        except OSError:
+            # Closed meanwhile; the queued _unwatch() cleans up.
+            pass
+
+    async def misc_loop(self):
+        while self.mqtt.loop_misc() == MQTT_ERR_SUCCESS:
+            self.tick()
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+
+class AsyncFarmbot(Farmbot):
+    """
+    asyncio-native FarmBot client. All MQTT I/O runs on the event loop
+    that called `connect()`, so ASGI consumers and async views can use
+    it without thread hops:
+
+        bot = await AsyncFarmbot.login(email, password, server)
+        await bot.connect(handler)
+        await bot.move_absolute(100, 100, 0)
+
+    Every command method publishes immediately and returns a
+    `PendingCommand`; awaiting it waits for the device's answer.
+    """
+
+    connection_class = AsyncFarmbotConnection
+
+    @classmethod
+    async def login(cls,
+                    email,
+                    password,
+                    server="https://my.farm.bot",
+                    cache=None):
+        loop = asyncio.get_running_loop()
+        login = super().login
+        # Token download and cache I/O are blocking; keep them off-loop.
+        return await loop.run_in_executor(None, login, email, password,
+                                          server, cache)
+
+    async def connect(self, handler):
+        """
+        Attach to the running event loop and connect to the MQTT broker.
+        Returns once the socket is open (or the first attempt failed and
+        a retry is scheduled); `handler.on_connect` fires when the broker
+        accepts the session, again after every reconnect. Handler
+        callbacks may be plain functions or coroutines.
+        """
+        self._handler = AsyncHandler(handler, asyncio.get_running_loop())
+        await self._connection.start_connection()
+
+    async def wait_closed(self):
+        """
+        Wait until the MQTT session ends with `disconnect()`; dropped
+        connections are reconnected instead.
+        """
+        await self._connection.disconnected
+
+    async def wait_until_position(self, x, y, z, tolerance=1.0,
+                                  timeout=60.0, label=None):
+        """
+        Coroutine version of `Farmbot.wait_until_position()`.
+        """
+        loop = asyncio.get_running_loop()
+        arrived = loop.create_future()
+        target = (x, y, z)
+
+        def done():
+            if not arrived.done():
+                arrived.set_result(True)
+
+        def check(_changes=None):
+            position = self.state_tree.get("location_data.position") or {}
+            for axis, goal in zip("xyz", target):
+                actual = position.get(axis)
+                if goal is None:
+                    continue
+                if actual is None or abs(actual - goal) > tolerance:
+                    return
+            loop.call_soon_threadsafe(done)
+
+        future = label and self._connection.future(label)
+        if future is not None:
+            future.add_done_callback(
+                lambda _f: loop.call_soon_threadsafe(done))
+        self.subscribe("location_data.position", check)
+        try:
+            check()
+            await asyncio.wait_for(arrived, timeout)
+        finally:
+            self.unsubscribe("location_data.position", check)
+        if future is not None and future.done():
+            return self._connection.wait_for(label, 0)
+        return True
+
+    async def move_absolute_and_wait(self, x, y, z, speed=100.0,
+                                     tolerance=1.0, timeout=60.0):
+        command = self.move_absolute(x, y, z, speed)
+        if command is None:
+            # Queued: nothing moves until the batch is sent
+            raise RuntimeError(
+                "move_absolute_and_wait() cannot be used inside batch()")
+        return await self.wait_until_position(x, y, z, tolerance, timeout,
+                                              command.label)
+
+    def _do_cs(self, kind, args, body=[]):
+        label = super()._do_cs(kind, args, body)
+        if label is None:
+            # Queued inside a batch(); await the batch instead.
+            return None
+        return PendingCommand(self, label)
+
+    def _send_now(self, kind, args, body=[]):
+        return PendingCommand(self, super()._send_now(kind, args, body))
@@ -0,0 +1,76 @@
+"""
+JSON codecs for the MQTT hot path.
+
+Every status, log and RPC reply is decoded on the paho callback thread,
+so the fastest installed JSON library is picked at import time:
+orjson, then ujson, then the standard library. Set FARMBOT_JSON_CODEC
+to force one (e.g. for benchmarking).
+"""
+import json
+import os
+
+
+class Codec():
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        # `dumps` may return str or bytes; paho publishes either.
+        self.dumps = dumps
+
+    def __repr__(self):
+        return "<Codec " + self.name + ">"
+
+
+def _json_codec():
+    return Codec("json", json.loads, lambda obj: json.dumps(obj))
+
+
+def _orjson_codec():
+    import orjson
+    return Codec("orjson", orjson.loads, orjson.dumps)
+
+
+def _ujson_codec():
+    import ujson
+    return Codec("ujson", ujson.loads,
+                 lambda obj: ujson.dumps(obj, ensure_ascii=False))
+
+
+CODECS = {
+    "orjson": _orjson_codec,
+    "ujson": _ujson_codec,
+    "json": _json_codec,
+}
+
+
+def get_codec(name=None):
+    """
+    Return the named codec, or the fastest one installed when `name` is
+    None. Raises ImportError if an explicitly requested library is not
+    available.
+    """
+    if name is not None:
+        return CODECS[name]()
+    for factory in CODECS.values():
+        try:
+            return factory()
+        except ImportError:
+            continue
+    return _json_codec()
+
+
+def available_codecs():
+    """
+    Names of every codec that can be loaded in this environment.
+    """
+    names = []
+    for name, factory in CODECS.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+default_codec = get_codec(os.getenv("FARMBOT_JSON_CODEC") or None)
@@ -1,8 +1,27 @@
-import paho.mqtt.client as mqtt
-from urllib.request import urlopen, Request
+from paho.mqtt.client import Client, MQTT_ERR_SUCCESS
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+import asyncio
 import json
+import random
+import threading
+import time
 import uuid
 
+from farmlib.codec import default_codec
+from farmlib.httpclient import web_client
+from farmlib.latency import LatencyProbe
+from farmlib.state import StateTree
+from farmlib.telemetry import TelemetryRecorder
+
+# How long (in seconds) an RPC may stay unanswered before its
+# future is failed with a TimeoutError and dropped from the table.
+DEFAULT_RPC_TIMEOUT = 60.0
+# How many reaped RPCs are remembered for late wait_for() calls.
+MAX_REAPED = 256
+
 
 class OkResponse():
     def __init__(self, id):
@@ -15,10 +34,113 @@ class ErrorResponse():
         self.id = id
 
 
+class RpcError(Exception):
+    """
+    Raised when waiting on an RPC that the device answered with
+    `rpc_error`. The original `ErrorResponse` is kept on `.response`.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        super().__init__("; ".join(response.errors) or "RPC error")
+
+
+class PendingRpc():
+    """
+    One entry in the pending RPC table: a future that is resolved
+    when the device replies with a matching CeleryScript label.
+    """
+
+    def __init__(self, label, timeout):
+        self.label = label
+        self.future = Future()
+        self.sent_at = time.monotonic()
+        self.deadline = self.sent_at + timeout
+
+
+class RpcWindowFull(Exception):
+    """
+    Raised by `send_rpc()` when the in-flight window is full and the
+    policy is "reject" (or a "block" wait ran out of time).
+    """
+
+
+class RpcStats():
+    """
+    Counters for the RPC path: window depth, outcomes and the time
+    from publish to `rpc_ok`/`rpc_error`.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.ok = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.peak_in_flight = 0
+        self.ack_count = 0
+        self.ack_total = 0.0
+        self.ack_max = 0.0
+        self.ack_last = 0.0
+
+    def record_ack(self, seconds):
+        self.ack_count += 1
+        self.ack_total += seconds
+        self.ack_last = seconds
+        self.ack_max = max(self.ack_max, seconds)
+
+    def as_dict(self, in_flight=0, max_in_flight=None):
+        avg = self.ack_total / self.ack_count if self.ack_count else 0.0
+        return {
+            "in_flight": in_flight,
+            "max_in_flight": max_in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "sent": self.sent,
+            "ok": self.ok,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "blocked": self.blocked,
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "ack_latency_ms": {
+                "avg": round(avg * 1000, 1),
+                "max": round(self.ack_max * 1000, 1),
+                "last": round(self.ack_last * 1000, 1),
+            },
+        }
+
+
+class Backoff():
+    """
+    Jittered exponential backoff for reconnect attempts: the n-th delay
+    is drawn uniformly from [cap_n / 2, cap_n] where
+    cap_n = min(maximum, base * 2**n), so a fleet of clients that lost
+    the broker at the same moment does not reconnect in lockstep.
+    """
+
+    def __init__(self, base=1.0, maximum=60.0):
+        self.base = base
+        self.maximum = maximum
+        self.attempt = 0
+
+    def next(self):
+        cap = min(self.maximum, self.base * (2 ** self.attempt))
+        self.attempt += 1
+        return random.uniform(cap / 2, cap)
+
+    def reset(self):
+        self.attempt = 0
+
+
 class FarmbotConnection():
-    def __init__(self, bot, mqtt=mqtt.Client()):
+    # Called to build a fresh MQTT client for every connection.
+    client_factory = Client
+
+    def __init__(self, bot, mqtt=None):
         self.bot = bot
-        self.mqtt = mqtt
+        self.mqtt = mqtt if mqtt is not None else self.client_factory()
         u = bot.username
         self.mqtt.username_pw_set(u, bot.password)
         # bot/device_000/from_clients
@@ -32,32 +154,106 @@ class FarmbotConnection():
         self.logs_chan = "bot/" + u + "/logs"
         self.incoming_chan = "bot/" + u + "/from_device"
         self.outgoing_chan = "bot/" + u + "/from_clients"
+        self.ping_prefix = "bot/" + u + "/ping/"
+        self.pong_prefix = "bot/" + u + "/pong/"
         self.channels = (
             self.status_chan,
             self.logs_chan,
-            self.incoming_chan
+            self.incoming_chan,
+            self.pong_prefix + "#"
         )
+        # label => PendingRpc, for every RPC sent but not yet waited on.
+        self.pending = {}
+        # label => PendingRpc for the latest entries reaped unanswered,
+        # so a late wait_for() still gets its TimeoutError.
+        self.reaped = OrderedDict()
+        self.pending_lock = threading.Lock()
+        self.rpc_timeout = DEFAULT_RPC_TIMEOUT
+        self._next_reap = 0.0
+        # In-flight window: RPCs published but not yet answered. None
+        # means unbounded. When full, "block" waits (up to
+        # window_timeout seconds) and "reject" raises RpcWindowFull.
+        self.max_in_flight = None
+        self.window_policy = "block"
+        self.window_timeout = None
+        self.in_flight = 0
+        self.window = threading.Condition()
+        self.stats = RpcStats()
+        self._network_thread = None
+        self.latency = LatencyProbe(self)
+        # JSON library used for everything on the MQTT path.
+        self.codec = default_codec
+        self.backoff = Backoff()
+        self.connected = threading.Event()
+        self._stopping = False
 
     def start_connection(self):
+        """
+        Connect and service the socket on the calling thread until
+        `stop_connection()`. Dropped connections (and failed attempts)
+        are retried with jittered exponential backoff; every successful
+        connect resubscribes and re-reads the device status.
+        """
         # Attach event handlers:
         self.mqtt.on_connect = self.handle_connect
         self.mqtt.on_message = self.handle_message
+        self.mqtt.on_disconnect = self.handle_disconnect
+        self._stopping = False
+        first_attempt = True
 
-        # Finally, connect to the server:
-        self.mqtt.connect(self.bot.hostname, 1883, 60)
-
-        self.mqtt.loop_forever()
+        while not self._stopping:
+            try:
+                if first_attempt:
+                    # Finally, connect to the server:
+                    self.mqtt.connect(self.bot.hostname, self.bot.mqtt_port, 60)
+                else:
+                    self.mqtt.reconnect()
+            except OSError as e:
+                print("MQTT connect failed: " + str(e))
+            else:
+                rc = MQTT_ERR_SUCCESS
+                while not self._stopping and rc == MQTT_ERR_SUCCESS:
+                    rc = self.mqtt.loop(1.0)
+                    self.tick()
+            first_attempt = False
+            if not self._stopping:
+                time.sleep(self.backoff.next())
 
     def stop_connection(self):
+        self._stopping = True
         self.mqtt.disconnect()
 
+    def tick(self):
+        """
+        Periodic housekeeping, called by whichever network loop drives
+        this connection roughly once a second.
+        """
+        self.reap_stale()
+        self.latency.tick()
+
     def handle_connect(self, mqtt, userdata, flags, rc):
+        self._network_thread = threading.get_ident()
+        if rc != 0:
+            # Refused (bad credentials, broker not ready...). The
+            # broker drops us and the supervisor retries after a delay.
+            print("MQTT connection refused: " + str(rc))
+            return
+        self.backoff.reset()
+        self.connected.set()
         for channel in self.channels:
             mqtt.subscribe(channel)
         self.bot.read_status()
         self.bot._handler.on_connect(self.bot, mqtt)
 
+    def handle_disconnect(self, mqtt, userdata, rc, *args):
+        self.connected.clear()
+        # Older handlers predate this hook.
+        on_disconnect = getattr(self.bot._handler, "on_disconnect", None)
+        if on_disconnect is not None:
+            on_disconnect(self.bot, rc)
+
     def handle_message(self, mqtt, userdata, msg):
+        self._network_thread = threading.get_ident()
         if msg.topic == self.status_chan:
             self.handle_status(msg)
 
@@ -67,30 +263,43 @@ class FarmbotConnection():
         if msg.topic == self.incoming_chan:
             self.unpack_response(msg.payload)
 
+        if msg.topic.startswith(self.pong_prefix):
+            self.latency.record_pong(msg.topic[len(self.pong_prefix):])
+
     def unpack_response(self, payload):
-        resp = json.loads(payload)
+        resp = self.codec.loads(payload)
         kind = resp["kind"]
         label = resp["args"]["label"]
         if kind == "rpc_ok":
             self.handle_resp(label)
         if kind == "rpc_error":
             self.handle_error(label, resp["body"] or [])
+        self.reap_stale()
 
     def handle_resp(self, label):
         # {
         #   'kind': 'rpc_ok',
         #   'args': { 'label': 'fd0ee7c9-6ca8-11eb-9d9d-eba70539ce61' },
         # }
-        self.bot._handler.on_response(self.bot, OkResponse(label))
+        response = OkResponse(label)
+        self.resolve(label, response)
+        self.bot._handler.on_response(self.bot, response)
         return
 
     def handle_status(self, msg):
-        self.bot.state = json.loads(msg.payload)
-        self.bot._handler.on_change(self.bot, self.bot.state)
+        state = self.codec.loads(msg.payload)
+        self.bot.state = state
+        if self.bot.telemetry is not None:
+            self.bot.telemetry.record(state)
+        # Path subscribers are notified from inside update(); the
+        # catch-all handler only hears about publishes that changed
+        # something.
+        if self.bot.state_tree.update(state):
+            self.bot._handler.on_change(self.bot, state)
         return
 
     def handle_log(self, msg):
-        log = json.loads(msg.payload)
+        log = self.codec.loads(msg.payload)
         self.bot._handler.on_log(self.bot, log)
         return
 
@@ -109,23 +318,259 @@ class FarmbotConnection():
             args = error["args"] or {"message": "No message provided"}
             message = args["message"]
             tidy_errors.append(message)
-        self.bot._handler.on_error(self.bot, ErrorResponse(label, tidy_errors))
+        response = ErrorResponse(label, tidy_errors)
+        self.resolve(label, response)
+        self.bot._handler.on_error(self.bot, response)
         return
 
-    def send_rpc(self, rpc):
+    def send_rpc(self, rpc, timeout=None, bypass_window=False):
+        """
+        Publish an `rpc_request` and return its label. A future is
+        registered under the label *before* publishing so that a fast
+        reply can never race past it; use `wait_for()` or
+        `wait_for_async()` to block on the device's answer.
+
+        With `bypass_window` the RPC is published at once even when the
+        in-flight window is full (and does not take a slot), e.g. for
+        the emergency stop.
+        """
         label = str(uuid.uuid1())
         message = {"kind": "rpc_request", "args": {"label": label}}
         if isinstance(rpc, list):
             message["body"] = rpc
         else:
             message["body"] = [rpc]
-        payload = json.dumps(message)
+        payload = self.codec.dumps(message)
+        self.reap_stale()
+        if bypass_window:
+            with self.window:
+                self.stats.sent += 1
+        else:
+            self._acquire_slot()
+        entry = PendingRpc(label, timeout or self.rpc_timeout)
+        entry.future.add_done_callback(
+            lambda future: self._release_slot(entry, future,
+                                              not bypass_window))
+        with self.pending_lock:
+            self.pending[label] = entry
         self.mqtt.publish(self.outgoing_chan, payload)
         return label
 
+    def _acquire_slot(self):
+        with self.window:
+            limit = self.max_in_flight
+            # Never block the network thread (e.g. read_status from
+            # handle_connect): it is the one that frees slots.
+            if (limit is not None and self.in_flight >= limit
+                    and threading.get_ident() != self._network_thread):
+                if self.window_policy == "reject":
+                    self.stats.rejected += 1
+                    raise RpcWindowFull("%d RPCs already in flight"
+                                        % self.in_flight)
+                self.stats.blocked += 1
+                started = time.monotonic()
+                deadline = started + (self.window_timeout or self.rpc_timeout)
+                while (self.max_in_flight is not None
+                       and self.in_flight >= self.max_in_flight):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats.blocked_seconds += (time.monotonic()
+                                                       - started)
+                        self.stats.rejected += 1
+                        raise RpcWindowFull(
+                            "Timed out waiting for a free slot")
+                    self.window.wait(min(remaining, 1.0))
+                    # Unanswered RPCs past their deadline free their
+                    # slot here even if no other traffic triggers a reap.
+                    self.reap_stale()
+                self.stats.blocked_seconds += time.monotonic() - started
+            self.in_flight += 1
+            self.stats.sent += 1
+            self.stats.peak_in_flight = max(self.stats.peak_in_flight,
+                                            self.in_flight)
+
+    def _release_slot(self, entry, future, held=True):
+        with self.window:
+            if held:
+                self.in_flight -= 1
+            if future.cancelled():
+                # The waiter gave up; the device may still answer.
+                self.stats.timeouts += 1
+            elif isinstance(future.exception(), RpcError):
+                self.stats.errors += 1
+                self.stats.record_ack(time.monotonic() - entry.sent_at)
+            elif future.exception() is not None:
+                self.stats.timeouts += 1
+            else:
+                self.stats.ok += 1
+                self.stats.record_ack(time.monotonic() - entry.sent_at)
+            self.window.notify()
+
+    def rpc_stats(self):
+        """
+        Snapshot of the in-flight window and ack latency counters.
+        """
+        with self.window:
+            return self.stats.as_dict(self.in_flight, self.max_in_flight)
+
+    def resolve(self, label, response):
+        """
+        Complete the future registered for `label`. The entry stays in
+        the table until somebody waits on it or it goes stale, so a
+        reply that arrives before `wait_for()` is called is not lost.
+        """
+        with self.pending_lock:
+            entry = self.pending.get(label)
+        if entry is None:
+            return
+        try:
+            if isinstance(response, ErrorResponse):
+                entry.future.set_exception(RpcError(response))
+            else:
+                entry.future.set_result(response)
+        except InvalidStateError:
+            # Already timed out or cancelled by a waiter that gave up.
+            pass
+
+    def future(self, label):
+        """
+        Return the `concurrent.futures.Future` for an RPC label, or
+        None if the label is unknown (never sent, already waited on or
+        reaped long ago).
+        """
+        with self.pending_lock:
+            entry = self.pending.get(label) or self.reaped.get(label)
+        return entry and entry.future
+
+    def _entry(self, label):
+        """
+        The table entry a waiter should use: pending, or recently reaped
+        (its future already failed with TimeoutError).
+        """
+        with self.pending_lock:
+            entry = self.pending.get(label) or self.reaped.pop(label, None)
+        if entry is None:
+            raise KeyError("No pending RPC with label " + str(label))
+        return entry
+
+    def wait_for(self, label, timeout=None):
+        """
+        Block until the device answers the RPC sent as `label`.
+        Returns the `OkResponse`, raises `RpcError` on `rpc_error` and
+        `TimeoutError` if neither arrives within `timeout` seconds
+        (or the RPC's own deadline, whichever comes first).
+        """
+        entry = self._entry(label)
+        remaining = entry.deadline - time.monotonic()
+        if timeout is not None:
+            remaining = min(remaining, timeout)
+        try:
+            return entry.future.result(timeout=max(remaining, 0))
+        finally:
+            self._forget(label)
+
+    async def wait_for_async(self, label, timeout=None):
+        """
+        asyncio flavour of `wait_for()`. The paho thread resolves the
+        underlying future; the result is handed to the running loop.
+        """
+        entry = self._entry(label)
+        remaining = entry.deadline - time.monotonic()
+        if timeout is not None:
+            remaining = min(remaining, timeout)
+        waiter = asyncio.wrap_future(entry.future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter),
+                                          max(remaining, 0))
+        finally:
+            self._forget(label)
+
+    def reap_stale(self, now=None):
+        """
+        Drop table entries past their deadline, failing the ones that
+        never got an answer. Runs at most once a second.
+        """
+        now = now or time.monotonic()
+        with self.pending_lock:
+            if now < self._next_reap:
+                return
+            self._next_reap = now + 1.0
+            stale = [e for e in self.pending.values() if e.deadline <= now]
+            for entry in stale:
+                del self.pending[entry.label]
+                self.reaped[entry.label] = entry
+            while len(self.reaped) > MAX_REAPED:
+                self.reaped.popitem(last=False)
+        for entry in stale:
+            try:
+                entry.future.set_exception(
+                    TimeoutError("RPC " + entry.label + " timed out"))
+            except InvalidStateError:
+                pass
+
+    def _forget(self, label):
+        with self.pending_lock:
+            entry = self.pending.pop(label, None)
+        if entry is not None and not entry.future.done():
+            entry.future.cancel()
+
+
+class RpcBatch():
+    """
+    Collects CeleryScript nodes while active and sends them as the
+    body of a single `rpc_request` on exit. The device runs the nodes
+    in order and answers once, so the whole batch shares one label and
+    one completion future:
+
+        with bot.batch() as batch:
+            bot.move_absolute(0, 0, 0)
+            bot.write_pin(8, 1)
+            bot.wait(5000)
+            bot.write_pin(8, 0)
+        batch.wait_for()
+
+    Nothing is sent if the block raises.
+    """
+
+    def __init__(self, bot, timeout=None):
+        self.bot = bot
+        self.timeout = timeout
+        self.nodes = []
+        self.label = None
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = getattr(self.bot._local, "batch", None)
+        self.bot._local.batch = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.bot._local.batch = self._outer
+        if exc_type is None and self.nodes:
+            self.label = self.bot._connection.send_rpc(self.nodes,
+                                                       self.timeout)
+        return False
+
+    def add(self, node):
+        self.nodes.append(node)
+
+    def wait_for(self, timeout=None):
+        """
+        Block until the device has run every node in the batch.
+        """
+        if self.label is None:
+            return None
+        return self.bot.wait_for(self.label, timeout)
+
+    async def wait_for_async(self, timeout=None):
+        if self.label is None:
+            return None
+        return await self.bot.wait_for_async(self.label, timeout)
+
 
 class StubHandler:
     def on_connect(self, bot, client): pass
+    def on_disconnect(self, bot, rc): pass
     def on_change(self, bot, state): pass
     def on_log(self, _bot, log): pass
     def on_error(self, _bot, _response): pass
@@ -140,14 +585,23 @@ class FarmbotToken():
         """
         Returns a byte stream representation of the
         """
-        req = Request(server + "/api/tokens")
-        req.add_header("Content-Type", "application/json")
         data = {"user": {"email": email, "password": password}}
-        string = json.dumps(data)
-        as_bytes = str.encode(string)
-        response = urlopen(req, as_bytes)
+        response = web_client.post(server + "/api/tokens", json=data)
+        response.raise_for_status()
+
+        return response.content
+
+    @staticmethod
+    def refresh_token(jwt, server="https://my.farm.bot"):
+        """
+        Trade a still-valid token for a fresh one without needing the
+        account password. Returns the same format as `download_token`.
+        """
+        response = web_client.get(server + "/api/tokens",
+                                  headers={"Authorization": "Bearer " + jwt})
+        response.raise_for_status()
 
-        return response.read()
+        return response.content
 
     def __init__(self, raw_token):
         token_data = json.loads(raw_token)
@@ -166,6 +620,107 @@ class FarmbotToken():
         self.vhost = token["vhost"]
 
 
+class TokenCache():
+    """
+    Keeps raw tokens in a small JSON file (mode 0600) so restarts and
+    reconnects can skip the HTTP login while the token is still valid.
+    Entries are keyed by server and account email.
+    """
+
+    def __init__(self, path, min_ttl=300):
+        self.path = path
+        # Tokens expiring sooner than this (seconds) are not reused.
+        self.min_ttl = min_ttl
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(email, server):
+        return server + "|" + (email or "")
+
+    def load(self, key):
+        """
+        Return the cached raw token for `key`, or None if there is none
+        or it is about to expire.
+        """
+        entry = self._read().get(key)
+        if entry is None:
+            return None
+        if entry["exp"] - time.time() < self.min_ttl:
+            return None
+        return entry["raw_token"]
+
+    def save(self, key, raw_token):
+        if isinstance(raw_token, bytes):
+            raw_token = raw_token.decode()
+        token = FarmbotToken(raw_token)
+        with self._lock:
+            entries = self._read()
+            entries[key] = {"raw_token": raw_token,
+                            "exp": token.exp,
+                            "iat": token.iat}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".token")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+class TokenRefresher():
+    """
+    Background timer that swaps a bot's token for a fresh one shortly
+    before it expires, updating the MQTT credentials used on the next
+    (re)connect and the token cache, if any. Failed refreshes are
+    retried every `retry` seconds.
+    """
+
+    def __init__(self, bot, server, cache=None, key=None, margin=3600,
+                 retry=60, on_refresh=None):
+        self.bot = bot
+        self.on_refresh = on_refresh
+        self.server = server
+        self.cache = cache
+        self.key = key
+        self.margin = margin
+        self.retry = retry
+        self._timer = None
+
+    def start(self):
+        self._schedule(self.bot.token.exp - self.margin - time.time())
+        return self
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def _schedule(self, delay):
+        self._timer = threading.Timer(max(delay, 0), self._refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh(self):
+        try:
+            raw_token = FarmbotToken.refresh_token(self.bot.password,
+                                                   self.server)
+            self.bot.update_token(raw_token)
+            if self.cache is not None:
+                self.cache.save(self.key, raw_token)
+            if self.on_refresh is not None:
+                self.on_refresh(self.bot)
+        except Exception as e:
+            print("Token refresh failed: " + str(e))
+            self._schedule(self.retry)
+            return
+        self.start()
+
+
 empty_xyz = {"x": None, "y": None, "z": None}
 zero_xyz = {"x": 0, "y": 0, "z": 0}
 
@@ -198,25 +753,43 @@ class Farmbot():
     def login(cls,
               email,
               password,
-              server="https://my.farm.bot"):
+              server="https://my.farm.bot",
+              cache=None):
         """
         We reccomend that users store tokens rather than passwords.
+        Pass a `TokenCache` to reuse a still-valid token instead of
+        logging in over HTTP.
         """
-        token = FarmbotToken.download_token(email=email,
-                                            password=password,
-                                            server=server)
-        return Farmbot(token)
+        key = TokenCache.key(email, server)
+        token = cache and cache.load(key)
+        if token is None:
+            token = FarmbotToken.download_token(email=email,
+                                                password=password,
+                                                server=server)
+            if cache is not None:
+                cache.save(key, token)
+        return cls(token)
+
+    # Subclasses may swap in a different transport (see AsyncFarmbot).
+    connection_class = FarmbotConnection
+    # The token only names the broker host; FarmBot's brokers listen on
+    # the standard MQTT port.
+    mqtt_port = 1883
 
     def __init__(self, raw_token):
         token = FarmbotToken(raw_token)
+        self.token = token
         self.username = token.bot
         self.password = token.jwt
         self.hostname = token.mqtt
         self.device_id = token.sub
         self._handler = StubHandler()
 
-        self._connection = FarmbotConnection(self)
+        self._connection = self.connection_class(self)
+        self._local = threading.local()
         self.state = empty_state()
+        self.state_tree = StateTree(self.state)
+        self.telemetry = None
 
     def connect(self, handler):
         """
@@ -228,6 +801,100 @@ class Farmbot():
     def disconnect(self):
         self._connection.stop_connection()
 
+    def set_rpc_window(self, max_in_flight, policy="block", timeout=None):
+        """
+        Limit how many RPCs may be awaiting an answer at once. With
+        policy "block" extra commands wait (up to `timeout` seconds) for
+        a slot; with "reject" they raise `RpcWindowFull` immediately.
+        Pass None to remove the limit.
+        """
+        if policy not in ("block", "reject"):
+            raise ValueError("policy must be 'block' or 'reject'")
+        connection = self._connection
+        with connection.window:
+            connection.max_in_flight = max_in_flight
+            connection.window_policy = policy
+            connection.window_timeout = timeout
+            connection.window.notify_all()
+
+    def rpc_stats(self):
+        """
+        In-flight depth, outcome counters and ack latency for RPCs sent
+        by this bot.
+        """
+        return self._connection.rpc_stats()
+
+    def start_latency_probe(self, interval=10.0, timeout=5.0):
+        """
+        Ping the device every `interval` seconds over MQTT and keep a
+        rolling histogram of broker <-> device round trips.
+        """
+        probe = self._connection.latency
+        probe.interval = interval
+        probe.timeout = timeout
+        probe.enabled = True
+        return probe
+
+    def stop_latency_probe(self):
+        self._connection.latency.enabled = False
+
+    def latency(self):
+        """
+        Round-trip percentiles (p50/p95/p99) from the latency probe.
+        """
+        return self._connection.latency.stats()
+
+    def record_telemetry(self, capacity=3600, recorder=None):
+        """
+        Append position, load, encoder and pin values from every status
+        publish to a `TelemetryRecorder` (columnar ring buffer of the
+        last `capacity` samples) and return it.
+        """
+        self.telemetry = recorder or TelemetryRecorder(capacity)
+        return self.telemetry
+
+    def update_token(self, raw_token):
+        """
+        Switch to a refreshed token for the same device. The new
+        credentials are used the next time the MQTT client connects.
+        """
+        token = FarmbotToken(raw_token)
+        self.token = token
+        self.password = token.jwt
+        self._connection.mqtt.username_pw_set(self.username, token.jwt)
+
+    def subscribe(self, path, callback):
+        """
+        Call `callback(changes)` whenever a status publish changes
+        something at or below a dotted state path, e.g.
+        `location_data.position` or `pins.59`.
+        """
+        return self.state_tree.subscribe(path, callback)
+
+    def unsubscribe(self, path, callback):
+        self.state_tree.unsubscribe(path, callback)
+
+    def wait_for(self, label, timeout=None):
+        """
+        Block until the RPC identified by `label` (as returned by any
+        command method) is acknowledged by the device.
+        Raises `RpcError` on `rpc_error` and `TimeoutError` on timeout.
+        """
+        return self._connection.wait_for(label, timeout)
+
+    async def wait_for_async(self, label, timeout=None):
+        """
+        Coroutine version of `wait_for()` for use inside an event loop.
+        """
+        return await self._connection.wait_for_async(label, timeout)
+
+    def future(self, label):
+        """
+        The `concurrent.futures.Future` behind an RPC label (None if
+        unknown), e.g. to attach a done callback instead of blocking.
+        """
+        return self._connection.future(label)
+
     def position(self):
         """
         Convinence method to return the bot's current location
@@ -239,16 +906,34 @@ class Farmbot():
         z = position["z"] or -0.0
         return (x, y, z)
 
+    def batch(self, timeout=None):
+        """
+        Context manager that groups every command issued on this thread
+        into one `rpc_request`. See `RpcBatch`.
+        """
+        return RpcBatch(self, timeout)
+
     def _do_cs(self, kind, args, body=[]):
         """
         This is a private helper that wraps CeleryScript in
         an `rpc` node and sends it to the device over MQTT.
+        Inside a `batch()` block the node is queued instead and
+        None is returned.
         """
-        return self._connection.send_rpc({
-            "kind": kind,
-            "args": args,
-            "body": body
-        })
+        node = {"kind": kind, "args": args, "body": body}
+        batch = getattr(self._local, "batch", None)
+        if batch is not None:
+            batch.add(node)
+            return None
+        return self._connection.send_rpc(node)
+
+    def _send_now(self, kind, args, body=[]):
+        """
+        `_do_cs()` for commands that must go out immediately: ignores
+        any active `batch()` and bypasses the in-flight window.
+        """
+        node = {"kind": kind, "args": args, "body": body}
+        return self._connection.send_rpc(node, bypass_window=True)
 
     def move_absolute(self, x, y, z, speed=100.0):
         """
@@ -260,6 +945,57 @@ class Farmbot():
             "offset": {"kind": "coordinate", "args": zero_xyz}
         })
 
+    def wait_until_position(self, x, y, z, tolerance=1.0, timeout=60.0,
+                            label=None):
+        """
+        Block until the reported position is within `tolerance` mm of
+        (x, y, z) on every axis, or the RPC `label` (if given) is
+        acknowledged, whichever happens first. Pass None for an axis to
+        ignore it. Raises `RpcError` as soon as the RPC fails and
+        `TimeoutError` if neither condition is met in time.
+        """
+        target = (x, y, z)
+        arrived = threading.Event()
+
+        def check(_changes=None):
+            position = self.state_tree.get("location_data.position") or {}
+            for axis, goal in zip("xyz", target):
+                actual = position.get(axis)
+                if goal is None:
+                    continue
+                if actual is None or abs(actual - goal) > tolerance:
+                    return
+            arrived.set()
+
+        future = label and self._connection.future(label)
+        if future is not None:
+            future.add_done_callback(lambda _f: arrived.set())
+        self.subscribe("location_data.position", check)
+        try:
+            check()
+            if not arrived.wait(timeout):
+                raise TimeoutError("Did not reach %s within %ss"
+                                   % (target, timeout))
+        finally:
+            self.unsubscribe("location_data.position", check)
+        if future is not None and future.done():
+            # Surfaces RpcError and drops the table entry.
+            return self._connection.wait_for(label, 0)
+        return True
+
+    def move_absolute_and_wait(self, x, y, z, speed=100.0, tolerance=1.0,
+                               timeout=60.0):
+        """
+        `move_absolute()` that returns once the bot has arrived (see
+        `wait_until_position()`) instead of immediately. Raises
+        RuntimeError inside a `batch()`, where the move is only queued.
+        """
+        label = self.move_absolute(x, y, z, speed)
+        if label is None:
+            raise RuntimeError(
+                "move_absolute_and_wait() cannot be used inside batch()")
+        return self.wait_until_position(x, y, z, tolerance, timeout, label)
+
     def send_message(self, msg, type="info"):
         """
         Send a log message.
@@ -267,19 +1003,27 @@ class Farmbot():
         return self._do_cs("send_message",
                            {"message": msg, "message_type": type, })
 
-    def emergency_lock(self):
+    def emergency_lock(self, now=True):
         """
         Perform an emergency stop, thereby preventing any
         motor movement until `emergency_unlock()` is called.
+        Sent straight away: never batched, never held back by the
+        in-flight window. Pass now=False to queue it like any other
+        command instead (e.g. as one step of a batched sequence).
         """
-        return self._do_cs("emergency_lock", {})
+        if not now:
+            return self._do_cs("emergency_lock", {})
+        return self._send_now("emergency_lock", {})
 
-    def emergency_unlock(self):
+    def emergency_unlock(self, now=True):
         """
         Unlock the Farmduino, allowing movement of previously
-        locked motors.
+        locked motors. Like `emergency_lock()`, it skips batches and
+        the in-flight window unless now=False.
         """
-        return self._do_cs("emergency_unlock", {})
+        if not now:
+            return self._do_cs("emergency_unlock", {})
+        return self._send_now("emergency_unlock", {})
 
     def find_home(self):
         """
@@ -309,6 +1053,13 @@ class Farmbot():
         """
         return self._do_cs("home", {"speed": speed, "axis": axis})
 
+    def wait(self, milliseconds):
+        """
+        Pause on the device for a number of milliseconds. Mostly useful
+        inside a `batch()` between other commands.
+        """
+        return self._do_cs("wait", {"milliseconds": milliseconds})
+
     def move_relative(self, x, y, z, speed=100):
         """
         Move to a relative XYZ offset from the device's current
@@ -330,7 +1081,7 @@ class Farmbot():
         logging in to the device, since the device pushes new states out on
         every update.
         """
-        self._do_cs("read_status", {})
+        return self._do_cs("read_status", {})
 
     def reboot(self):
         """
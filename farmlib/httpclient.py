@@ -0,0 +1,118 @@
+from urllib.parse import urlsplit
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from farmlib.latency import LatencyHistogram
+
+# (connect, read) seconds used when a call does not pass its own timeout
+DEFAULT_TIMEOUT = (5, 30)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Endpoints tracked separately; anything beyond is counted as "other"
+MAX_ENDPOINTS = 64
+
+
+def endpoint_key(method, url):
+    """
+    "GET my.farm.bot/api/images/:id" for "GET https://my.farm.bot/api/images/12":
+    path segments carrying digits (ids, hashed file names) collapse to :id
+    and the query string (e.g. a signed URL's signature) is dropped.
+    """
+    parts = urlsplit(url)
+    segments = [':id' if re.search(r'\d', s) else s for s in parts.path.split('/')]
+    return f"{method.upper()} {parts.netloc}{'/'.join(segments)}"
+
+
+class EndpointStats():
+    def __init__(self, window=500):
+        self.histogram = LatencyHistogram(window)
+        self.requests = 0
+        self.errors = 0
+        self.last_status = None
+
+    def summary(self):
+        summary = self.histogram.summary()
+        summary.update({
+            "requests": self.requests,
+            "errors": self.errors,
+            "last_status": self.last_status,
+        })
+        return summary
+
+
+class HttpClient():
+    """
+    One pooled, keep-alive `requests.Session` for all FarmBot Web App
+    traffic (login, token refresh, image listings and downloads), so
+    repeated calls skip the TCP/TLS handshake.
+
+    Every call gets a timeout (DEFAULT_TIMEOUT unless given) and
+    connection errors, 429 and 5xx answers are retried with exponential
+    backoff (idempotent methods only, plus connect errors for any method
+    since nothing was sent yet). Pass `stream=True` to read large bodies
+    in chunks; use the response as a context manager so the connection
+    goes back to the pool.
+
+    Latency is recorded per endpoint (see `endpoint_key`) as the time
+    until the response headers arrived, including retries.
+    """
+
+    def __init__(self, pool_size=16, retries=3, backoff=0.5, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      respect_retry_after_header=True, raise_on_status=False)
+        # pool_maxsize bounds the idle connections kept per host; it must
+        # cover the concurrent downloads (see api/mirror.py)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, timeout=None, **kwargs):
+        kwargs.setdefault('timeout', timeout or self.timeout)
+        key = endpoint_key(method, url)
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(key, time.monotonic() - started, None)
+            raise
+        self._record(key, time.monotonic() - started, response.status_code)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, key, seconds, status):
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= MAX_ENDPOINTS:
+                    key = 'other'
+                    stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = EndpointStats()
+            stats.requests += 1
+            stats.last_status = status
+            if status is None or status >= 400:
+                stats.errors += 1
+            else:
+                stats.histogram.add(seconds)
+
+    def stats(self):
+        """{endpoint: latency percentiles, request and error counts}"""
+        with self._lock:
+            return {key: stats.summary() for key, stats in sorted(self._stats.items())}
+
+
+web_client = HttpClient()
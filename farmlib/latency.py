@@ -0,0 +1,112 @@
+from collections import deque
+import threading
+import time
+
+
+class LatencyHistogram():
+    """
+    Rolling window of the last `size` round-trip samples (seconds)
+    with percentile lookups.
+    """
+
+    def __init__(self, size=500):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct, ordered=None):
+        ordered = ordered if ordered is not None else sorted(self.samples)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, int(round(pct / 100.0 *
+                                                (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": 0, "min_ms": None, "p50_ms": None,
+                    "p95_ms": None, "p99_ms": None, "max_ms": None}
+
+        def ms(value):
+            return round(value * 1000, 1)
+
+        return {
+            "count": len(ordered),
+            "min_ms": ms(ordered[0]),
+            "p50_ms": ms(self.percentile(50, ordered)),
+            "p95_ms": ms(self.percentile(95, ordered)),
+            "p99_ms": ms(self.percentile(99, ordered)),
+            "max_ms": ms(ordered[-1]),
+        }
+
+
+class LatencyProbe():
+    """
+    Measures broker <-> device round trips using FarmBot's ping/pong
+    topics: a message on `bot/<device>/ping/<id>` is echoed by FarmBot
+    OS on `bot/<device>/pong/<id>`.
+
+    The probe owns no thread. The connection's network loop calls
+    `tick()` about once a second and a ping goes out every `interval`
+    seconds; pongs that do not come back within `timeout` count as lost.
+    """
+
+    def __init__(self, connection, interval=10.0, timeout=5.0, window=500):
+        self.connection = connection
+        self.interval = interval
+        self.timeout = timeout
+        self.enabled = False
+        self.histogram = LatencyHistogram(window)
+        self.sent = 0
+        self.lost = 0
+        self.last_rtt = None
+        self._outstanding = {}
+        self._next_ping = 0.0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def tick(self, now=None):
+        if not self.enabled or not self.connection.connected.is_set():
+            return
+        now = now or time.monotonic()
+        with self._lock:
+            expired = [k for k, sent in self._outstanding.items()
+                       if now - sent > self.timeout]
+            for key in expired:
+                del self._outstanding[key]
+            self.lost += len(expired)
+            if now < self._next_ping:
+                return
+            self._next_ping = now + self.interval
+            self._seq += 1
+            key = str(self._seq)
+            self._outstanding[key] = now
+            self.sent += 1
+        self.connection.mqtt.publish(self.connection.ping_prefix + key, key)
+
+    def record_pong(self, key, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            sent = self._outstanding.pop(key, None)
+            if sent is None:
+                return None
+            rtt = now - sent
+            self.last_rtt = rtt
+            self.histogram.add(rtt)
+        return rtt
+
+    def stats(self):
+        with self._lock:
+            summary = self.histogram.summary()
+            summary.update({
+                "enabled": self.enabled,
+                "interval_s": self.interval,
+                "sent": self.sent,
+                "lost": self.lost,
+                "outstanding": len(self._outstanding),
+                "last_ms": (round(self.last_rtt * 1000, 1)
+                            if self.last_rtt is not None else None),
+            })
+        return summary
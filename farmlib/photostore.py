@@ -0,0 +1,97 @@
+import hashlib
+import os
+import tempfile
+
+# Where photos are kept: farm_images/ in the project root (BASE_DIR),
+# whatever the working directory of the process
+FARM_IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'farm_images')
+
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+
+def sniff_extension(head, content_type=None):
+    """File extension from the first bytes, falling back to the Content-Type"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith(b'\x89PNG'):
+        return '.png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    if head.startswith(b'GIF8'):
+        return '.gif'
+    return EXTENSIONS.get((content_type or '').split(';')[0].strip(), '.jpg')
+
+
+class PhotoStore():
+    """
+    Content-addressed photo files: each image is stored once as
+    <root>/<sha256[:2]>/<sha256>.<ext>, so capturing the same picture twice
+    costs no extra space and a file's name never changes meaning.
+    """
+
+    def __init__(self, root=FARM_IMAGES):
+        self.root = os.path.abspath(root)
+
+    def name(self, digest, extension):
+        """Path of a file relative to the root, as kept in Photo.image_path"""
+        return f'{digest[:2]}/{digest}{extension}'
+
+    def path(self, name):
+        """Absolute path of a file from its name relative to the root"""
+        return os.path.join(self.root, *name.split('/'))
+
+    def save(self, chunks, content_type=None):
+        """
+        Write an iterable of byte chunks, hashing as it goes, without
+        holding the whole image in memory. Returns {"path" (relative to
+        the root), "file" (absolute), "sha256", "size", "content_type",
+        "duplicate"}.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        fd, partial = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            extension = sniff_extension(head, content_type)
+            sha256 = digest.hexdigest()
+            name = self.name(sha256, extension)
+            target = self.path(name)
+            duplicate = os.path.exists(target)
+            if duplicate:
+                os.remove(partial)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(partial, target)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        content_type = next(
+            (kind for kind, ext in EXTENSIONS.items() if ext == extension), 'image/jpeg'
+        )
+        return {
+            'path': name,
+            'file': target,
+            'sha256': sha256,
+            'size': size,
+            'content_type': content_type,
+            'duplicate': duplicate,
+        }
+
+
+photo_store = PhotoStore()
@@ -0,0 +1,253 @@
+import selectors
+import socket
+import threading
+import time
+
+
+class FarmbotPool():
+    """
+    Runs the MQTT sockets of many `Farmbot`s on a single selector
+    thread instead of one `loop_forever()` thread per device:
+
+        pool = FarmbotPool()
+        pool.add(Farmbot(token_a), handler_a)
+        pool.add(Farmbot(token_b), handler_b)
+
+    Each bot keeps its own paho client (and session); the pool only
+    owns the network loop. Handler callbacks for every bot run on the
+    pool thread, so they must not block.
+
+    A bot stays supervised until `remove()`: if its connection drops
+    (or the first connect fails) it is reconnected with the bot's
+    jittered exponential backoff. Reconnects run on short-lived helper
+    threads so one unreachable broker never stalls the other bots.
+    """
+
+    def __init__(self, misc_interval=1.0):
+        self.misc_interval = misc_interval
+        self.selector = selectors.DefaultSelector()
+        # device username => Farmbot; one bot per device
+        self.bots = {}
+        self._socks = {}
+        self._masks = {}
+        # client => Farmbot, and client => monotonic reconnect due time
+        self._clients = {}
+        self._reconnects = {}
+        self._ops = []
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = None
+        self._running = False
+
+    def add(self, bot, handler):
+        """
+        Connect `bot` to its broker and start servicing it on the pool
+        thread. The TCP connect happens on the calling thread. Raises
+        ValueError if the pool already has a bot for the same device.
+        """
+        connection = bot._connection
+        client = connection.mqtt
+        bot._handler = handler
+        client.on_connect = connection.handle_connect
+        client.on_message = connection.handle_message
+        client.on_disconnect = connection.handle_disconnect
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_write
+        client.on_socket_unregister_write = self._on_socket_write
+        with self._lock:
+            if bot.username in self.bots:
+                raise ValueError("Pool already has a bot for " + bot.username)
+            self.bots[bot.username] = bot
+            self._clients[client] = bot
+        self.start()
+        try:
+            client.connect(bot.hostname, bot.mqtt_port, 60)
+        except OSError as e:
+            print("MQTT connect failed for " + bot.username + ": " + str(e))
+            self._schedule_reconnect(client)
+        return bot
+
+    def remove(self, bot):
+        """
+        Disconnect `bot` and stop servicing it.
+        """
+        client = bot._connection.mqtt
+        with self._lock:
+            self.bots.pop(bot.username, None)
+            self._clients.pop(client, None)
+            self._reconnects.pop(client, None)
+        bot._connection.stop_connection()
+
+    def get(self, username):
+        with self._lock:
+            return self.bots.get(username)
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                                            name="farmbot-pool",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Disconnect every bot and end the pool thread.
+        """
+        with self._lock:
+            bots = list(self.bots.values())
+        for bot in bots:
+            self.remove(bot)
+        self._running = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # paho socket callbacks; these can fire on any thread, so they
+    # only queue work for the pool thread and wake it up.
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._queue(("open", client, sock))
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._queue(("close", client, sock))
+
+    def _on_socket_write(self, client, userdata, sock):
+        self._wake()
+
+    def _queue(self, op):
+        with self._lock:
+            self._ops.append(op)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _apply_ops(self):
+        with self._lock:
+            ops, self._ops = self._ops, []
+        for kind, client, sock in ops:
+            if kind == "open":
+                self._socks[client] = sock
+                self._masks[client] = selectors.EVENT_READ
+                self.selector.register(sock, selectors.EVENT_READ, client)
+            elif self._socks.get(client) is sock:
+                del self._socks[client]
+                del self._masks[client]
+                try:
+                    self.selector.unregister(sock)
+                except (KeyError, ValueError):
+                    pass
+                self._schedule_reconnect(client)
+
+    def _schedule_reconnect(self, client):
+        with self._lock:
+            bot = self._clients.get(client)
+            if bot is None:
+                # Removed on purpose; let it go.
+                return
+            delay = bot._connection.backoff.next()
+            self._reconnects[client] = time.monotonic() + delay
+        self._wake()
+
+    def _due_reconnects(self, now):
+        with self._lock:
+            due = [c for c, at in self._reconnects.items() if at <= now]
+            for client in due:
+                del self._reconnects[client]
+            upcoming = min(self._reconnects.values(), default=None)
+        return due, upcoming
+
+    def _reconnect(self, client):
+        try:
+            client.reconnect()
+        except OSError as e:
+            print("MQTT reconnect failed: " + str(e))
+            self._schedule_reconnect(client)
+
+    def _update_interest(self):
+        for client, sock in self._socks.items():
+            mask = selectors.EVENT_READ
+            if client.want_write():
+                mask |= selectors.EVENT_WRITE
+            if mask != self._masks[client]:
+                self._masks[client] = mask
+                self.selector.modify(sock, mask, client)
+
+    def _run(self):
+        next_misc = time.monotonic() + self.misc_interval
+        while self._running:
+            self._apply_ops()
+            self._update_interest()
+            due, upcoming = self._due_reconnects(time.monotonic())
+            for client in due:
+                threading.Thread(target=self._reconnect, args=(client,),
+                                 daemon=True).start()
+            wake_at = next_misc if upcoming is None else min(next_misc,
+                                                              upcoming)
+            timeout = max(wake_at - time.monotonic(), 0)
+            for key, mask in self.selector.select(timeout):
+                client = key.data
+                if client is None:
+                    try:
+                        while self._wake_r.recv(512):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                try:
+                    if mask & selectors.EVENT_READ:
+                        client.loop_read()
+                    if mask & selectors.EVENT_WRITE:
+                        client.loop_write()
+                except Exception as e:
+                    # paho re-raises errors from handler callbacks; one
+                    # bad handler must not stop the thread every bot
+                    # runs on.
+                    self._drop(client, e)
+            if time.monotonic() >= next_misc:
+                next_misc = time.monotonic() + self.misc_interval
+                self._misc()
+
+    def _misc(self):
+        # Keep-alive pings and QoS retries for every open session, plus
+        # each connection's own housekeeping (RPC reaping, latency pings).
+        for client in list(self._socks):
+            try:
+                client.loop_misc()
+                with self._lock:
+                    bot = self._clients.get(client)
+                if bot is not None:
+                    bot._connection.tick()
+            except Exception as e:
+                self._drop(client, e)
+
+    def _drop(self, client, error):
+        """
+        Stop servicing a client whose loop call raised and send it
+        through the usual reconnect path; `reconnect()` closes the old
+        socket.
+        """
+        with self._lock:
+            bot = self._clients.get(client)
+        name = bot.username if bot is not None else "unknown bot"
+        print("MQTT loop failed for " + name + ": " + repr(error))
+        sock = self._socks.pop(client, None)
+        self._masks.pop(client, None)
+        if sock is not None:
+            try:
+                self.selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+        if bot is not None:
+            bot._connection.connected.clear()
+        self._schedule_reconnect(client)
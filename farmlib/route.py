@@ -0,0 +1,102 @@
+import numpy as np
+
+# Farmduino defaults, used when the device has not reported mcu_params
+DEFAULT_MAX_SPEED = {"x": 800, "y": 800, "z": 1000}   # steps/s
+DEFAULT_STEPS_PER_MM = {"x": 5, "y": 5, "z": 25}
+
+
+def axis_speeds(mcu_params=None):
+    """
+    Top speed of each axis in mm/s, from the firmware's
+    movement_max_spd_<axis> (steps/s) and movement_step_per_mm_<axis>.
+    """
+    params = mcu_params or {}
+    speeds = {}
+    for axis in "xyz":
+        steps = (params.get("movement_max_spd_" + axis)
+                 or DEFAULT_MAX_SPEED[axis])
+        per_mm = (params.get("movement_step_per_mm_" + axis)
+                  or DEFAULT_STEPS_PER_MM[axis])
+        speeds[axis] = float(steps) / float(per_mm)
+    return speeds
+
+
+def travel_matrix(points, speeds):
+    """
+    Seconds to travel between every pair of (x, y) points. The axes
+    move at the same time, so a move takes as long as its slowest axis:
+    max(|dx| / vx, |dy| / vy).
+    """
+    xy = np.asarray(points, dtype=float)[:, :2]
+    dx = np.abs(xy[:, None, 0] - xy[None, :, 0]) / speeds["x"]
+    dy = np.abs(xy[:, None, 1] - xy[None, :, 1]) / speeds["y"]
+    return np.maximum(dx, dy)
+
+
+def path_cost(order, matrix):
+    order = np.asarray(order)
+    return float(matrix[order[:-1], order[1:]].sum())
+
+
+def nearest_neighbour(matrix, start=0):
+    """Greedy open path from `start`: always go to the closest unvisited point."""
+    count = len(matrix)
+    visited = np.zeros(count, dtype=bool)
+    order = [start]
+    visited[start] = True
+    current = start
+    for _ in range(count - 1):
+        costs = np.where(visited, np.inf, matrix[current])
+        current = int(np.argmin(costs))
+        visited[current] = True
+        order.append(current)
+    return np.array(order)
+
+
+def two_opt(order, matrix, max_passes=50):
+    """
+    Improve an open path by reversing segments while that shortens it.
+    The first point (the start position) stays in place. For each i,
+    every candidate j is scored at once with NumPy, and the best
+    improving reversal is applied.
+    """
+    order = np.array(order)
+    count = len(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, count - 1):
+            a, b = order[i - 1], order[i]
+            js = np.arange(i + 1, count)
+            c = order[js]
+            delta = matrix[a, c] - matrix[a, b]
+            # Reversing up to the last point leaves no edge after it.
+            inner = js < count - 1
+            d = order[js[inner] + 1]
+            delta[inner] += matrix[b, d] - matrix[c[inner], d]
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                j = js[best]
+                order[i:j + 1] = order[i:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def plan_route(points, start=(0, 0, 0), mcu_params=None):
+    """
+    Order `points` ([(x, y, ...), ...]) for the fastest trip from
+    `start`, using nearest neighbour followed by 2-opt on the per-axis
+    travel time matrix. Returns (order, seconds, input_order_seconds):
+    `order` indexes into `points` and the times cover XY travel only.
+    """
+    if not points:
+        return [], 0.0, 0.0
+    speeds = axis_speeds(mcu_params)
+    nodes = [tuple(start)[:2]] + [tuple(p)[:2] for p in points]
+    matrix = travel_matrix(nodes, speeds)
+    order = two_opt(nearest_neighbour(matrix, 0), matrix)
+    given = np.arange(len(nodes))
+    return ([int(i) - 1 for i in order[1:]],
+            path_cost(order, matrix),
+            path_cost(given, matrix))
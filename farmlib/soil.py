@@ -0,0 +1,113 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+SOIL_SENSOR_PIN = 59  # Analog pin of the FarmBot soil sensor
+SENSOR_MAX = 1023.0   # 10-bit ADC
+
+# Dry (brown) -> wet (blue) color ramp for the PNG overlay
+COLOR_STOPS = np.array([
+    [0.00, 140, 90, 40],
+    [0.35, 210, 180, 90],
+    [0.65, 90, 170, 120],
+    [1.00, 30, 90, 200],
+])
+
+
+def moisture_percent(raw):
+    return round(float(raw) / SENSOR_MAX * 100, 2)
+
+
+def grid_points(x_min, x_max, y_min, y_max, step):
+    """
+    Survey points every `step` mm over a rectangle, row by row. The
+    route planner reorders them, so the order here does not matter.
+    """
+    xs = np.arange(x_min, x_max + step / 2.0, step)
+    ys = np.arange(y_min, y_max + step / 2.0, step)
+    return [(float(x), float(y)) for y in ys for x in xs]
+
+
+def idw(sample_xy, values, grid_x, grid_y, power=2.0, chunk=4096):
+    """
+    Inverse distance weighted interpolation of `values` measured at
+    `sample_xy` onto every (grid_x, grid_y) pair. Cells are processed
+    `chunk` at a time so the cell x sample distance matrix stays small;
+    a cell that falls on a sample takes its value exactly.
+    """
+    sample_xy = np.asarray(sample_xy, dtype=float)
+    values = np.asarray(values, dtype=float)
+    cells = np.column_stack([np.ravel(grid_x), np.ravel(grid_y)])
+    out = np.empty(len(cells))
+    for start in range(0, len(cells), chunk):
+        block = cells[start:start + chunk]
+        d2 = ((block[:, None, :] - sample_xy[None, :, :]) ** 2).sum(axis=2)
+        exact = d2 < 1e-12
+        with np.errstate(divide='ignore'):
+            weights = np.where(exact, 0.0, d2 ** (-power / 2.0))
+        result = weights @ values / weights.sum(axis=1)
+        hit = exact.any(axis=1)
+        result[hit] = values[exact[hit].argmax(axis=1)]
+        out[start:start + chunk] = result
+    return out.reshape(np.shape(grid_x))
+
+
+def moisture_raster(readings, bounds=None, cell=20.0, power=2.0):
+    """
+    Moisture map (percent) from survey readings [{"x", "y", "moisture"}].
+    `bounds` is (x_min, x_max, y_min, y_max) and defaults to the readings'
+    extent. Returns {"x0", "y0", "cell", "width", "height", "min", "max",
+    "values"} where values[row][col] is the cell centred at
+    (x0 + col * cell, y0 + row * cell).
+    """
+    xy = np.array([(r['x'], r['y']) for r in readings], dtype=float)
+    values = np.array([r['moisture'] for r in readings], dtype=float)
+    if bounds is None:
+        bounds = (xy[:, 0].min(), xy[:, 0].max(), xy[:, 1].min(), xy[:, 1].max())
+    x_min, x_max, y_min, y_max = (float(b) for b in bounds)
+    xs = np.arange(x_min, x_max + cell / 2.0, cell)
+    ys = np.arange(y_min, y_max + cell / 2.0, cell)
+    grid_x, grid_y = np.meshgrid(xs, ys)
+    raster = idw(xy, values, grid_x, grid_y, power)
+    return {
+        'x0': x_min,
+        'y0': y_min,
+        'cell': float(cell),
+        'width': len(xs),
+        'height': len(ys),
+        'min': round(float(values.min()), 2),
+        'max': round(float(values.max()), 2),
+        'values': np.round(raster, 2).tolist(),
+    }
+
+
+def colorize(values, low=0.0, high=100.0, alpha=170):
+    """RGBA bytes (height x width x 4) for a 2D array of percentages"""
+    values = np.asarray(values, dtype=float)
+    span = (high - low) or 1.0
+    t = np.clip((values - low) / span, 0.0, 1.0)
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(t, COLOR_STOPS[:, 0], COLOR_STOPS[:, channel + 1])
+    rgba[..., 3] = alpha
+    return rgba
+
+
+def encode_png(rgba):
+    """Encode a (height, width, 4) uint8 array as PNG"""
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def raster_png(raster, scale=1):
+    """
+    PNG of a moisture_raster() result: one pixel per cell (or
+    `scale` x `scale` pixels), row 0 at the top, i.e. y grows downwards
+    as on the web map.
+    """
+    values = np.asarray(raster['values'], dtype=float)
+    if scale > 1:
+        values = values.repeat(scale, axis=0).repeat(scale, axis=1)
+    return encode_png(colorize(values))
@@ -0,0 +1,113 @@
+import threading
+
+_MISSING = object()
+
+
+def diff_state(old, new, prefix="", changes=None):
+    """
+    Compare two state trees and return a dict of dotted leaf paths
+    (e.g. `location_data.position.x`, `pins.59.value`) to their new
+    value. Removed keys map to None. Lists are compared as leaves.
+    """
+    if changes is None:
+        changes = {}
+    if old is new:
+        return changes
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            path = prefix + str(key)
+            before = old.get(key, _MISSING)
+            if before is _MISSING:
+                _added(value, path, changes)
+            elif before is not value:
+                diff_state(before, value, path + ".", changes)
+        for key in old.keys() - new.keys():
+            _added(old[key], prefix + str(key), changes, removed=True)
+    elif old != new:
+        changes[prefix[:-1] if prefix.endswith(".") else prefix] = new
+    return changes
+
+
+def _added(value, path, changes, removed=False):
+    if isinstance(value, dict) and value:
+        for key, child in value.items():
+            _added(child, path + "." + str(key), changes, removed)
+    else:
+        changes[path] = None if removed else value
+
+
+class StateTree():
+    """
+    Holds the last status tree published by the device and reports
+    which paths changed on every update. Listeners subscribe to a path
+    prefix and are only called when something at or below it changed:
+
+        tree.subscribe("location_data.position", on_move)
+        tree.subscribe("pins.59", on_soil_reading)
+
+    Callbacks receive a dict of changed leaf paths (under the
+    subscribed prefix) to their new values, and run on the thread that
+    called `update()` (the MQTT thread) so they should be quick.
+    """
+
+    def __init__(self, state=None):
+        self.state = state if state is not None else {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def update(self, new_state):
+        """
+        Replace the stored tree, notify interested subscribers and
+        return the dict of changed paths (empty when nothing changed).
+        """
+        changes = diff_state(self.state, new_state)
+        self.state = new_state
+        if changes:
+            self._notify(changes)
+        return changes
+
+    def get(self, path, default=None):
+        """
+        Look up a dotted path in the current tree.
+        """
+        node = self.state
+        for key in path.split("."):
+            if not isinstance(node, dict) or key not in node:
+                return default
+            node = node[key]
+        return node
+
+    def subscribe(self, path, callback):
+        """
+        Call `callback(changes)` whenever something under `path`
+        changes. An empty path matches every change.
+        """
+        with self._lock:
+            self._subscribers.setdefault(path, []).append(callback)
+        return callback
+
+    def unsubscribe(self, path, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(path, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(path, None)
+
+    def _notify(self, changes):
+        with self._lock:
+            if not self._subscribers:
+                return
+            subscribers = {k: list(v) for k, v in self._subscribers.items()}
+        matched = {}
+        for path, value in changes.items():
+            if "" in subscribers:
+                matched.setdefault("", {})[path] = value
+            prefix = ""
+            for key in path.split("."):
+                prefix = prefix + "." + key if prefix else key
+                if prefix in subscribers:
+                    matched.setdefault(prefix, {})[path] = value
+        for prefix, subset in matched.items():
+            for callback in subscribers[prefix]:
+                callback(subset)
@@ -0,0 +1,172 @@
+from array import array
+from bisect import bisect_left
+import math
+import threading
+import time
+
+NAN = float("nan")
+
+# (column prefix, key under location_data)
+LOCATION_GROUPS = (("", "position"),
+                   ("load_", "load"),
+                   ("encoder_", "scaled_encoders"))
+
+# Rollup bucket widths in seconds, finest first
+RESOLUTIONS = (1, 60, 3600)
+
+
+def _number(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return NAN
+
+
+def status_values(state):
+    """
+    Flatten the numeric parts of a status message into
+    {column: value}: x/y/z, load_x.., encoder_x.. and pin_<n>.
+    """
+    location = state.get("location_data") or {}
+    values = {}
+    for prefix, key in LOCATION_GROUPS:
+        axes = location.get(key) or {}
+        for axis in "xyz":
+            values[prefix + axis] = _number(axes.get(axis))
+    for pin, info in (state.get("pins") or {}).items():
+        if isinstance(info, dict):
+            values["pin_" + str(pin)] = _number(info.get("value"))
+    return values
+
+
+class TelemetryRecorder():
+    """
+    Fixed-size columnar ring buffer of status samples. Every column
+    (plus the timestamp column) is a preallocated array('d') of
+    `capacity` doubles, so memory stays at roughly
+    8 * capacity * (columns + 1) bytes however long the bot runs.
+    Missing values are stored as NaN.
+
+    `drain()` hands out the samples recorded since the previous drain
+    (for persisting rollups); `snapshot()` reads the whole window
+    without consuming it.
+    """
+
+    def __init__(self, capacity=3600):
+        self.capacity = capacity
+        self.times = self._column()
+        self.columns = {}
+        for prefix, _ in LOCATION_GROUPS:
+            for axis in "xyz":
+                self.columns[prefix + axis] = self._column()
+        self.written = 0
+        self.drained = 0
+        self.overwritten = 0
+        self._lock = threading.Lock()
+
+    def _column(self):
+        return array("d", [NAN]) * self.capacity
+
+    def record(self, state, now=None):
+        values = status_values(state)
+        with self._lock:
+            index = self.written % self.capacity
+            self.times[index] = now or time.time()
+            for name, column in self.columns.items():
+                column[index] = values.pop(name, NAN)
+            # Pins show up as the device reports them
+            for name, value in values.items():
+                column = self._column()
+                column[index] = value
+                self.columns[name] = column
+            self.written += 1
+            if self.written - self.drained > self.capacity:
+                self.overwritten += self.written - self.drained - self.capacity
+                self.drained = self.written - self.capacity
+
+    def _window(self, start, stop):
+        first = start % self.capacity
+        end = first + (stop - start)
+
+        def take(column):
+            if end <= self.capacity:
+                return column[first:end]
+            return column[first:] + column[:end - self.capacity]
+
+        return take(self.times), {name: take(column)
+                                  for name, column in self.columns.items()}
+
+    def drain(self):
+        """Samples not yet drained, oldest first: (times, {column: array})"""
+        with self._lock:
+            start, stop = self.drained, self.written
+            self.drained = stop
+            return self._window(start, stop)
+
+    def snapshot(self, since=None):
+        """Every buffered sample (optionally only those after `since`)"""
+        with self._lock:
+            stop = self.written
+            start = max(0, stop - self.capacity)
+            times, columns = self._window(start, stop)
+        if since is not None:
+            skip = bisect_left(times, since)
+            times = times[skip:]
+            columns = {name: column[skip:]
+                       for name, column in columns.items()}
+        return times, columns
+
+    def stats(self):
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "buffered": min(self.written, self.capacity),
+                "columns": len(self.columns),
+                "written": self.written,
+                "overwritten": self.overwritten,
+                "bytes": 8 * self.capacity * (len(self.columns) + 1),
+            }
+
+
+def rollup(times, columns, resolution):
+    """
+    Aggregate samples into buckets `resolution` seconds wide:
+    {bucket_start: [samples, {column: [count, sum, min, max]}]}.
+    NaNs are skipped.
+    """
+    buckets = {}
+    for i, t in enumerate(times):
+        start = math.floor(t / resolution) * resolution
+        bucket = buckets.get(start)
+        if bucket is None:
+            bucket = buckets[start] = [0, {}]
+        bucket[0] += 1
+        aggregates = bucket[1]
+        for name, column in columns.items():
+            value = column[i]
+            if value != value:
+                continue
+            agg = aggregates.get(name)
+            if agg is None:
+                aggregates[name] = [1, value, value, value]
+            else:
+                agg[0] += 1
+                agg[1] += value
+                if value < agg[2]:
+                    agg[2] = value
+                if value > agg[3]:
+                    agg[3] = value
+    return buckets
+
+
+def merge_aggregates(into, other):
+    """Fold one {column: [count, sum, min, max]} dict into another"""
+    for name, agg in other.items():
+        current = into.get(name)
+        if current is None:
+            into[name] = list(agg)
+        else:
+            current[0] += agg[0]
+            current[1] += agg[1]
+            current[2] = min(current[2], agg[2])
+            current[3] = max(current[3], agg[3])
+    return into
@@ -1,24 +1,64 @@
-from farmlib.farmbot import Farmbot
+from farmlib.farmbot import Farmbot, TokenCache, TokenRefresher, RpcError
+from farmlib.pool import FarmbotPool
+from farmlib.telemetry import TelemetryRecorder
+from farmlib.route import plan_route, axis_speeds
+from farmlib.soil import SOIL_SENSOR_PIN, moisture_percent
+from farmlib.photostore import photo_store
+from farmlib.httpclient import web_client
 import threading
 import time
-import requests
 import io
 import os
 import re
 import math
+from collections import OrderedDict, deque
+from concurrent.futures import Future
 from dotenv import load_dotenv
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
 load_dotenv()
 
+FARMBOT_SERVER = os.getenv('FARMBOT_SERVER') or "http://144.21.63.33:3000"
+# Override to point at a broker on a non-standard port (e.g. the simulator)
+FARMBOT_MQTT_PORT = int(os.getenv('FARMBOT_MQTT_PORT') or 1883)
+
 # Global variables
 bot = None
 bot_token = None
 api_server = None
+# One network loop thread shared by every device this process drives
+pool = FarmbotPool()
+# Tokens survive restarts here, so startup and reconnects skip the HTTP login
+token_cache = TokenCache(
+    os.getenv('FARMBOT_TOKEN_CACHE')
+    or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.farmbot_token.json')
+)
+token_refresher = None
 connection_event = threading.Event()
 photo_event = threading.Event()
 photo_data = {'url': None}
+# One future per take_photo() call waiting for its "Uploaded image:" log, oldest first
+photo_waiters = deque()
+photo_waiters_lock = threading.Lock()
+# Highest Web App image id seen so far; the fallback lookup only accepts newer ones
+last_image_id = None
+PHOTO_TIMEOUT = 60
+# Last hour (at ~1 status/s) of position/load/encoder/pin samples
+telemetry = TelemetryRecorder(capacity=3600)
+# Callables invoked with every device log (e.g. the persistent log store)
+log_listeners = []
+# Callables invoked with every photo a sequence run stored (see run_sequence)
+photo_listeners = []
+
+# Upper bound (seconds) for a single movement to finish
+MOVE_TIMEOUT = 120
+# Upper bound (seconds) for a batched multi-step routine to be acknowledged
+SEQUENCE_TIMEOUT = 600
+# Outcomes of the most recent compiled sequence runs, by RPC label
+MAX_SEQUENCE_RUNS = 100
+sequence_runs = OrderedDict()
+sequence_runs_lock = threading.Lock()
 
 def get_photo_counter():
     """Получить текущий номер фотографии из файла"""
@@ -42,10 +82,17 @@ class ConnectHandler:
         print("Connected to FarmBot!")
         connection_event.set()
 
+    def on_disconnect(self, bot, rc):
+        # The pool reconnects (with backoff) and on_connect fires again
+        print(f"Disconnected from FarmBot (rc={rc}), reconnecting...")
+        connection_event.clear()
+
     def on_change(self, bot, state):
         print("State updated")
 
     def on_log(self, bot, log):
+        for listener in log_listeners:
+            listener(log)
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
             'logs',
@@ -58,35 +105,15 @@ class ConnectHandler:
             # Проверяем сообщение о загрузке фото
             message = log.get('message', '')
             if 'Uploaded image:' in message:
-                # 1) Пытаемся извлечь полный URL из текста лога
+                # Пытаемся извлечь полный URL из текста лога; без него
+                # take_photo() найдёт снимок через /api/images
                 match = re.search(r"(https?://[^\s]+/rails/active_storage/blobs/redirect/[^\s]+/image_\d+)", message)
-                if match:
-                    photo_data['url'] = match.group(1)
+                url = match.group(1) if match else None
+                if url:
+                    photo_data['url'] = url
                     print(f"Photo URL: {photo_data['url']}")
                     photo_event.set()
-                    return
-
-                # 2) Если в сообщении прямой ссылки нет, запрашиваем последнюю картинку из API
-                try:
-                    if api_server and bot_token:
-                        resp = requests.get(
-                            f"{api_server}/api/images",
-                            headers={"Authorization": f"Bearer {bot_token}"},
-                            timeout=10
-                        )
-                        if resp.status_code == 200:
-                            data = resp.json()
-                            # Берем последний элемент (обычно самое новое изображение)
-                            if isinstance(data, list) and len(data) > 0:
-                                last = data[-1]
-                                url = last.get('attachment_url') or last.get('url')
-                                if url:
-                                    photo_data['url'] = url
-                                    print(f"Photo URL: {photo_data['url']}")
-                                    photo_event.set()
-                                    return
-                except Exception as e:
-                    print(f"Failed to fetch latest image URL from API: {e}")
+                _photo_uploaded(url)
 
     def on_error(self, bot, response):
         print("Error:", response.errors)
@@ -94,31 +121,130 @@ class ConnectHandler:
     def on_response(self, bot, response):
         print("Response:", response.id)
 
+def _photo_uploaded(url):
+    """Hand an upload (URL, or None if the log had none) to the oldest waiting take_photo()"""
+    with photo_waiters_lock:
+        while photo_waiters:
+            waiter = photo_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(url)
+                return
+
+def _expect_photo():
+    """Future resolved with the URL of the next image upload not already claimed"""
+    waiter = Future()
+    with photo_waiters_lock:
+        photo_waiters.append(waiter)
+    return waiter
+
+def _forget_photo(waiter):
+    with photo_waiters_lock:
+        if waiter in photo_waiters:
+            photo_waiters.remove(waiter)
+
+def _fail_photo_on_error(waiter, label):
+    """Fail `waiter` as soon as the device rejects the take_photo RPC `label`"""
+    def rpc_done(rpc):
+        if rpc.exception() is not None and not waiter.done():
+            _forget_photo(waiter)
+            waiter.set_exception(rpc.exception())
+
+    rpc = bot.future(label)
+    if rpc is not None:
+        rpc.add_done_callback(rpc_done)
+
+def _images_since(since_id):
+    """Web App image records newer than `since_id`, oldest first"""
+    resp = web_client.get(
+        f"{api_server}/api/images",
+        headers={"Authorization": f"Bearer {bot_token}"},
+        timeout=10
+    )
+    resp.raise_for_status()
+    images = [i for i in resp.json() if since_id is None or i.get('id', 0) > since_id]
+    return sorted(images, key=lambda i: i.get('id', 0))
+
+def _find_uploaded_image(url, since_id, deadline):
+    """
+    (id, url) of the new image when the upload log did not give both:
+    poll /api/images with backoff for a record newer than `since_id`
+    (matching `url` when known).
+    """
+    delay = 0.5
+    while True:
+        try:
+            for image in _images_since(since_id):
+                image_url = image.get('attachment_url') or image.get('url')
+                if image_url and (url is None or image_url == url):
+                    return image.get('id'), image_url
+        except Exception as e:
+            print(f"Error fetching latest image: {e}")
+        if time.monotonic() + delay > deadline:
+            return None, None
+        time.sleep(delay)
+        delay = min(delay * 2, 4)
+
+def add_log_listener(listener):
+    """Register a callable to receive every log the device publishes"""
+    if listener not in log_listeners:
+        log_listeners.append(listener)
+
+def add_photo_listener(listener):
+    """
+    Register a callable to receive every photo a sequence stored: the
+    take_photo() dict plus 'coordinates' (the planned x, y, z of the step).
+    Called on a background thread.
+    """
+    if listener not in photo_listeners:
+        photo_listeners.append(listener)
+
+def _on_token_refresh(refreshed_bot):
+    global bot_token
+    bot_token = refreshed_bot.password
+    print("FarmBot token refreshed")
+
 def connect_bot():
-    """Connect to FarmBot in a separate thread"""
-    global bot, bot_token, api_server
+    """
+    Connect to FarmBot on the shared network loop. Once logged in the bot
+    stays supervised: dropped connections are retried in the background, so
+    this only reports whether the broker session is currently up.
+    """
+    global bot, bot_token, api_server, token_refresher
     if bot is not None:
-        return True
+        return connection_event.wait(timeout=10)
     connection_event.clear()
     photo_event.clear()
     photo_data['url'] = None
     try:
-        api_server = "http://144.21.63.33:3000"
+        api_server = FARMBOT_SERVER
+        email = os.getenv('FARMBOT_EMAIL')
         bot = Farmbot.login(
-            email=os.getenv('FARMBOT_EMAIL'),
+            email=email,
             password=os.getenv('FARMBOT_PASSWORD'),
-            server=api_server
+            server=api_server,
+            cache=token_cache
         )
         bot_token = bot.password
+        bot.mqtt_port = FARMBOT_MQTT_PORT
+        # Cap unacknowledged RPCs so bursts of jog/sequence commands queue here
+        # (blocking the caller) instead of piling up inside paho
+        bot.set_rpc_window(int(os.getenv('FARMBOT_RPC_WINDOW') or 16))
+        # Measure broker <-> device round trips in the background
+        bot.start_latency_probe(interval=float(os.getenv('FARMBOT_PING_INTERVAL') or 10))
+        bot.record_telemetry(recorder=telemetry)
         handler = ConnectHandler()
         bot.handler = handler
-        connection_thread = threading.Thread(target=lambda: bot.connect(handler))
-        connection_thread.daemon = True
-        connection_thread.start()
+        pool.add(bot, handler)
+        # Refresh the token in the background shortly before it expires
+        if token_refresher is not None:
+            token_refresher.stop()
+        token_refresher = TokenRefresher(
+            bot, api_server, cache=token_cache,
+            key=TokenCache.key(email, api_server),
+            on_refresh=_on_token_refresh
+        ).start()
         if not connection_event.wait(timeout=10):
-            print("Failed to connect to FarmBot")
-            bot = None
-            bot_token = None
+            print("FarmBot not connected yet, still retrying in the background")
             return False
         return True
     except Exception as e:
@@ -127,14 +253,20 @@ def connect_bot():
         bot_token = None
         return False
 
-def move_absolute(x, y, z, speed=100):
-    """Simple move function that can be called from anywhere"""
+def move_absolute(x, y, z, speed=100, wait=False):
+    """
+    Simple move function that can be called from anywhere.
+    With wait=True, returns only once the bot has reached the target
+    (or the device acknowledged the move).
+    """
     if bot is None:
         print("Bot not connected!")
         return False
 
     try:
         print(f"Moving to ({x}, {y}, {z}) at {speed}% speed")
+        if wait:
+            return bot.move_absolute_and_wait(x, y, z, speed, timeout=MOVE_TIMEOUT)
         return bot.move_absolute(x, y, z, speed)
     except Exception as e:
         print(f"Error in move_absolute: {e}")
@@ -255,6 +387,24 @@ def lua_script(lua_string):
         return False
 
 
+def get_rpc_stats():
+    """In-flight window depth and ack latency counters for the bot's RPCs"""
+    if bot is None:
+        print("Bot not connected!")
+        return None
+    return bot.rpc_stats()
+
+def get_latency():
+    """Broker <-> device round-trip percentiles from the ping/pong probe"""
+    if bot is None:
+        print("Bot not connected!")
+        return None
+    return bot.latency()
+
+def get_http_stats():
+    """Per-endpoint latency percentiles and error counts of Web App HTTP calls"""
+    return web_client.stats()
+
 def get_position():
     """Get current bot position"""
     if bot is None:
@@ -383,6 +533,33 @@ def _water_dispense_params(tool_name=None, pin=None):
         params += ")"
     return params
 
+def _queue_watering(x, y, z, current_pos, water_pin=8):
+    """Queue the watering routine's CeleryScript on the active bot.batch()"""
+    safe_z = max(current_pos[2], z, -200)  # Use highest Z of current, target, or -200
+    bot.send_message(f"Starting watering sequence from {current_pos}")
+    bot.send_message(f"Moving to watering position ({x}, {y}, {z})")
+
+    # Move to safe height first to avoid collisions
+    bot.send_message(f"Moving up to safe height {safe_z}")
+    bot.move_absolute(current_pos[0], current_pos[1], safe_z)
+
+    # Move to X,Y position while at safe height
+    bot.send_message(f"Moving to target X,Y position at safe height")
+    bot.move_absolute(x, y, safe_z)
+
+    # Finally move down to target Z
+    bot.send_message(f"Moving down to target height {z}")
+    bot.move_absolute(x, y, z)
+
+    # Start watering
+    bot.send_message("Activating water pump")
+    bot.write_pin(pin_number=water_pin, pin_value=1, pin_mode="digital")
+    bot.wait(5000)  # Water for 5 seconds
+    bot.write_pin(pin_number=water_pin, pin_value=0, pin_mode="digital")
+    bot.send_message("Water pump deactivated")
+
+    bot.send_message("Watering sequence completed successfully")
+
 def water_plant(x=6, y=600, z=-340):
     """
     Move to a position and water using pin control.
@@ -405,33 +582,11 @@ def water_plant(x=6, y=600, z=-340):
             bot.send_message("Could not get current position", "error")
             return False
 
-        bot.send_message(f"Starting watering sequence from {current_pos}")
-        bot.send_message(f"Moving to watering position ({x}, {y}, {z})")
-        
-        # Move to safe height first to avoid collisions
-        safe_z = max(current_pos[2], z, -200)  # Use highest Z of current, target, or -200
-        bot.send_message(f"Moving up to safe height {safe_z}")
-        bot.move_absolute(current_pos[0], current_pos[1], safe_z)
-        time.sleep(2)  # Wait for Z movement
-        
-        # Move to X,Y position while at safe height
-        bot.send_message(f"Moving to target X,Y position at safe height")
-        bot.move_absolute(x, y, safe_z)
-        time.sleep(3)  # Wait for XY movement
-        
-        # Finally move down to target Z
-        bot.send_message(f"Moving down to target height {z}")
-        bot.move_absolute(x, y, z)
-        time.sleep(2)  # Wait for Z movement
-        
-        # Start watering
-        bot.send_message("Activating water pump")
-        bot.write_pin(pin_number=WATER_PIN, pin_value=1, pin_mode="digital")
-        time.sleep(5)  # Water for 5 seconds
-        bot.write_pin(pin_number=WATER_PIN, pin_value=0, pin_mode="digital")
-        bot.send_message("Water pump deactivated")
-        
-        bot.send_message("Watering sequence completed successfully")
+        # Queue the whole routine as one rpc_request; the device runs the
+        # steps back to back and acknowledges once at the end
+        with bot.batch(timeout=SEQUENCE_TIMEOUT) as batch:
+            _queue_watering(x, y, z, current_pos, WATER_PIN)
+        batch.wait_for()
         return True
         
     except Exception as e:
@@ -466,77 +621,105 @@ def dispense(milliliters, tool_name=None, pin=None):
         print(f"Error dispensing: {e}")
         return False
 
+def _photo_baseline():
+    """Id of the newest Web App image seen, for telling the next upload apart"""
+    if last_image_id is not None:
+        return last_image_id
+    # First photo since start: remember where the image list ends
+    images = _images_since(None)
+    return images[-1].get('id', 0) if images else 0
+
+def _store_upload(url, since_id, deadline):
+    """
+    Download the image an upload log announced (`url`, None if the log had
+    none or never came) into the photo store. Returns the take_photo() dict,
+    or None if the image could not be found or fetched.
+    """
+    global last_image_id
+    match = url and re.search(r"image_(\d+)$", url)
+    if match:
+        image_id = int(match.group(1))
+    else:
+        image_id, url = _find_uploaded_image(url, since_id, deadline)
+    if not url:
+        print("Timeout waiting for latest image")
+        return None
+    last_image_id = max(image_id or 0, since_id, last_image_id or 0)
+
+    # Stream the image from its signed URL straight into the store
+    with web_client.get(url, headers={
+        "Cache-Control": "no-cache",
+        "Pragma": "no-cache",
+    }, timeout=30, stream=True) as response:
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code != 200 or not content_type.startswith('image/'):
+            print(f"Failed to download image: {response.status_code}")
+            return None
+        stored = photo_store.save(response.iter_content(chunk_size=1 << 16), content_type)
+    print(f"Image saved to {stored['file']}" + (" (duplicate)" if stored['duplicate'] else ""))
+
+    # Increment persisted counter after successful save
+    increment_photo_counter()
+
+    return {
+        'id': image_id,
+        'path': stored['path'],
+        'content_type': stored['content_type'],
+        'sha256': stored['sha256'],
+        'size': stored['size'],
+        'duplicate': stored['duplicate']
+    }
+
 def take_photo():
-    """Take a photo and get the most recent photo from the FarmBot Web App."""
+    """
+    Take a photo and download it from the FarmBot Web App. Returns as soon
+    as the device logs the upload; /api/images is only polled (for images
+    newer than the last one seen) when that log has no usable URL.
+    """
     if bot is None or not connection_event.is_set():
         if not connect_bot():
             print("Bot not connected!")
             return None
 
     try:
-        # Trigger camera capture
-        bot.take_photo()
-
-        # Give the server time to process the photo
-        time.sleep(10)
-
-        # Get the most recent photo from the API
-        latest_url = None
-        for _ in range(30):  # ~30s timeout
-            try:
-                if api_server and bot_token:
-                    # Get all images and sort by ID to get the most recent one
-                    resp = requests.get(
-                        f"{api_server}/api/images",
-                        headers={"Authorization": f"Bearer {bot_token}"},
-                        timeout=10
-                    )
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        if isinstance(data, list) and len(data) > 0:
-                            # Sort by ID in descending order and get the first one
-                            latest_image = sorted(data, key=lambda x: x.get('id', 0), reverse=True)[0]
-                            image_id = latest_image.get('id')
-                            url = latest_image.get('attachment_url') or latest_image.get('url')
-                            if url:
-                                latest_url = url
-                                break
-            except Exception as e:
-                print(f"Error fetching latest image: {e}")
-            time.sleep(1)
+        since_id = _photo_baseline()
 
-        if not latest_url:
-            print("Timeout waiting for latest image")
-            return None
+        # Trigger camera capture
+        deadline = time.monotonic() + PHOTO_TIMEOUT
+        upload = _expect_photo()
+        try:
+            _fail_photo_on_error(upload, bot.take_photo())
+            url = upload.result(timeout=PHOTO_TIMEOUT)
+        except TimeoutError:
+            url = None
+        finally:
+            _forget_photo(upload)
 
-        # Download the image from its signed URL
-        response = requests.get(latest_url, headers={
-            "Cache-Control": "no-cache",
-            "Pragma": "no-cache",
-        })
-        if response.status_code == 200 and response.headers.get('Content-Type', '').startswith('image/'):
-            os.makedirs('farm_images', exist_ok=True)
-            image_path = os.path.join('farm_images', f'image_{image_id}.jpg')
-            with open(image_path, 'wb') as f:
-                f.write(response.content)
-            print(f"Image saved to {image_path}")
-
-            # Increment persisted counter after successful save
-            increment_photo_counter()
-
-            return {
-                'image': response.content,
-                'content_type': 'image/jpeg',
-                'id': image_id
-            }
-        else:
-            print(f"Failed to download image: {response.status_code}")
-            return None
+        return _store_upload(url, since_id, deadline)
 
     except Exception as e:
         print(f"Error taking photo: {e}")
         return None
 
+def _read_analog_pin(pin, timeout=10, settle=0.5):
+    """
+    Read an analog pin and return the value the device reports for it.
+    read_pin only acknowledges the request; the value arrives in a status
+    publish, so wait for pins.<pin> to change (up to `settle` seconds after
+    the ack, since an unchanged value never shows up as a change).
+    """
+    changed = threading.Event()
+    path = f"pins.{pin}"
+    callback = lambda _changes: changed.set()
+    bot.subscribe(path, callback)
+    try:
+        label = bot.read_pin(pin_number=pin, pin_mode="analog")
+        bot.wait_for(label, timeout)
+        changed.wait(settle)
+    finally:
+        bot.unsubscribe(path, callback)
+    return (bot.state_tree.get(path) or {}).get("value", 0)
+
 def read_soil_sensor():
     """
     Read the soil sensor data (moisture, temperature, etc.).
@@ -548,26 +731,70 @@ def read_soil_sensor():
         return None
     
     try:
-        # Use pin 59 for soil sensor readings (standard pin for soil sensor)
-        SOIL_SENSOR_PIN = 59
-        
-        # Read analog value from soil sensor
-        bot.read_pin(pin_number=SOIL_SENSOR_PIN, pin_mode="analog")
-        
         # Get the moisture value from pin reading (0-1023 range)
-        moisture_raw = bot.state["pins"].get(str(SOIL_SENSOR_PIN), {}).get("value", 0)
+        moisture_raw = _read_analog_pin(SOIL_SENSOR_PIN)
         
         # Convert to percentage (0-100%)
-        moisture_percent = (moisture_raw / 1023) * 100
-        
         return {
-            "moisture": round(moisture_percent, 2),
+            "moisture": moisture_percent(moisture_raw),
             "raw_value": moisture_raw
         }
     except Exception as e:
         print(f"Error reading soil sensor: {e}")
         return None
 
+def survey_soil(points, z=None, optimize=True, on_reading=None, should_stop=None):
+    """
+    Visit each (x, y) point and read the soil sensor there.
+    Args:
+        points (list): (x, y) survey points
+        z (float): Sensor depth; None reads at the current height without
+            lifting between points
+        optimize (bool): Visit the points in the fastest order (see water_plants)
+        on_reading (callable): Called with each reading dict as it comes in
+        should_stop (callable): Checked before each point; True ends the survey early
+    Returns:
+        list: {"x", "y", "z", "raw_value", "moisture"} per point read (a
+        point the bot could not reach gets an "error" instead), or None if
+        not connected
+    """
+    if bot is None:
+        print("Bot not connected!")
+        return None
+
+    current_pos = get_position() or (0, 0, 0)
+    order = list(range(len(points)))
+    if optimize:
+        order, _, _ = plan_route(points, current_pos, bot.state.get('mcu_params'))
+
+    readings = []
+    last_z = current_pos[2]
+    for index in order:
+        if should_stop is not None and should_stop():
+            break
+        x, y = points[index][0], points[index][1]
+        reading = {"x": x, "y": y, "z": last_z if z is None else z}
+        try:
+            if z is None:
+                bot.move_absolute_and_wait(x, y, last_z, timeout=MOVE_TIMEOUT)
+            else:
+                # Lift to a safe height between points, as water_plants does
+                safe_z = max(last_z, z, -200)
+                position = get_position() or current_pos
+                if position[2] < safe_z:
+                    bot.move_absolute_and_wait(position[0], position[1], safe_z, timeout=MOVE_TIMEOUT)
+                bot.move_absolute_and_wait(x, y, safe_z, timeout=MOVE_TIMEOUT)
+                bot.move_absolute_and_wait(x, y, z, timeout=MOVE_TIMEOUT)
+                last_z = z
+            raw = _read_analog_pin(SOIL_SENSOR_PIN)
+            reading.update(raw_value=raw, moisture=moisture_percent(raw))
+        except (RpcError, TimeoutError) as e:
+            reading["error"] = str(e)
+        readings.append(reading)
+        if on_reading is not None:
+            on_reading(reading)
+    return readings
+
 def use_seed_injector(seeds_count=1, dispense_time=1.0):
     """
     Use the seed injector to plant a specific number of seeds.
@@ -655,6 +882,70 @@ def use_rotary_tool(speed=100, duration=5.0):
             pass
         return False
 
+def water_plants(plants, z=-340, water_ms=5000, optimize=True, wait=False):
+    """
+    Water many plants in one on-device run.
+    Args:
+        plants (list): (x, y) or (x, y, z) points; a missing z uses `z`
+        z (int): Default watering height
+        water_ms (int): Pump time per plant in milliseconds
+        optimize (bool): Visit the plants in the fastest order (nearest
+            neighbour + 2-opt over per-axis travel times from mcu_params)
+        wait (bool): Block until the device has finished
+    Returns:
+        dict: RPC label, visiting order and time estimates, or None if not connected
+    """
+    if bot is None:
+        print("Bot not connected!")
+        return None
+
+    WATER_PIN = 8  # Water pin number
+    current_pos = get_position() or (0, 0, 0)
+    targets = [
+        (p[0], p[1], p[2] if len(p) > 2 and p[2] is not None else z)
+        for p in plants
+    ]
+    mcu_params = bot.state.get('mcu_params')
+    order, travel, unordered = plan_route(targets, current_pos, mcu_params)
+    if not optimize:
+        order, travel = list(range(len(targets))), unordered
+
+    # Lift to safe height, travel, drop, water - same pattern as water_plant
+    z_speed = axis_speeds(mcu_params)['z']
+    lift_seconds = 0.0
+    with bot.batch() as batch:
+        bot.send_message(f"Watering {len(targets)} plants")
+        last_x, last_y, last_z = current_pos
+        for index in order:
+            x, y, plant_z = targets[index]
+            safe_z = max(last_z, plant_z, -200)
+            bot.move_absolute(last_x, last_y, safe_z)
+            bot.move_absolute(x, y, safe_z)
+            bot.move_absolute(x, y, plant_z)
+            bot.write_pin(pin_number=WATER_PIN, pin_value=1, pin_mode="digital")
+            bot.wait(water_ms)
+            bot.write_pin(pin_number=WATER_PIN, pin_value=0, pin_mode="digital")
+            lift_seconds += (abs(safe_z - last_z) + abs(safe_z - plant_z)) / z_speed
+            last_x, last_y, last_z = x, y, plant_z
+        bot.send_message("Watering completed")
+        estimated = travel + lift_seconds + len(order) * water_ms / 1000.0
+        batch.timeout = SEQUENCE_TIMEOUT + 2 * estimated
+    _track_sequence_run(batch.label, len(order))
+    if wait:
+        try:
+            batch.wait_for()
+        except (RpcError, TimeoutError):
+            pass  # Recorded in sequence_runs
+    return {
+        'label': batch.label,
+        'order': order,
+        'plants': len(order),
+        'estimated_seconds': round(estimated, 1),
+        'travel_seconds': round(travel, 1),
+        'unoptimized_travel_seconds': round(unordered, 1),
+        'run': get_sequence_run(batch.label),
+    }
+
 def use_weeder(x, y, z, working_depth=-20, speed=100):
     """
     Use the weeder tool to remove weeds at a specific location.
@@ -683,54 +974,53 @@ def use_weeder(x, y, z, working_depth=-20, speed=100):
             bot.send_message("Could not get current position", "error")
             return False
 
-        bot.send_message(f"Starting weeding sequence at ({x}, {y})")
-        
-        # Move to safe height first
         safe_z = max(current_pos[2], z, -100)  # Use highest Z of current, target, or -100
-        bot.send_message(f"Moving to safe height {safe_z}")
-        bot.move_absolute(current_pos[0], current_pos[1], safe_z)
-        time.sleep(2)  # Wait for Z movement
-        
-        # Move to target X,Y at safe height
-        bot.send_message(f"Moving to target position at safe height")
-        bot.move_absolute(x, y, safe_z)
-        time.sleep(3)  # Wait for XY movement
-        
-        # Start rotary tool before inserting
-        bot.send_message("Activating weeder tool")
+        final_z = z + working_depth
         WEEDER_PIN = 11  # Weeder uses the same pin as rotary tool
         pin_value = int((speed / 100) * 255)
-        bot.write_pin(pin_number=WEEDER_PIN, pin_value=pin_value, pin_mode="analog")
-        time.sleep(1)  # Let tool spin up
-        
-        # Move down to working depth
-        bot.send_message(f"Lowering tool to working depth {working_depth}")
-        final_z = z + working_depth
-        bot.move_absolute(x, y, final_z)
-        time.sleep(3)  # Allow time for weeding action
-        
-        # Small circular movement to ensure weed removal
-        radius = 5  # 5mm radius
-        bot.send_message("Performing weeding pattern")
-        for angle in [0, 90, 180, 270]:  # 4-point circle
-            rad = math.radians(angle)
-            dx = radius * math.cos(rad)
-            dy = radius * math.sin(rad)
-            bot.move_absolute(x + dx, y + dy, final_z)
-            time.sleep(1)
-        
-        # Return to center
-        bot.move_absolute(x, y, final_z)
-        time.sleep(1)
-        
-        # Move back up to safe height
-        bot.send_message("Moving back to safe height")
-        bot.move_absolute(x, y, safe_z)
-        time.sleep(2)
-        
-        # Turn off tool
-        bot.write_pin(pin_number=WEEDER_PIN, pin_value=0, pin_mode="analog")
-        bot.send_message("Weeding sequence completed")
+
+        # Queue the whole routine as one rpc_request (see water_plant)
+        with bot.batch(timeout=SEQUENCE_TIMEOUT) as batch:
+            bot.send_message(f"Starting weeding sequence at ({x}, {y})")
+
+            # Move to safe height first
+            bot.send_message(f"Moving to safe height {safe_z}")
+            bot.move_absolute(current_pos[0], current_pos[1], safe_z)
+
+            # Move to target X,Y at safe height
+            bot.send_message(f"Moving to target position at safe height")
+            bot.move_absolute(x, y, safe_z)
+
+            # Start rotary tool before inserting
+            bot.send_message("Activating weeder tool")
+            bot.write_pin(pin_number=WEEDER_PIN, pin_value=pin_value, pin_mode="analog")
+            bot.wait(1000)  # Let tool spin up
+
+            # Move down to working depth
+            bot.send_message(f"Lowering tool to working depth {working_depth}")
+            bot.move_absolute(x, y, final_z)
+            bot.wait(1000)  # Allow time for weeding action
+
+            # Small circular movement to ensure weed removal
+            radius = 5  # 5mm radius
+            bot.send_message("Performing weeding pattern")
+            for angle in [0, 90, 180, 270]:  # 4-point circle
+                rad = math.radians(angle)
+                dx = radius * math.cos(rad)
+                dy = radius * math.sin(rad)
+                bot.move_absolute(x + dx, y + dy, final_z)
+
+            # Return to center
+            bot.move_absolute(x, y, final_z)
+
+            # Move back up to safe height
+            bot.send_message("Moving back to safe height")
+            bot.move_absolute(x, y, safe_z)
+
+            # Turn off tool
+            bot.write_pin(pin_number=WEEDER_PIN, pin_value=0, pin_mode="analog")
+            bot.send_message("Weeding sequence completed")
+        batch.wait_for()
         
         return True
         
@@ -743,6 +1033,214 @@ def use_weeder(x, y, z, working_depth=-20, speed=100):
             pass
         return False
 
+class SequenceCompiler:
+    """
+    Turns sequence steps (a command name plus the keyword arguments of the
+    matching wrapper function, as stored in Step rows) into CeleryScript
+    queued on the active bot.batch(). The device runs the nodes back to
+    back, so a step's optional "wait" (seconds) becomes a `wait` node and no
+    other pauses are needed. The planned position is tracked from step to
+    step so watering plans its safe-height moves from the right place.
+    """
+
+    def __init__(self, start_position):
+        self.position = list(start_position)
+        # Seconds the device will spend in explicit waits
+        self.wait_seconds = 0.0
+        # (upload future, planned position) per take_photo step, in order
+        self.photos = []
+        self.photo_baseline = None
+
+    def add(self, command, parameters):
+        params = dict(parameters or {})
+        wait = params.pop('wait', None)
+        step = getattr(self, 'step_' + command, None)
+        if step is None:
+            raise ValueError(f"Unknown command: {command}")
+        try:
+            step(**params)
+        except TypeError as e:
+            raise ValueError(f"Bad parameters for {command}: {e}")
+        if wait:
+            bot.wait(int(float(wait) * 1000))
+            self.wait_seconds += float(wait)
+
+    def step_move_absolute(self, x, y, z, speed=100):
+        bot.move_absolute(x, y, z, speed)
+        self.position = [x, y, z]
+
+    def step_move_relative(self, x, y, z, speed=100):
+        bot.move_relative(x, y, z, speed)
+        self.position = [a + b for a, b in zip(self.position, (x, y, z))]
+
+    def step_find_home(self):
+        bot.find_home()
+        self.position = [0, 0, 0]
+
+    def step_go_to_home(self):
+        bot.go_to_home()
+        self.position = [0, 0, 0]
+
+    def step_water_plant(self, x=6, y=600, z=-340):
+        _queue_watering(x, y, z, self.position)
+        self.position = [x, y, z]
+
+    def step_dispense(self, milliliters, tool_name=None, pin=None):
+        bot.lua(f"dispense({milliliters}{_water_dispense_params(tool_name, pin)})")
+
+    def step_mount_tool(self, tool_name):
+        bot.lua(f"mount_tool(\"{tool_name}\")")
+
+    def step_dismount_tool(self):
+        bot.lua("dismount_tool()")
+
+    def step_take_photo(self):
+        # Claim the upload log now: the device takes the photos in step
+        # order, so they resolve these futures in the same order
+        if self.photo_baseline is None:
+            self.photo_baseline = _photo_baseline()
+        self.photos.append((_expect_photo(), list(self.position)))
+        bot.take_photo()
+
+    def step_servo_angle(self, pin, angle):
+        bot.set_servo_angle(pin, angle)
+
+    def step_lua_script(self, lua_string):
+        bot.lua(lua_string)
+
+    def step_send_message(self, message):
+        bot.send_message(message)
+
+    def step_emergency_lock(self):
+        # In order with the other steps, not sent ahead of the batch
+        bot.emergency_lock(now=False)
+
+    def step_emergency_unlock(self):
+        bot.emergency_unlock(now=False)
+
+    def step_power_off(self):
+        bot.power_off()
+
+    def step_reboot(self):
+        bot.reboot()
+
+def run_sequence(steps, wait=False):
+    """
+    Compile (command, parameters) steps into one CeleryScript body and send
+    it as a single rpc_request. Returns the RPC label; completion is reported
+    through get_sequence_run(label). With wait=True, blocks until the device
+    has run every step. Raises ValueError for unknown commands or bad
+    parameters (nothing is sent then).
+    """
+    if bot is None:
+        print("Bot not connected!")
+        return None
+
+    compiler = SequenceCompiler(get_position() or (0, 0, 0))
+    try:
+        with bot.batch() as batch:
+            for command, parameters in steps:
+                compiler.add(command, parameters)
+            # Every move is bounded by the routine timeout; waits add to it
+            batch.timeout = SEQUENCE_TIMEOUT + compiler.wait_seconds
+    finally:
+        if batch.label is None:
+            for upload, _position in compiler.photos:
+                _forget_photo(upload)
+    if batch.label is None:
+        return None
+    _track_sequence_run(batch.label, len(steps))
+    if compiler.photos:
+        for upload, _position in compiler.photos:
+            _fail_photo_on_error(upload, batch.label)
+        threading.Thread(
+            target=_collect_sequence_photos,
+            args=(batch.label, compiler.photos, compiler.photo_baseline,
+                  time.monotonic() + batch.timeout),
+            name='sequence-photos', daemon=True
+        ).start()
+    if wait:
+        try:
+            batch.wait_for()
+        except (RpcError, TimeoutError):
+            pass  # Recorded in sequence_runs
+    return batch.label
+
+def _track_sequence_run(label, step_count):
+    run = {
+        'label': label,
+        'status': 'running',
+        'steps': step_count,
+        'photos': [],
+        'errors': [],
+        'started_at': time.time(),
+        'finished_at': None,
+    }
+    with sequence_runs_lock:
+        sequence_runs[label] = run
+        while len(sequence_runs) > MAX_SEQUENCE_RUNS:
+            sequence_runs.popitem(last=False)
+
+    def finished(future):
+        error = None if future.cancelled() else future.exception()
+        with sequence_runs_lock:
+            if isinstance(error, RpcError):
+                run['status'] = 'error'
+                run['errors'] = error.response.errors
+            elif error is not None:
+                run['status'] = 'timeout'
+            else:
+                run['status'] = 'ok'
+            run['finished_at'] = time.time()
+
+    future = bot.future(label)
+    if future is not None:
+        future.add_done_callback(finished)
+
+def _collect_sequence_photos(label, photos, since_id, deadline):
+    """
+    Download the photos of a sequence run as the device uploads them and
+    hand each to the photo listeners. Their Web App ids are added to the
+    run's 'photos' (which may still grow after the run is 'ok').
+    """
+    for index, (upload, position) in enumerate(photos):
+        try:
+            url = upload.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            url = None
+        except Exception:
+            # The sequence failed before this photo was taken
+            for later, _position in photos[index:]:
+                _forget_photo(later)
+            return
+        finally:
+            _forget_photo(upload)
+        try:
+            result = _store_upload(url, since_id, min(deadline, time.monotonic() + PHOTO_TIMEOUT))
+        except Exception as e:
+            print(f"Error storing sequence photo: {e}")
+            result = None
+        if result is None:
+            continue
+        since_id = max(since_id, result['id'] or 0)
+        result['coordinates'] = dict(zip('xyz', position))
+        for listener in photo_listeners:
+            try:
+                listener(result)
+            except Exception as e:
+                print(f"Photo listener failed: {e}")
+        with sequence_runs_lock:
+            run = sequence_runs.get(label)
+            if run is not None:
+                run['photos'].append(result['id'])
+
+def get_sequence_run(label):
+    """Status of a sequence started with run_sequence(): running, ok, error or timeout"""
+    with sequence_runs_lock:
+        run = sequence_runs.get(label)
+        return dict(run) if run is not None else None
+
+
 def main():
     # Start connection in background thread
     connection_thread = threading.Thread(target=connect_bot)
@@ -1,6 +1,6 @@
 import React from 'react';
 import { CANVAS_WIDTH, CANVAS_HEIGHT } from '../utils/constants';
-import { PhotoOverlay, FarmBotOverlay } from './MapOverlays';
+import { PhotoOverlay, FarmBotOverlay, MoistureOverlay, MosaicLayer } from './MapOverlays';
 
 const FarmBotMap = ({ position, photoData, botVisible }) => {
   return (
@@ -14,6 +14,12 @@ const FarmBotMap = ({ position, photoData, botVisible }) => {
           <line key={i} x1={0} y1={i * (CANVAS_HEIGHT / 12)} x2={CANVAS_WIDTH} y2={i * (CANVAS_HEIGHT / 12)} stroke="#eee" />
         ))}
       </svg>
+
+      {/* Garden mosaic stitched from every positioned photo */}
+      <MosaicLayer />
+
+      {/* Interpolated soil moisture from the latest survey */}
+      <MoistureOverlay />
       
       {/* FarmBot overlay */}
       <FarmBotOverlay position={position} visible={botVisible} />
@@ -1,4 +1,5 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
+import axios, { API_BASE } from '../utils/axiosConfig';
 import botImage from '../assets/images/bot.png';
 import { SCALE_X, SCALE_Y, IMAGE_WIDTH_PX, IMAGE_HEIGHT_PX } from '../utils/constants';
 
@@ -88,4 +89,77 @@ const FarmBotOverlay = ({ position, visible }) => {
   );
 };
 
-export { PhotoOverlay, FarmBotOverlay };
+const MoistureOverlay = ({ visible = true }) => {
+  const [soilMap, setSoilMap] = useState(null);
+
+  useEffect(() => {
+    // Latest soil survey map; 404 until a survey has readings
+    axios.get(`${API_BASE}/soil-map/`)
+      .then((response) => setSoilMap(response.data))
+      .catch(() => setSoilMap(null));
+  }, []);
+
+  if (!visible || !soilMap) return null;
+
+  // Raster cells are centred on x0 + col * cell, y0 + row * cell
+  return (
+    <img
+      src={soilMap.png}
+      alt={`Soil moisture ${soilMap.min}-${soilMap.max}%`}
+      style={{
+        position: 'absolute',
+        left: (soilMap.x0 - soilMap.cell / 2) * SCALE_X,
+        top: (soilMap.y0 - soilMap.cell / 2) * SCALE_Y,
+        width: soilMap.width * soilMap.cell * SCALE_X,
+        height: soilMap.height * soilMap.cell * SCALE_Y,
+        zIndex: 5,
+        pointerEvents: 'none'
+      }}
+    />
+  );
+};
+
+const MosaicLayer = ({ visible = true }) => {
+  const [mosaic, setMosaic] = useState(null);
+
+  useEffect(() => {
+    axios.get(`${API_BASE}/mosaic/`)
+      .then((response) => setMosaic(response.data))
+      .catch(() => setMosaic(null));
+  }, []);
+
+  if (!visible || !mosaic || !mosaic.updated_at) return null;
+
+  // Coarsest zoom that still has at least one tile pixel per screen pixel
+  let zoom = mosaic.max_zoom;
+  while (zoom > mosaic.min_zoom && 2 ** (zoom - 1 - mosaic.max_zoom) >= SCALE_X) {
+    zoom -= 1;
+  }
+  const mmPerTile = mosaic.tile_size * 2 ** (mosaic.max_zoom - zoom);
+  const [columns, rows] = mosaic.grid[zoom];
+  const tiles = [];
+  for (let y = 0; y < rows; y += 1) {
+    for (let x = 0; x < columns; x += 1) {
+      const url = mosaic.tiles.replace('{z}', zoom).replace('{x}', x).replace('{y}', y);
+      tiles.push(
+        <img
+          key={`${zoom}/${x}/${y}`}
+          src={`${url}?v=${mosaic.version}`}
+          alt=""
+          loading="lazy"
+          style={{
+            position: 'absolute',
+            left: x * mmPerTile * SCALE_X,
+            top: y * mmPerTile * SCALE_Y,
+            width: mmPerTile * SCALE_X,
+            height: mmPerTile * SCALE_Y,
+            pointerEvents: 'none'
+          }}
+        />
+      );
+    }
+  }
+  return <div style={{ position: 'absolute', left: 0, top: 0, zIndex: 2 }}>{tiles}</div>;
+};
+
+export { PhotoOverlay, FarmBotOverlay, MoistureOverlay, MosaicLayer };
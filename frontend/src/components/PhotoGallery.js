@@ -74,7 +74,7 @@ function PhotoGallery({ photos, open, onClose }) {
         </div>
         {selected ? (
           <div style={{ textAlign: 'center' }}>
-            <img src={selected.url} alt="enlarged" style={enlargedStyle} />
+            <img src={selected.url} srcSet={selected.srcset} sizes="80vw" alt="enlarged" style={enlargedStyle} />
             <div style={{ marginBottom: 8 }}>
               <strong>Filename:</strong> {selected.filename || selected.url.split('/').pop()}
             </div>
@@ -88,7 +88,10 @@ function PhotoGallery({ photos, open, onClose }) {
             {photos && photos.length > 0 ? photos.map((photo, idx) => (
               <img
                 key={photo.url || idx}
-                src={photo.url}
+                src={photo.thumbnail_url || photo.url}
+                srcSet={photo.srcset}
+                sizes="160px"
+                loading="lazy"
                 alt={`photo-${idx}`}
                 style={thumbStyle}
                 onClick={() => setSelected(photo)}
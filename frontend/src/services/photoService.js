@@ -15,6 +15,8 @@ export const takePhoto = async (position, photoData, setPhotoData, savePhotos, s
     const newPhoto = {
       id: photoResponse.id || Date.now(),
       url: photoResponse.url,
+      thumbnail_url: photoResponse.thumbnail_url,
+      srcset: photoResponse.srcset,
       farmbot_id: photoResponse.farmbot_id,
       position: photoResponse.coordinates || { ...position },
       timestamp: photoResponse.created_at || new Date().toISOString()
@@ -0,0 +1,102 @@
+"""
+A local stand-in for a FarmBot and its cloud services, for tests and
+benchmarks that must not touch a real bot or my.farm.bot:
+
+    with Simulation(time_scale=10).start() as sim:
+        os.environ.update(sim.env())
+        ...  # farmlib / the Django API now talk to the simulator
+
+or from a shell: `python -m simulator --help`.
+"""
+import asyncio
+import threading
+
+from simulator.broker import MqttBroker
+from simulator.device import VirtualDevice, DeviceError
+from simulator.webapp import FakeWebApp
+
+__all__ = ["Simulation", "MqttBroker", "VirtualDevice", "DeviceError",
+           "FakeWebApp"]
+
+
+class Simulation():
+    """
+    Broker, virtual device and fake web app wired together. The broker
+    and the device share one event loop on a background thread; the
+    web app runs its own HTTP server thread. Ports default to 0, i.e.
+    any free port; the real ones are known after `start()`.
+    """
+
+    def __init__(self, host="127.0.0.1", mqtt_port=0, http_port=0,
+                 device_id="device_15", email="sim@example.com",
+                 password="simulator", **device_options):
+        self.host = host
+        self.email = email
+        self.password = password
+        self.device_id = device_id
+        self.webapp = FakeWebApp(host, http_port, mqtt_host=host,
+                                 device_id=device_id, email=email,
+                                 password=password)
+        self.broker = MqttBroker(host, mqtt_port,
+                                 authenticate=self._authenticate)
+        self.device = None
+        self.device_options = device_options
+        self.loop = None
+        self._thread = None
+
+    def _authenticate(self, username, password):
+        return (username == self.device_id and
+                self.webapp.token_valid(password))
+
+    def start(self, timeout=10):
+        self.webapp.start()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        name="simulator", daemon=True)
+        self._thread.start()
+        self.call(self._start_async(), timeout)
+        return self
+
+    async def _start_async(self):
+        await self.broker.start()
+        self.device = VirtualDevice(self.broker, self.device_id,
+                                    webapp=self.webapp,
+                                    **self.device_options)
+        await self.device.start()
+
+    async def _stop_async(self):
+        if self.device is not None:
+            await self.device.close()
+        await self.broker.close()
+
+    def call(self, coro, timeout=10):
+        """Run a coroutine on the simulator's loop and return its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        if self.loop is not None:
+            self.call(self._stop_async())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(5)
+            self.loop.close()
+            self.loop = None
+        self.webapp.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def server_url(self):
+        return self.webapp.url
+
+    def env(self):
+        """Environment for farmlib.wrapper / the Django API to use the simulator."""
+        return {
+            "FARMBOT_SERVER": self.server_url,
+            "FARMBOT_MQTT_PORT": str(self.broker.port),
+            "FARMBOT_EMAIL": self.email,
+            "FARMBOT_PASSWORD": self.password,
+        }
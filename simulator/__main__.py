@@ -0,0 +1,46 @@
+"""
+Run the simulator until interrupted:
+
+    python -m simulator [--mqtt-port 1883] [--http-port 3100] [--time-scale 1]
+
+then start the API against it with the printed environment, e.g.
+    FARMBOT_SERVER=http://127.0.0.1:3100 FARMBOT_MQTT_PORT=1883 python run.py
+"""
+import argparse
+import time
+
+from simulator import Simulation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated FarmBot, MQTT broker and web app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--mqtt-port", type=int, default=1883)
+    parser.add_argument("--http-port", type=int, default=3100)
+    parser.add_argument("--device-id", default="device_15")
+    parser.add_argument("--email", default="sim@example.com")
+    parser.add_argument("--password", default="simulator")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="speed up (>1) or slow down movements and waits")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="fraction of commands answered with rpc_error")
+    args = parser.parse_args()
+
+    sim = Simulation(args.host, args.mqtt_port, args.http_port,
+                     device_id=args.device_id, email=args.email,
+                     password=args.password, time_scale=args.time_scale,
+                     failure_rate=args.failure_rate).start()
+    print("Simulator running. Environment for the API:")
+    for key, value in sim.env().items():
+        print(f"  {key}={value}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import asyncio
+import struct
+
+CONNECT = 1
+PUBLISH = 3
+PUBACK = 4
+PUBREL = 6
+SUBSCRIBE = 8
+UNSUBSCRIBE = 10
+PINGREQ = 12
+DISCONNECT = 14
+
+# CONNACK return codes
+ACCEPTED = 0
+BAD_CREDENTIALS = 4
+
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT wildcard match: `+` is one level, a trailing `#` the rest."""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def publish_packet(topic, payload):
+    topic = topic.encode()
+    body = struct.pack("!H", len(topic)) + topic + payload
+    return b"\x30" + encode_length(len(body)) + body
+
+
+def _string(data, offset):
+    size = struct.unpack_from("!H", data, offset)[0]
+    start = offset + 2
+    return data[start:start + size], start + size
+
+
+class Session():
+    def __init__(self, writer):
+        self.writer = writer
+        self.username = None
+        self.subscriptions = set()
+
+    def send(self, packet):
+        if not self.writer.is_closing():
+            self.writer.write(packet)
+
+
+class MqttBroker():
+    """
+    Just enough of an MQTT 3.1.1 broker to stand in for FarmBot's:
+    CONNECT, SUBSCRIBE/UNSUBSCRIBE with `+`/`#` wildcards, PUBLISH at
+    QoS 0-2 (always delivered at QoS 0), PINGREQ and DISCONNECT. There
+    are no retained messages, wills or persistent sessions.
+
+    `authenticate(username, password)`, if given, decides whether a
+    CONNECT is accepted. In-process code (the virtual device) takes
+    part through `listen()` and `publish()`, which must be called on
+    the broker's event loop.
+    """
+
+    def __init__(self, host="127.0.0.1", port=1883, authenticate=None):
+        self.host = host
+        self.port = port
+        self.authenticate = authenticate
+        self.sessions = []
+        self.listeners = []
+        self.received = 0
+        self.delivered = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        # Port 0 picks a free port; report the real one.
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for session in list(self.sessions):
+                session.writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def listen(self, topic_filter, callback):
+        """Call `callback(topic, payload)` for every matching publish."""
+        self.listeners.append((topic_filter, callback))
+
+    def publish(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.received += 1
+        packet = None
+        for session in self.sessions:
+            if any(topic_matches(f, topic) for f in session.subscriptions):
+                packet = packet or publish_packet(topic, payload)
+                session.send(packet)
+                self.delivered += 1
+        for topic_filter, callback in self.listeners:
+            if topic_matches(topic_filter, topic):
+                callback(topic, payload)
+
+    async def _read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        multiplier, length = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        body = await reader.readexactly(length) if length else b""
+        return header, body
+
+    async def _handle(self, reader, writer):
+        session = Session(writer)
+        try:
+            header, body = await self._read_packet(reader)
+            if header >> 4 != CONNECT or not self._connect(session, body):
+                return
+            self.sessions.append(session)
+            while True:
+                header, body = await self._read_packet(reader)
+                kind = header >> 4
+                if kind == PUBLISH:
+                    self._on_publish(session, header, body)
+                elif kind == PUBREL:
+                    session.send(b"\x70\x02" + body[:2])
+                elif kind == SUBSCRIBE:
+                    self._on_subscribe(session, body)
+                elif kind == UNSUBSCRIBE:
+                    self._on_unsubscribe(session, body)
+                elif kind == PINGREQ:
+                    session.send(b"\xd0\x00")
+                elif kind == DISCONNECT:
+                    return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            writer.close()
+
+    def _connect(self, session, body):
+        _, offset = _string(body, 0)  # protocol name
+        flags = body[offset + 1]
+        offset += 4  # level, flags, keep alive
+        _, offset = _string(body, offset)  # client id
+        if flags & 0x04:  # will topic + message
+            _, offset = _string(body, offset)
+            _, offset = _string(body, offset)
+        username = password = None
+        if flags & 0x80:
+            username, offset = _string(body, offset)
+            username = username.decode()
+        if flags & 0x40:
+            password, offset = _string(body, offset)
+            password = password.decode()
+        if self.authenticate and not self.authenticate(username, password):
+            session.send(b"\x20\x02\x00" + bytes([BAD_CREDENTIALS]))
+            return False
+        session.username = username
+        session.send(b"\x20\x02\x00" + bytes([ACCEPTED]))
+        return True
+
+    def _on_publish(self, session, header, body):
+        qos = (header >> 1) & 3
+        topic, offset = _string(body, 0)
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            # PUBACK for QoS 1, PUBREC for QoS 2
+            session.send((b"\x40\x02" if qos == 1 else b"\x50\x02") +
+                         packet_id)
+        self.publish(topic.decode(), body[offset:])
+
+    def _on_subscribe(self, session, body):
+        packet_id, offset = body[:2], 2
+        granted = bytearray()
+        while offset < len(body):
+            topic_filter, offset = _string(body, offset)
+            offset += 1  # requested QoS
+            session.subscriptions.add(topic_filter.decode())
+            granted.append(0)
+        session.send(b"\x90" + encode_length(2 + len(granted)) + packet_id +
+                     bytes(granted))
+
+    def _on_unsubscribe(self, session, body):
+        packet_id, offset = body[:2], 2
+        while offset < len(body):
+            topic_filter, offset = _string(body, offset)
+            session.subscriptions.discard(topic_filter.decode())
+        session.send(b"\xb0\x02" + packet_id)
@@ -0,0 +1,411 @@
+import asyncio
+import copy
+import json
+import math
+import random
+import time
+
+# FarmBot Genesis firmware defaults: speeds in steps/s, lengths in steps.
+DEFAULT_MCU_PARAMS = {
+    "movement_max_spd_x": 800, "movement_max_spd_y": 800,
+    "movement_max_spd_z": 1000,
+    "movement_min_spd_x": 50, "movement_min_spd_y": 50,
+    "movement_min_spd_z": 50,
+    "movement_steps_acc_dec_x": 300, "movement_steps_acc_dec_y": 300,
+    "movement_steps_acc_dec_z": 300,
+    "movement_step_per_mm_x": 5, "movement_step_per_mm_y": 5,
+    "movement_step_per_mm_z": 25,
+    "movement_axis_nr_steps_x": 14500, "movement_axis_nr_steps_y": 7000,
+    "movement_axis_nr_steps_z": 10000,
+}
+
+# Commands the simulator accepts without modelling them
+NO_OPS = ("sync", "check_updates", "calibrate", "flash_firmware",
+          "power_off", "reboot", "factory_reset", "set_servo_angle",
+          "install_farmware", "update_farmware", "remove_farmware",
+          "set_user_env", "change_ownership", "dump_info")
+
+TICK = 0.05
+
+
+class DeviceError(Exception):
+    pass
+
+
+class Axis():
+    """
+    One gantry axis with a trapezoidal speed profile: the speed ramps
+    between the firmware's min and max over `acc_dec` steps at both
+    ends of a move, as the Farmduino firmware does.
+    """
+
+    def __init__(self, name, params):
+        per_mm = params["movement_step_per_mm_" + name]
+        self.name = name
+        self.max_speed = params["movement_max_spd_" + name] / per_mm
+        self.min_speed = params["movement_min_spd_" + name] / per_mm
+        self.ramp = params["movement_steps_acc_dec_" + name] / per_mm
+        self.length = params["movement_axis_nr_steps_" + name] / per_mm
+        self.per_mm = per_mm
+        self.position = 0.0
+        self.start = 0.0
+        self.target = 0.0
+        self.speed_pct = 100.0
+        self.state = "idle"
+
+    @property
+    def bounds(self):
+        # Z counts down from the top of its travel.
+        if self.name == "z":
+            return (-self.length, 0.0)
+        return (0.0, self.length)
+
+    def move_to(self, target, speed_pct):
+        self.start = self.position
+        self.target = target
+        self.speed_pct = max(1.0, min(100.0, speed_pct))
+
+    def stop(self):
+        self.target = self.position
+        self.state = "stop"
+
+    @property
+    def moving(self):
+        return abs(self.target - self.position) > 1e-6
+
+    def step(self, dt):
+        remaining = self.target - self.position
+        if abs(remaining) <= 1e-6:
+            self.position = self.target
+            self.state = "idle"
+            return
+        travelled = abs(self.position - self.start)
+        top = max(self.min_speed, self.max_speed * self.speed_pct / 100.0)
+        edge = min(travelled, abs(remaining))
+        if edge < self.ramp:
+            speed = self.min_speed + (top - self.min_speed) * edge / self.ramp
+            self.state = ("accelerate" if travelled < abs(remaining)
+                          else "decelerate")
+        else:
+            speed = top
+            self.state = "cruise"
+        delta = min(abs(remaining), max(speed, self.min_speed) * dt)
+        self.position += math.copysign(delta, remaining)
+
+
+class VirtualDevice():
+    """
+    A FarmBot OS stand-in living on a `MqttBroker`'s event loop.
+
+    Requests on `bot/<id>/from_clients` run one at a time, node by node,
+    and are answered on `from_device` with `rpc_ok` once every node has
+    finished, or `rpc_error` with an explanation (out of bounds moves,
+    anything but `emergency_unlock` while locked, unknown kinds, and
+    `failure_rate` random faults). Emergency lock/unlock skip the queue.
+
+    Moves follow the firmware's speed and ramp parameters in
+    `mcu_params`, scaled by `time_scale` (2.0 = twice as fast as a real
+    bot). Status goes out on `bot/<id>/status` every `status_interval`
+    seconds (and every `moving_status_interval` while moving), pings are
+    answered on `pong/`, and `take_photo` stores a picture in the
+    `FakeWebApp` and logs "Uploaded image: <url>" like the real device.
+    """
+
+    def __init__(self, broker, device_id="device_15", webapp=None,
+                 time_scale=1.0, status_interval=1.0,
+                 moving_status_interval=0.25, failure_rate=0.0,
+                 mcu_params=None):
+        self.broker = broker
+        self.device_id = device_id
+        self.webapp = webapp
+        self.time_scale = time_scale
+        self.status_interval = status_interval
+        self.moving_status_interval = moving_status_interval
+        self.failure_rate = failure_rate
+        self.mcu_params = dict(DEFAULT_MCU_PARAMS, **(mcu_params or {}))
+        self.axes = [Axis(name, self.mcu_params) for name in "xyz"]
+        self.pins = {}
+        self.locked = False
+        self.busy = False
+        self.rpcs = 0
+        self.errors = 0
+        self._queue = asyncio.Queue()
+        self._moved = None
+        self._tasks = []
+        prefix = "bot/" + device_id + "/"
+        self.from_clients = prefix + "from_clients"
+        self.from_device = prefix + "from_device"
+        self.status_chan = prefix + "status"
+        self.logs_chan = prefix + "logs"
+        self.ping_prefix = prefix + "ping/"
+        self.pong_prefix = prefix + "pong/"
+
+    async def start(self):
+        self._moved = asyncio.Event()
+        self.broker.listen(self.from_clients, self._on_request)
+        self.broker.listen(self.ping_prefix + "#", self._on_ping)
+        self._tasks = [asyncio.ensure_future(self._worker()),
+                       asyncio.ensure_future(self._motion()),
+                       asyncio.ensure_future(self._status_loop())]
+        self.log("FarmBot is up and running!", "success")
+        return self
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @property
+    def position(self):
+        return {axis.name: round(axis.position, 2) for axis in self.axes}
+
+    def moisture(self, x, y):
+        """A smooth, repeatable soil moisture field (0-1023) over the bed."""
+        wave = math.sin(x / 350.0) * math.cos(y / 220.0)
+        return int(max(0, min(1023, 520 + 260 * wave +
+                              random.uniform(-15, 15))))
+
+    # MQTT plumbing
+
+    def _publish(self, topic, message):
+        self.broker.publish(topic, json.dumps(message))
+
+    def _on_ping(self, topic, payload):
+        self.broker.publish(self.pong_prefix + topic[len(self.ping_prefix):],
+                            payload)
+
+    def _on_request(self, topic, payload):
+        try:
+            rpc = json.loads(payload)
+            label = rpc["args"]["label"]
+        except (ValueError, KeyError, TypeError):
+            return
+        body = rpc.get("body") or []
+        self.rpcs += 1
+        # E-stop and unlock are handled immediately, like FarmBot OS.
+        kinds = {node.get("kind") for node in body}
+        if kinds & {"emergency_lock", "emergency_unlock"}:
+            if "emergency_lock" in kinds:
+                self.emergency_lock()
+            else:
+                self.emergency_unlock()
+            self._reply(label)
+            return
+        self._queue.put_nowait((label, body))
+
+    def _reply(self, label, error=None):
+        if error is None:
+            self._publish(self.from_device,
+                          {"kind": "rpc_ok", "args": {"label": label}})
+            return
+        self.errors += 1
+        self._publish(self.from_device, {
+            "kind": "rpc_error",
+            "args": {"label": label},
+            "body": [{"kind": "explanation", "args": {"message": error}}],
+        })
+
+    def log(self, message, type="info", verbosity=1, channels=()):
+        position = self.position
+        self._publish(self.logs_chan, {
+            "message": message,
+            "type": type,
+            "verbosity": verbosity,
+            "channels": list(channels),
+            "created_at": int(time.time()),
+            "x": position["x"], "y": position["y"], "z": position["z"],
+            "meta": {},
+            "major_version": 15,
+            "minor_version": 4,
+            "patch_version": 0,
+        })
+
+    def status(self):
+        position = self.position
+        encoders = {axis.name: round(axis.position +
+                                     random.uniform(-0.05, 0.05), 2)
+                    for axis in self.axes}
+        moving = any(axis.moving for axis in self.axes)
+        load = {axis.name: (random.randint(20, 60) if axis.moving
+                            else random.randint(0, 5))
+                for axis in self.axes}
+        return {
+            "configuration": {"firmware_hardware": "farmduino_k16"},
+            "informational_settings": {
+                "busy": self.busy or moving,
+                "locked": self.locked,
+                "sync_status": "synced",
+                "controller_version": "15.4.0",
+                "firmware_version": "6.6.0.G",
+                "uptime": int(time.monotonic()),
+            },
+            "jobs": {},
+            "location_data": {
+                "axis_states": {axis.name: axis.state for axis in self.axes},
+                "load": load,
+                "position": position,
+                "raw_encoders": {axis.name: int(encoders[axis.name] *
+                                                axis.per_mm)
+                                 for axis in self.axes},
+                "scaled_encoders": encoders,
+            },
+            "mcu_params": self.mcu_params,
+            "pins": copy.deepcopy(self.pins),
+            "user_env": {},
+        }
+
+    def publish_status(self):
+        self._publish(self.status_chan, self.status())
+
+    # Background tasks
+
+    async def _status_loop(self):
+        while True:
+            moving = any(axis.moving for axis in self.axes)
+            self.publish_status()
+            await asyncio.sleep(self.moving_status_interval if moving
+                                else self.status_interval)
+
+    async def _motion(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(TICK)
+            now = time.monotonic()
+            dt = (now - last) * self.time_scale
+            last = now
+            if not any(axis.moving for axis in self.axes):
+                continue
+            for axis in self.axes:
+                axis.step(dt)
+            if not any(axis.moving for axis in self.axes):
+                self._moved.set()
+
+    async def _worker(self):
+        while True:
+            label, body = await self._queue.get()
+            self.busy = True
+            try:
+                for node in body:
+                    await self.execute(node)
+            except DeviceError as e:
+                self._reply(label, str(e))
+            except Exception as e:
+                self._reply(label, "Simulator failure: " + repr(e))
+            else:
+                self._reply(label)
+            finally:
+                self.busy = False
+
+    # Commands
+
+    def emergency_lock(self):
+        self.locked = True
+        for axis in self.axes:
+            axis.stop()
+        self._moved.set()
+        self.log("Emergency locked", "error")
+        self.publish_status()
+
+    def emergency_unlock(self):
+        self.locked = False
+        self.log("Bot is now unlocked", "success")
+        self.publish_status()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds / self.time_scale)
+
+    async def move(self, target, speed):
+        if self.locked:
+            raise DeviceError("Bot is locked")
+        for axis, goal in zip(self.axes, target):
+            low, high = axis.bounds
+            if goal is not None and not low - 0.5 <= goal <= high + 0.5:
+                raise DeviceError("Movement out of bounds: " + axis.name +
+                                  " = " + str(goal))
+        for axis, goal in zip(self.axes, target):
+            if goal is not None:
+                axis.move_to(float(goal), float(speed or 100))
+        self._moved.clear()
+        self.publish_status()
+        if any(axis.moving for axis in self.axes):
+            await self._moved.wait()
+        if self.locked:
+            raise DeviceError("Movement aborted: emergency lock")
+        self.publish_status()
+
+    async def execute(self, node):
+        kind = node.get("kind")
+        args = node.get("args") or {}
+        if self.locked and kind not in ("read_status", "send_message"):
+            raise DeviceError("Bot is locked")
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise DeviceError("Simulated failure during " + str(kind))
+
+        if kind == "move_absolute":
+            location = args.get("location") or {}
+            if location.get("kind") != "coordinate":
+                raise DeviceError("Unsupported location: " +
+                                  str(location.get("kind")))
+            offset = (args.get("offset") or {}).get("args") or {}
+            goal = location["args"]
+            await self.move([goal[a] + (offset.get(a) or 0) for a in "xyz"],
+                            args.get("speed"))
+        elif kind == "move_relative":
+            await self.move([axis.position + (args.get(axis.name) or 0)
+                             for axis in self.axes], args.get("speed"))
+        elif kind in ("find_home", "home"):
+            axis = args.get("axis", "all")
+            await self.move([0 if axis in ("all", a) else None
+                             for a in "xyz"], args.get("speed"))
+        elif kind == "wait":
+            await self.sleep((args.get("milliseconds") or 0) / 1000.0)
+        elif kind == "read_status":
+            self.publish_status()
+        elif kind == "send_message":
+            channels = [child["args"].get("channel_name")
+                        for child in node.get("body") or []]
+            self.log(args.get("message", ""),
+                     args.get("message_type", "info"), channels=channels)
+        elif kind == "read_pin":
+            self.read_pin(int(args["pin_number"]), args.get("pin_mode", 0))
+        elif kind == "write_pin":
+            self.pins[str(args["pin_number"])] = {
+                "mode": args.get("pin_mode", 0), "value": args["pin_value"]}
+            self.publish_status()
+        elif kind == "toggle_pin":
+            pin = self.pins.setdefault(str(args["pin_number"]),
+                                       {"mode": 0, "value": 0})
+            pin["value"] = 0 if pin["value"] else 1
+            self.publish_status()
+        elif kind == "take_photo":
+            await self.take_photo()
+        elif kind == "lua":
+            await self.sleep(0.1)
+            self.log("Lua: " + str(args.get("lua", ""))[:80], "debug", 3)
+        elif kind in NO_OPS:
+            await self.sleep(0.05)
+        else:
+            raise DeviceError("Unknown command: " + str(kind))
+
+    def read_pin(self, number, mode):
+        if mode == 1:
+            position = self.position
+            value = self.moisture(position["x"], position["y"])
+        else:
+            value = self.pins.get(str(number), {}).get("value", 0)
+        self.pins[str(number)] = {"mode": mode, "value": value}
+        self.log("Pin " + str(number) + " value is " + str(value),
+                 "debug", 2)
+        self.publish_status()
+
+    async def take_photo(self):
+        if self.webapp is None:
+            raise DeviceError("No camera available")
+        self.log("Taking photo", "busy")
+        await self.sleep(1.5)
+        position = self.position
+        loop = asyncio.get_running_loop()
+        record = await loop.run_in_executor(None, self.webapp.add_image,
+                                            position["x"], position["y"],
+                                            position["z"])
+        self.log("Uploaded image: " + record["attachment_url"], "success")
@@ -0,0 +1,237 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timezone
+import base64
+import json
+import re
+import secrets
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+IMAGE_PATH = re.compile(r"^/rails/active_storage/blobs/redirect/(\w+)/image_(\d+)$")
+IMAGE_RECORD_PATH = re.compile(r"^/api/images/(\d+)$")
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+def render_png(width, height, seed, x=0, y=0):
+    """
+    A small soil-and-plants picture, different for every seed and
+    position, encoded as PNG with nothing but zlib.
+    """
+    rng = (seed * 2654435761 + int(x) * 40503 + int(y)) & 0xFFFFFFFF
+    plants = []
+    for _ in range(6):
+        rng = (rng * 1103515245 + 12345) & 0x7FFFFFFF
+        cx, cy = rng % width, (rng >> 8) % height
+        plants.append((cx, cy, 8 + (rng >> 16) % (height // 6)))
+    rows = []
+    for row in range(height):
+        shade = 60 + (row * 40 // height)
+        soil = bytes((shade + 40, shade + 10, shade - 30))
+        line = bytearray(soil * width)
+        for cx, cy, r in plants:
+            dy = row - cy
+            if abs(dy) < r:
+                half = int((r * r - dy * dy) ** 0.5)
+                start, stop = max(0, cx - half), min(width, cx + half)
+                line[start * 3:stop * 3] = b"\x30\xa0\x30" * (stop - start)
+        rows.append(b"\x00" + bytes(line))
+
+    def chunk(kind, data):
+        return (struct.pack("!I", len(data)) + kind + data +
+                struct.pack("!I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    header = struct.pack("!IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) +
+            chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) +
+            chunk(b"IEND", b""))
+
+
+class FakeWebApp():
+    """
+    Stand-in for the FarmBot Web App endpoints this project uses:
+
+        POST /api/tokens    log in ({"user": {"email", "password"}})
+        GET  /api/tokens    refresh (Bearer token)
+        GET  /api/images    image records, oldest first (Bearer token)
+        GET  /api/images/N  one record
+        GET  /rails/active_storage/blobs/redirect/<key>/image_N
+                            the picture itself (PNG)
+
+    Tokens look like the real ones (JWT shaped, unsigned) and point the
+    client at `mqtt_host`. When `email`/`password` are None any login
+    is accepted. The virtual device adds pictures with `add_image()`.
+    """
+
+    def __init__(self, host="127.0.0.1", port=3000, mqtt_host="127.0.0.1",
+                 device_id="device_15", email=None, password=None,
+                 token_ttl=30 * 24 * 3600, image_size=(320, 240)):
+        self.host = host
+        self.port = port
+        self.mqtt_host = mqtt_host
+        self.device_id = device_id
+        self.email = email
+        self.password = password
+        self.token_ttl = token_ttl
+        self.image_size = image_size
+        self.tokens = set()
+        self.images = []
+        self.blobs = {}
+        self.requests = 0
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://" + self.host + ":" + str(self.port)
+
+    def start(self):
+        webapp = self
+
+        class Handler(WebAppHandler):
+            app = webapp
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="fake-webapp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def issue_token(self):
+        now = int(time.time())
+        unencoded = {
+            "aud": "unknown",
+            "sub": 15,
+            "iat": now,
+            "jti": str(uuid.uuid4()),
+            "iss": "//" + self.host + ":" + str(self.port),
+            "exp": now + self.token_ttl,
+            "mqtt": self.mqtt_host,
+            "bot": self.device_id,
+            "vhost": "/",
+            "mqtt_ws": "ws://" + self.mqtt_host + ":3002/ws/mqtt",
+        }
+        encoded = ".".join([
+            _b64(json.dumps({"typ": "JWT", "alg": "RS256"}).encode()),
+            _b64(json.dumps(unencoded).encode()),
+            _b64(secrets.token_bytes(32)),
+        ])
+        with self._lock:
+            self.tokens.add(encoded)
+        return {"token": {"unencoded": unencoded, "encoded": encoded},
+                "user": {"id": 1, "email": self.email or "sim@example.com"}}
+
+    def token_valid(self, jwt):
+        with self._lock:
+            return jwt in self.tokens
+
+    def check_login(self, email, password):
+        if self.email is None and self.password is None:
+            return True
+        return email == self.email and password == self.password
+
+    def add_image(self, x=None, y=None, z=None):
+        """Store a new picture taken at (x, y, z); returns its record."""
+        with self._lock:
+            self._last_id += 1
+            image_id = self._last_id
+        key = secrets.token_hex(16)
+        width, height = self.image_size
+        blob = render_png(width, height, image_id, x or 0, y or 0)
+        now = time.time()
+        record = {
+            "id": image_id,
+            "device_id": 15,
+            "attachment_processed_at": _iso(now),
+            "updated_at": _iso(now),
+            "created_at": _iso(now),
+            "attachment_url": (self.url + "/rails/active_storage/blobs/"
+                               "redirect/" + key + "/image_" + str(image_id)),
+            "meta": {"x": x, "y": y, "z": z,
+                     "name": "image_" + str(image_id)},
+        }
+        with self._lock:
+            self.blobs[image_id] = (key, blob)
+            self.images.append(record)
+            self.images.sort(key=lambda image: image["id"])
+        return record
+
+
+class WebAppHandler(BaseHTTPRequestHandler):
+    app = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        auth = self.headers.get("Authorization", "")
+        return (auth.startswith("Bearer ") and
+                self.app.token_valid(auth[len("Bearer "):]))
+
+    def do_POST(self):
+        self.app.requests += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        if self.path != "/api/tokens":
+            return self._send(404, {"error": "not found"})
+        try:
+            user = json.loads(self.rfile.read(length) or b"{}")["user"]
+        except (ValueError, KeyError, TypeError):
+            return self._send(422, {"auth": "Bad email or password."})
+        if not self.app.check_login(user.get("email"), user.get("password")):
+            return self._send(422, {"auth": "Bad email or password."})
+        self._send(200, self.app.issue_token())
+
+    def do_GET(self):
+        self.app.requests += 1
+        path = self.path.split("?", 1)[0]
+        match = IMAGE_PATH.match(path)
+        if match:
+            # Signed storage URLs need no Authorization header.
+            key, blob = self.app.blobs.get(int(match.group(2)), (None, None))
+            if key != match.group(1):
+                return self._send(404, {"error": "not found"})
+            return self._send(200, blob, "image/png")
+        if not self._authorized():
+            return self._send(401, {"error": "Unauthorized"})
+        if path == "/api/tokens":
+            return self._send(200, self.app.issue_token())
+        if path == "/api/images":
+            with self.app._lock:
+                images = list(self.app.images)
+            return self._send(200, images)
+        match = IMAGE_RECORD_PATH.match(path)
+        if match:
+            image_id = int(match.group(1))
+            for image in self.app.images:
+                if image["id"] == image_id:
+                    return self._send(200, image)
+        self._send(404, {"error": "not found"})